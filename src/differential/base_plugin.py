@@ -2,9 +2,11 @@ import re
 import json
 import argparse
 import sys
+import threading
 from pathlib import Path
 from typing import Optional
 from itertools import chain
+from concurrent.futures import Future, ThreadPoolExecutor
 from urllib.parse import quote
 from abc import ABC, abstractmethod
 
@@ -14,7 +16,8 @@ from differential.plugin_register import PluginRegister
 from differential.torrent import TorrnetBase
 from differential.constants import ImageHosting
 from differential.utils.browser import open_link
-from differential.utils.torrent import make_torrent
+from differential.utils.torrent import TORRENT_VERSIONS, make_torrent
+from differential.utils.io_mode import IO_MODES, set_io_mode
 from differential.utils.parse import parse_encoder_log
 from differential.utils.uploader import EasyUpload, AutoFeed
 from differential.utils.mediainfo_handler import MediaInfoHandler
@@ -30,6 +33,53 @@ from differential.utils.ptgen.imdb import IMDBData
 from differential.utils.ptgen.douban import DoubanData
 
 
+class TorrentJob:
+    """A `make_torrent` run on a background thread, which can be stopped between two hashing tasks."""
+
+    def __init__(self, executor: ThreadPoolExecutor, future: Future, stop: threading.Event):
+        self.executor = executor
+        self.future = future
+        self.stop = stop
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+    def cancel(self) -> None:
+        """Ask the job to stop and return right away; the thread ends after the task it is hashing."""
+        self.stop.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def start_make_torrent(plugin) -> TorrentJob:
+    """Run `make_torrent` for `plugin` on a background thread; the pieces are hashed in worker processes."""
+    targets = None
+    if getattr(plugin, "torrent_targets", None):
+        targets = [(plugin.__class__.__name__, plugin.announce_url)] + [
+            target for target in plugin.torrent_targets if target[0] != plugin.__class__.__name__
+        ]
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="make_torrent")
+    stop = threading.Event()
+    future = executor.submit(
+        make_torrent,
+        plugin.folder,
+        plugin.announce_url,
+        plugin.__class__.__name__,
+        plugin.reuse_torrent,
+        plugin.from_torrent,
+        workers=getattr(plugin, "torrent_workers", None),
+        targets=targets,
+        verify=getattr(plugin, "verify_torrent", False),
+        verify_sample=plugin.verify_sample / 100 if getattr(plugin, "verify_sample", None) else None,
+        torrent_version=getattr(plugin, "torrent_version", "v1"),
+        stop=stop,
+    )
+    executor.shutdown(wait=False)
+    return TorrentJob(executor, future, stop)
+
+
 class Base(ABC, TorrnetBase, metaclass=PluginRegister):
     @classmethod
     @abstractmethod
@@ -132,12 +182,68 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
             help="如果为原盘，跳过扫描BDInfo",
             default=argparse.SUPPRESS,
         )
+        parser.add_argument(
+            "--native-bdinfo",
+            action="store_true",
+            dest="native_bdinfo",
+            help="使用QUICK SUMMARY时直接解析原盘播放列表生成，不调用BDInfo扫描（不含声道布局和各轨码率）",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--bdinfo-cache-size",
+            type=int,
+            help="BDInfo报告缓存的大小上限，单位MB，默认为32",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--bdinfo-workers",
+            type=int,
+            help="多碟原盘同时扫描BDInfo的碟数，默认为2",
+            default=argparse.SUPPRESS,
+        )
         parser.add_argument(
             "--optimize-screenshot",
             action="store_true",
             help="是否压缩截图（无损），默认压缩",
             default=argparse.SUPPRESS,
         )
+        parser.add_argument(
+            "--screenshot-workers",
+            type=int,
+            help="同时运行的ffmpeg截图进程数，默认为2",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--screenshot-timeout",
+            type=int,
+            help="每张截图的ffmpeg超时时间，单位秒，默认为300",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--screenshot-single-pass",
+            action="store_true",
+            help="所有截图只运行一个ffmpeg，适合原盘m2ts和网络挂载等打开文件开销大的情况",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--no-screenshot-keyframes",
+            action="store_false",
+            dest="screenshot_keyframes",
+            help="截图时间不对齐到关键帧，默认对齐（非MKV文件首次需要用ffprobe读取一遍文件生成索引）",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--screenshot-content-aware",
+            action="store_true",
+            help="每张截图先比较附近几个低分辨率候选画面，避开黑场、淡出和模糊的画面",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--screenshot-in-memory",
+            action="store_true",
+            help="截图经管道从ffmpeg读入内存，在内存中优化后直接上传，只把最终的截图写入磁盘供复用",
+            default=argparse.SUPPRESS,
+        )
         screenshot_tonemap_group = parser.add_mutually_exclusive_group()
         screenshot_tonemap_group.add_argument(
             "--screenshot-tonemap",
@@ -348,6 +454,46 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
             help="提供种子，在此基础上，直接洗种生成新种子",
             default=argparse.SUPPRESS,
         )
+        parser.add_argument(
+            "--verify-torrent",
+            action="store_true",
+            help="洗种前先校验基础种子的piece与本地文件是否一致",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--verify-sample",
+            type=float,
+            help="洗种前只抽样校验指定百分比的piece，例如2表示2%%",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-target",
+            type=str,
+            action="append",
+            dest="torrent_targets",
+            help="额外制种的站点，格式为PREFIX=ANNOUNCE_URL，可多次指定；所有站点的种子只计算一次哈希",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-workers",
+            type=int,
+            help="制种时计算piece哈希的进程数，默认为CPU核心数",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--io-mode",
+            type=str,
+            choices=IO_MODES,
+            help="制种和计算文件特征时的读取方式，stream会提示系统顺序读取并在读完后释放页缓存，避免挤掉做种客户端的缓存，默认buffered",
+            default=argparse.SUPPRESS,
+        )
+        parser.add_argument(
+            "--torrent-version",
+            type=str,
+            choices=TORRENT_VERSIONS,
+            help="制作的种子版本，v1、v2或同时兼容两者的hybrid，默认v1",
+            default=argparse.SUPPRESS,
+        )
         return parser
 
     def __init__(
@@ -359,9 +505,18 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         screenshot_path: str = None,
         optimize_screenshot: bool = True,
         screenshot_tonemap: str = "auto",
+        screenshot_workers: int = None,
+        screenshot_timeout: int = None,
+        screenshot_single_pass: bool = False,
+        screenshot_keyframes: bool = True,
+        screenshot_content_aware: bool = False,
+        screenshot_in_memory: bool = False,
         create_folder: bool = False,
         use_short_bdinfo: bool = False,
         scan_bdinfo: bool = True,
+        bdinfo_workers: int = None,
+        native_bdinfo: bool = False,
+        bdinfo_cache_size: int = None,
         image_hosting: ImageHosting = ImageHosting.PTPIMG,
         chevereto_hosting_url: str = "",
         imgurl_hosting_url: str = "",
@@ -396,6 +551,12 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         encoder_log: str = "",
         reuse_torrent: bool = True,
         from_torrent: str = None,
+        torrent_workers: int = None,
+        torrent_version: str = "v1",
+        io_mode: str = "buffered",
+        torrent_targets: list = None,
+        verify_torrent: bool = False,
+        verify_sample: float = None,
         non_interactive: bool = False,
         ptgen_source: str = None,
         ptgen_fields: str = DEFAULT_MEDIA_SEARCH_FIELDS,
@@ -423,12 +584,23 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
         self.encoder_log = encoder_log
         self.reuse_torrent = reuse_torrent
         self.from_torrent = from_torrent
+        self.torrent_workers = torrent_workers
+        self.torrent_version = torrent_version
+        self.io_mode = io_mode
+        set_io_mode(io_mode)
+        self.torrent_targets = torrent_targets or []
+        self.verify_torrent = verify_torrent
+        self.verify_sample = float(verify_sample) if verify_sample else None
 
         self.mediainfo_handler = MediaInfoHandler(
             folder=self.folder,
             create_folder=create_folder,
             use_short_bdinfo=use_short_bdinfo,
             scan_bdinfo=scan_bdinfo,
+            bdinfo_workers=bdinfo_workers,
+            native_bdinfo=native_bdinfo,
+            bdinfo_cache_size=bdinfo_cache_size,
+            probe_episodes=True,
         )
         self.ptgen_handler = PTGenHandler(
             url=self.url,
@@ -439,6 +611,12 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
             screenshot_path=screenshot_path,
             optimize_screenshot=optimize_screenshot,
             screenshot_tonemap=screenshot_tonemap,
+            screenshot_workers=screenshot_workers,
+            screenshot_timeout=screenshot_timeout,
+            screenshot_single_pass=screenshot_single_pass,
+            screenshot_keyframes=screenshot_keyframes,
+            screenshot_content_aware=screenshot_content_aware,
+            screenshot_in_memory=screenshot_in_memory,
             image_hosting=image_hosting,
             chevereto_hosting_url=chevereto_hosting_url,
             imgurl_hosting_url=imgurl_hosting_url,
@@ -504,29 +682,41 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
             self.mediainfo_handler.cleanup()
 
     def _prepare(self):
-        self.main_file = self.mediainfo_handler.find_mediainfo()
-        if not hasattr(self, "url") or getattr(self, "url", ""):
-            self.ptgen, self.douban, self.imdb = self.ptgen_handler.fetch_ptgen_info()
-        else:
-            self.ptgen, self.douban, self.imdb = self._search_and_fetch_ptgen_info()
-        self.screenshot_handler.collect_screenshots(
-            self.main_file,
-            self.mediainfo_handler.resolution,
-            self.mediainfo_handler.duration,
-            self.mediainfo_handler.tracks,
-        )
-
-        if self.generate_nfo:
-            generate_nfo(self.folder, self.mediainfo_handler.media_info)
-
-        if self.make_torrent:
-            make_torrent(
-                self.folder,
-                self.announce_url,
-                self.__class__.__name__,
-                self.reuse_torrent,
-                self.from_torrent,
+        # Hashing needs nothing the other steps produce, so it runs in the
+        # background right away. Only an NFO written into the payload folder
+        # has to exist first, as it becomes part of the torrent.
+        nfo_in_payload = self.generate_nfo and self.folder.is_dir()
+        torrent_job = start_make_torrent(self) if self.make_torrent and not nfo_in_payload else None
+        try:
+            self.main_file = self.mediainfo_handler.find_mediainfo()
+            if self.generate_nfo:
+                generate_nfo(self.folder, self.mediainfo_handler.media_info)
+            if self.make_torrent and nfo_in_payload:
+                torrent_job = start_make_torrent(self)
+
+            if not hasattr(self, "url") or getattr(self, "url", ""):
+                self.ptgen, self.douban, self.imdb = self.ptgen_handler.fetch_ptgen_info()
+            else:
+                self.ptgen, self.douban, self.imdb = self._search_and_fetch_ptgen_info()
+            self.screenshot_handler.collect_screenshots(
+                self.main_file,
+                self.mediainfo_handler.resolution,
+                self.mediainfo_handler.duration,
+                self.mediainfo_handler.tracks,
+                media_input=self.mediainfo_handler.media_input,
+                cache_key=self.mediainfo_handler.main_file_cache_key,
             )
+        except BaseException:
+            # Also on Ctrl-C: stop hashing instead of waiting for the whole payload
+            if torrent_job and not torrent_job.done():
+                logger.info("正在停止后台制种...")
+                torrent_job.cancel()
+            raise
+
+        if torrent_job:
+            if not torrent_job.done():
+                logger.info("正在等待后台制种完成...")
+            torrent_job.result()
 
     def _search_and_fetch_ptgen_info(self):
         parsed = parse_media_name(self.folder)
@@ -595,7 +785,7 @@ class Base(ABC, TorrnetBase, metaclass=PluginRegister):
 
     @property
     def media_infos(self):
-        return []
+        return self.mediainfo_handler.media_infos
 
     @property
     def description(self):
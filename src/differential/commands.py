@@ -1,5 +1,6 @@
 import argparse
 from differential.version import version
+from differential.utils.io_mode import IO_MODES
 
 PRE_PARSER = argparse.ArgumentParser(add_help=False)
 PRE_PARSER.add_argument(
@@ -33,3 +34,33 @@ PARSER.add_argument(
     default=argparse.SUPPRESS,
 )
 subparsers = PARSER.add_subparsers(help="使用下列插件名字来查看插件的详细用法")
+
+verify_parser = subparsers.add_parser("verify", help="校验种子与本地文件是否一致")
+verify_parser.add_argument("torrent", type=str, help="种子文件的路径")
+verify_parser.add_argument("path", type=str, help="种子对应的文件或文件夹的路径")
+verify_parser.add_argument(
+    "--sample",
+    type=float,
+    help="只抽样校验指定百分比的piece，例如2表示2%%，默认校验全部piece",
+    default=None,
+)
+verify_parser.add_argument(
+    "--all",
+    action="store_false",
+    dest="stop_on_first",
+    help="校验全部piece并报告所有不匹配的piece，默认在第一个不匹配的piece处停止",
+)
+verify_parser.add_argument(
+    "--workers",
+    type=int,
+    help="校验时计算piece哈希的进程数，默认为CPU核心数",
+    default=None,
+)
+verify_parser.add_argument(
+    "--io-mode",
+    type=str,
+    choices=IO_MODES,
+    help="读取方式，stream会在读完后释放页缓存，默认buffered",
+    default="buffered",
+)
+verify_parser.set_defaults(command="verify")
@@ -23,9 +23,15 @@ BOOLEAN_ARGS = (
     "use_short_bdinfo",
     "use_short_url",
     "reuse_torrent",
+    "verify_torrent",
     "scan_bdinfo",
+    "native_bdinfo",
     "create_folder",
     "optimize_screenshot",
+    "screenshot_single_pass",
+    "screenshot_keyframes",
+    "screenshot_content_aware",
+    "screenshot_in_memory",
     "non_interactive",
 )
 
@@ -7,6 +7,8 @@ from loguru import logger
 from differential.version import version
 from differential.commands import PRE_PARSER, PARSER
 from differential.utils.config import merge_config
+from differential.utils.torrent import verify_torrent
+from differential.utils.io_mode import set_io_mode
 from differential.plugin_register import REGISTERED_PLUGINS
 from differential.plugin_loader import load_plugins_from_dir, load_plugin_from_file
 
@@ -21,6 +23,17 @@ def _redact_config(config: dict) -> dict:
     }
 
 
+def run_verify(args) -> bool:
+    set_io_mode(args.io_mode)
+    return verify_torrent(
+        Path(args.torrent),
+        Path(args.path),
+        workers=args.workers,
+        sample_ratio=args.sample / 100 if args.sample else None,
+        stop_on_first=args.stop_on_first,
+    )
+
+
 @logger.catch
 def main():
     known_args, remaining_argv = PRE_PARSER.parse_known_args()
@@ -32,6 +45,8 @@ def main():
 
     args = PARSER.parse_args(remaining_argv)
     logger.info("Differential 差速器 {}".format(version))
+    if getattr(args, "command", None) == "verify":
+        sys.exit(0 if run_verify(args) else 1)
     config = merge_config(args, args.section)
 
     if 'log' in config:
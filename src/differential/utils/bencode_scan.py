@@ -0,0 +1,98 @@
+import mmap
+from typing import Dict, Tuple, Union
+
+# Anything that supports slicing and find(), e.g. bytes or an mmap
+Buffer = Union[bytes, bytearray, mmap.mmap]
+Span = Tuple[int, int]
+
+
+class BencodeError(ValueError):
+    pass
+
+
+def _byte(buf: Buffer, pos: int) -> bytes:
+    b = buf[pos:pos + 1]
+    if not b:
+        raise BencodeError(f"unexpected end of data at {pos}")
+    return bytes(b)
+
+
+def _find(buf: Buffer, char: bytes, pos: int) -> int:
+    end = buf.find(char, pos)
+    if end < 0:
+        raise BencodeError(f"unterminated value at {pos}")
+    return end
+
+
+def string_span(buf: Buffer, pos: int) -> Span:
+    """Return the span of the payload of the byte string starting at `pos`."""
+    colon = _find(buf, b":", pos)
+    try:
+        length = int(bytes(buf[pos:colon]))
+    except ValueError:
+        raise BencodeError(f"invalid string length at {pos}")
+    start = colon + 1
+    if length < 0 or start + length > len(buf):
+        raise BencodeError(f"string at {pos} runs past end of data")
+    return start, start + length
+
+
+def skip_value(buf: Buffer, pos: int) -> int:
+    """Return the offset just past the bencoded value starting at `pos`."""
+    char = _byte(buf, pos)
+    if char == b"i":
+        return _find(buf, b"e", pos) + 1
+    if char.isdigit():
+        return string_span(buf, pos)[1]
+    if char in (b"l", b"d"):
+        pos += 1
+        while _byte(buf, pos) != b"e":
+            pos = skip_value(buf, pos)
+        return pos + 1
+    raise BencodeError(f"invalid bencode type {char!r} at {pos}")
+
+
+def dict_spans(buf: Buffer, pos: int = 0) -> Dict[bytes, Span]:
+    """
+    Map every key of the dict starting at `pos` to the byte span of its raw
+    bencoded value, without decoding the values themselves.
+    """
+    if _byte(buf, pos) != b"d":
+        raise BencodeError(f"expected a dict at {pos}")
+    spans = {}
+    pos += 1
+    while _byte(buf, pos) != b"e":
+        key_start, key_end = string_span(buf, pos)
+        value_end = skip_value(buf, key_end)
+        spans[bytes(buf[key_start:key_end])] = (key_end, value_end)
+        pos = value_end
+    return spans
+
+
+def decode_string(buf: Buffer, span: Span) -> bytes:
+    start, _ = string_span(buf, span[0])
+    return bytes(buf[start:span[1]])
+
+
+def decode_int(buf: Buffer, span: Span) -> int:
+    if _byte(buf, span[0]) != b"i":
+        raise BencodeError(f"expected an integer at {span[0]}")
+    try:
+        return int(bytes(buf[span[0] + 1:span[1] - 1]))
+    except ValueError:
+        raise BencodeError(f"invalid integer at {span[0]}")
+
+
+def encode_string(value: Union[str, bytes]) -> bytes:
+    if isinstance(value, str):
+        value = value.encode()
+    return str(len(value)).encode("ascii") + b":" + value
+
+
+def encode_int(value: int) -> bytes:
+    return b"i" + str(int(value)).encode("ascii") + b"e"
+
+
+def encode_raw_dict(items: Dict[bytes, bytes]) -> bytes:
+    """Bencode a dict whose values are already bencoded bytes."""
+    return b"d" + b"".join(encode_string(k) + items[k] for k in sorted(items)) + b"e"
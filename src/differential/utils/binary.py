@@ -1,8 +1,10 @@
 import os
 import re
 import sys
+import json
 import shutil
 import platform
+import functools
 import subprocess
 from pathlib import Path
 from typing import Optional
@@ -79,10 +81,11 @@ def execute_with_output(binary_name: str, args: str, abort: bool = False) -> int
     return return_code
     
 
-def execute(binary_name: str, args: str, abort: bool = False) -> str:
+def execute(binary_name: str, args: str, abort: bool = False, timeout: Optional[float] = None) -> str:
+    """Run the binary and return its output; raises `subprocess.TimeoutExpired` once `timeout` seconds pass."""
     cmd = build_cmd(binary_name, args, abort)
     proc = subprocess.run(
-            cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
     logger.trace(proc)
     ret = "\n".join(
         [
@@ -95,6 +98,55 @@ def execute(binary_name: str, args: str, abort: bool = False) -> str:
     return ret
 
 
+def execute_bytes(binary_name: str, args: str, timeout: Optional[float] = None) -> bytes:
+    """
+    Run the binary and return what it wrote to stdout, e.g. raw frames from
+    ffmpeg; raises `subprocess.TimeoutExpired` once `timeout` seconds pass.
+    """
+    cmd = build_cmd(binary_name, args)
+    if not cmd:
+        return b""
+    proc = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    if proc.returncode != 0:
+        logger.warning(f"{binary_name} exit with return code {proc.returncode}:\n{proc.stderr.decode(errors='replace')}")
+    return proc.stdout
+
+
+def ffprobe_json(path: Path) -> dict:
+    """
+    Probe `path` once with ``ffprobe -print_format json`` for its format and
+    streams. The result is kept per file size and mtime, so resolution,
+    duration and HDR fallbacks all share a single spawn. Returns an empty
+    dict when ffprobe is missing or fails.
+    """
+    path = Path(path).absolute()
+    try:
+        stat = path.stat()
+    except OSError as e:
+        logger.warning(f"无法读取文件{path}: {e}")
+        return {}
+    return _ffprobe_json(str(path), stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=32)
+def _ffprobe_json(path: str, size: int, mtime_ns: int) -> dict:
+    if platform.system() != "Windows":
+        path = path.replace('"', '\\"')
+    cmd = build_cmd("ffprobe", f'-v quiet -print_format json -show_format -show_streams -i "{path}"')
+    if not cmd:
+        return {}
+    proc = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    logger.trace(proc)
+    if proc.returncode != 0:
+        logger.warning(f"ffprobe exit with return code {proc.returncode}:\n{proc.stderr.decode(errors='replace')}")
+        return {}
+    try:
+        return json.loads(proc.stdout.decode(errors="replace"))
+    except ValueError as e:
+        logger.warning(f"无法解析ffprobe输出: {e}")
+        return {}
+
+
 def ffmpeg(path: Path, extra_args: str = "") -> str:
     if platform.system() != "Windows":
         path = str(path.absolute()).replace('"', '\\"')
@@ -0,0 +1,391 @@
+import re
+import struct
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import List, Optional, Union
+
+from loguru import logger
+
+from differential.utils.disc_image import DiscImage
+from differential.utils.tree_scan import scan_tree
+
+
+# MPLS and CLPI times are counted in 45 kHz ticks
+TICKS_PER_SECOND = 45000
+
+VIDEO_CODECS = {
+    0x01: "MPEG-1 Video",
+    0x02: "MPEG-2 Video",
+    0x1B: "MPEG-4 AVC Video",
+    0x20: "MPEG-4 MVC Video",
+    0x24: "MPEG-H HEVC Video",
+    0xEA: "VC-1 Video",
+}
+AUDIO_CODECS = {
+    0x03: "MPEG Audio",
+    0x04: "MPEG Audio",
+    0x80: "LPCM Audio",
+    0x81: "Dolby Digital Audio",
+    0x82: "DTS Audio",
+    0x83: "Dolby TrueHD Audio",
+    0x84: "Dolby Digital Plus Audio",
+    0x85: "DTS-HD High-Res Audio",
+    0x86: "DTS-HD Master Audio",
+    0xA1: "Dolby Digital Plus Audio",
+    0xA2: "DTS-HD High-Res Audio",
+}
+SUBTITLE_CODECS = {
+    0x90: "Presentation Graphics",
+    0x91: "Interactive Graphics",
+    0x92: "Text Subtitle",
+}
+
+VIDEO_FORMATS = {1: "480i", 2: "576i", 3: "480p", 4: "1080i", 5: "720p", 6: "1080p", 7: "576p", 8: "2160p"}
+FRAME_RATES = {1: "23.976", 2: "24", 3: "25", 4: "29.97", 6: "50", 7: "59.94"}
+ASPECT_RATIOS = {2: "4:3", 3: "16:9"}
+DYNAMIC_RANGES = {1: "HDR10", 2: "Dolby Vision"}
+COLOR_SPACES = {1: "BT.709", 2: "BT.2020"}
+AUDIO_CHANNELS = {1: "1.0", 3: "2.0", 6: "Multi-channel", 12: "Stereo + Multi-channel"}
+SAMPLE_RATES = {1: "48 kHz", 4: "96 kHz", 5: "192 kHz", 12: "48/192 kHz", 14: "48/96 kHz"}
+
+LANGUAGES = {
+    "ara": "Arabic",
+    "bul": "Bulgarian",
+    "cat": "Catalan",
+    "ces": "Czech",
+    "chi": "Chinese",
+    "cze": "Czech",
+    "dan": "Danish",
+    "deu": "German",
+    "dut": "Dutch",
+    "ell": "Greek",
+    "eng": "English",
+    "est": "Estonian",
+    "fin": "Finnish",
+    "fra": "French",
+    "fre": "French",
+    "ger": "German",
+    "gre": "Greek",
+    "heb": "Hebrew",
+    "hin": "Hindi",
+    "hrv": "Croatian",
+    "hun": "Hungarian",
+    "ice": "Icelandic",
+    "ind": "Indonesian",
+    "isl": "Icelandic",
+    "ita": "Italian",
+    "jpn": "Japanese",
+    "kor": "Korean",
+    "lav": "Latvian",
+    "lit": "Lithuanian",
+    "may": "Malay",
+    "msa": "Malay",
+    "nld": "Dutch",
+    "nor": "Norwegian",
+    "pol": "Polish",
+    "por": "Portuguese",
+    "ron": "Romanian",
+    "rum": "Romanian",
+    "rus": "Russian",
+    "slk": "Slovak",
+    "slo": "Slovak",
+    "slv": "Slovenian",
+    "spa": "Spanish",
+    "srp": "Serbian",
+    "swe": "Swedish",
+    "tha": "Thai",
+    "tur": "Turkish",
+    "ukr": "Ukrainian",
+    "vie": "Vietnamese",
+    "zho": "Chinese",
+}
+
+
+@dataclass
+class Stream:
+    kind: str
+    coding_type: int
+    video_format: int = 0
+    frame_rate: int = 0
+    dynamic_range: int = 0
+    color_space: int = 0
+    audio_format: int = 0
+    sample_rate: int = 0
+    language: str = ""
+
+    @property
+    def codec(self) -> str:
+        names = {"video": VIDEO_CODECS, "audio": AUDIO_CODECS, "subtitle": SUBTITLE_CODECS}[self.kind]
+        return names.get(self.coding_type, f"Unknown (0x{self.coding_type:02X})")
+
+    @property
+    def language_name(self) -> str:
+        return LANGUAGES.get(self.language, self.language)
+
+
+@dataclass
+class PlayItem:
+    clip: str
+    in_time: int
+    out_time: int
+
+    @property
+    def duration(self) -> float:
+        return max(self.out_time - self.in_time, 0) / TICKS_PER_SECOND
+
+
+@dataclass
+class Playlist:
+    path: Path
+    items: List[PlayItem] = field(default_factory=list)
+    streams: List[Stream] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        return self.path.name.upper()
+
+    @property
+    def duration(self) -> float:
+        return sum(item.duration for item in self.items)
+
+    @property
+    def is_looping(self) -> bool:
+        """Menu and trailer loops play the same clip over and over."""
+        clips = [item.clip for item in self.items]
+        return len(set(clips)) < len(clips)
+
+    def streams_of(self, kind: str) -> List[Stream]:
+        return [s for s in self.streams if s.kind == kind]
+
+
+class LocalDisc:
+    """A disc folder, read through the same calls `DiscImage` offers for an unmounted image."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def __str__(self) -> str:
+        return str(self.path)
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    def list(self, folder: str) -> List[str]:
+        directory = self.path.joinpath(folder)
+        if not directory.is_dir():
+            return []
+        return sorted(f.name for f in directory.iterdir() if f.is_file())
+
+    def has_folder(self, folder: str) -> bool:
+        return self.path.joinpath(folder).is_dir()
+
+    def read(self, relative: str) -> bytes:
+        return self.path.joinpath(relative).read_bytes()
+
+    def size(self, relative: str) -> Optional[int]:
+        try:
+            return self.path.joinpath(relative).stat().st_size
+        except OSError:
+            return None
+
+    def total_size(self) -> int:
+        return sum(f.size for f in scan_tree(self.path).files)
+
+
+Disc = Union[Path, LocalDisc, DiscImage]
+
+
+def as_disc(disc: Disc) -> Union[LocalDisc, DiscImage]:
+    return disc if isinstance(disc, (LocalDisc, DiscImage)) else LocalDisc(disc)
+
+
+def _read_stream(data: bytes, pos: int, kind: str) -> Stream:
+    coding_type = data[pos]
+    stream = Stream(kind=kind, coding_type=coding_type)
+    if kind == "video":
+        stream.video_format, stream.frame_rate = data[pos + 1] >> 4, data[pos + 1] & 0x0F
+        if coding_type == 0x24:
+            stream.dynamic_range, stream.color_space = data[pos + 2] >> 4, data[pos + 2] & 0x0F
+    elif kind == "audio":
+        stream.audio_format, stream.sample_rate = data[pos + 1] >> 4, data[pos + 1] & 0x0F
+        stream.language = data[pos + 2 : pos + 5].decode("ascii", errors="replace")
+    elif coding_type == 0x92:
+        # Text subtitles carry a character code before the language
+        stream.language = data[pos + 2 : pos + 5].decode("ascii", errors="replace")
+    else:
+        stream.language = data[pos + 1 : pos + 4].decode("ascii", errors="replace")
+    return stream
+
+
+def _read_stn_table(data: bytes, pos: int) -> List[Stream]:
+    """Primary video, primary audio and presentation graphics of a play item's STN_table."""
+    video_count, audio_count, pg_count, _ig_count, _sa_count, _sv_count, pip_pg_count = struct.unpack_from(
+        ">7B", data, pos + 4
+    )
+    pos += 16
+    streams = []
+    for kind, count in (("video", video_count), ("audio", audio_count), ("subtitle", pg_count + pip_pg_count)):
+        for _ in range(count):
+            # stream_entry, then stream_attributes, each prefixed with its length
+            pos += 1 + data[pos]
+            streams.append(_read_stream(data, pos + 1, kind))
+            pos += 1 + data[pos]
+    return streams
+
+
+def read_playlist(path: Path) -> Playlist:
+    """Parse the play items and the first item's streams of an MPLS file."""
+    return parse_playlist(Path(path).read_bytes(), Path(path))
+
+
+def parse_playlist(data: bytes, path: Path) -> Playlist:
+    if data[:4] != b"MPLS":
+        raise ValueError(f"not an MPLS file: {path}")
+
+    (playlist_start,) = struct.unpack_from(">I", data, 8)
+    (item_count,) = struct.unpack_from(">H", data, playlist_start + 6)
+    playlist = Playlist(path=path)
+    pos = playlist_start + 10
+    for index in range(item_count):
+        (length,) = struct.unpack_from(">H", data, pos)
+        item = pos + 2
+        clip = data[item : item + 5].decode("ascii", errors="replace")
+        (flags,) = struct.unpack_from(">H", data, item + 9)
+        in_time, out_time = struct.unpack_from(">II", data, item + 12)
+        playlist.items.append(PlayItem(clip, in_time, out_time))
+        if index == 0:
+            stn = item + 32
+            if flags & 0x10:
+                # Multi-angle: angle count, flags, then 10 bytes for every angle after the first
+                stn += 2 + (data[stn] - 1) * 10
+            playlist.streams = _read_stn_table(data, stn)
+        pos += 2 + length
+    return playlist
+
+
+def read_clip_aspect_ratio(path: Path) -> Optional[str]:
+    """The aspect ratio of the first video stream in a CLPI file's ProgramInfo."""
+    return parse_clip_aspect_ratio(Path(path).read_bytes(), path)
+
+
+def parse_clip_aspect_ratio(data: bytes, path: Path) -> Optional[str]:
+    if data[:4] != b"HDMV":
+        raise ValueError(f"not a CLPI file: {path}")
+
+    (program_start,) = struct.unpack_from(">I", data, 12)
+    sequence_count = data[program_start + 5]
+    pos = program_start + 6
+    for _ in range(sequence_count):
+        stream_count = data[pos + 6]
+        pos += 8
+        for _ in range(stream_count):
+            length, coding_type = data[pos + 2], data[pos + 3]
+            if coding_type in VIDEO_CODECS:
+                return ASPECT_RATIOS.get(data[pos + 5] >> 4)
+            pos += 3 + length
+    return None
+
+
+def main_playlist(disc: Disc) -> Optional[Playlist]:
+    """The longest playlist of `disc` that does not loop a clip; the size of its clips breaks ties."""
+    disc = as_disc(disc)
+    playlists = []
+    for name in disc.list("BDMV/PLAYLIST"):
+        if not name.lower().endswith(".mpls"):
+            continue
+        path = disc.path.joinpath("BDMV", "PLAYLIST", name)
+        try:
+            playlists.append(parse_playlist(disc.read(f"BDMV/PLAYLIST/{name}"), path))
+        except (OSError, ValueError, IndexError, struct.error) as e:
+            logger.debug(f"[BDMV] 无法解析播放列表{path}: {e}")
+    if not playlists:
+        return None
+    candidates = [p for p in playlists if not p.is_looping] or playlists
+    return max(candidates, key=lambda p: (p.duration, playlist_size(disc, p)))
+
+
+def playlist_size(disc: Disc, playlist: Playlist) -> int:
+    disc = as_disc(disc)
+    return sum(disc.size(f"BDMV/STREAM/{item.clip}.m2ts") or 0 for item in playlist.items)
+
+
+def disc_title(disc: Disc) -> str:
+    disc = as_disc(disc)
+    for name in disc.list("BDMV/META/DL"):
+        if not (name.startswith("bdmt_") and name.endswith(".xml")):
+            continue
+        try:
+            text = disc.read(f"BDMV/META/DL/{name}").decode("utf-8", errors="ignore")
+            if m := re.search(r"<di:name>(.*?)</di:name>", text):
+                return m.group(1).strip()
+        except OSError:
+            pass
+    return ""
+
+
+def format_length(seconds: float) -> str:
+    millis = int(round(seconds * 1000))
+    return "{}:{:02d}:{:02d}.{:03d}".format(millis // 3600000, millis // 60000 % 60, millis // 1000 % 60, millis % 1000)
+
+
+def _video_line(stream: Stream, aspect_ratio: Optional[str]) -> str:
+    parts = [
+        stream.codec,
+        VIDEO_FORMATS.get(stream.video_format, ""),
+        f"{FRAME_RATES[stream.frame_rate]} fps" if stream.frame_rate in FRAME_RATES else "",
+        aspect_ratio or "",
+        DYNAMIC_RANGES.get(stream.dynamic_range, ""),
+        COLOR_SPACES.get(stream.color_space, "") if stream.coding_type == 0x24 else "",
+    ]
+    return "Video: " + " / ".join(p for p in parts if p)
+
+
+def _audio_line(stream: Stream) -> str:
+    parts = [
+        stream.language_name,
+        stream.codec,
+        AUDIO_CHANNELS.get(stream.audio_format, ""),
+        SAMPLE_RATES.get(stream.sample_rate, ""),
+    ]
+    return "Audio: " + " / ".join(p for p in parts if p)
+
+
+def quick_summary(disc: Disc) -> Optional[str]:
+    """
+    A BDInfo style QUICK SUMMARY of the main playlist of `disc`, built from
+    the playlist and clip info files alone. Bit rates of the single streams
+    need a full scan and are left out.
+    """
+    disc = as_disc(disc)
+    playlist = main_playlist(disc)
+    if playlist is None or not playlist.items:
+        return None
+
+    size = playlist_size(disc, playlist)
+    duration = playlist.duration
+    aspect_ratio = None
+    try:
+        clip_info = f"BDMV/CLIPINF/{playlist.items[0].clip}.clpi"
+        aspect_ratio = parse_clip_aspect_ratio(disc.read(clip_info), disc.path.joinpath(clip_info))
+    except (OSError, ValueError, IndexError, struct.error) as e:
+        logger.debug(f"[BDMV] 无法解析片段信息{playlist.items[0].clip}: {e}")
+
+    lines = ["QUICK SUMMARY:", ""]
+    if title := disc_title(disc):
+        lines.append(f"Disc Title: {title}")
+    lines.append(f"Disc Label: {disc.name}")
+    lines.append(f"Disc Size: {disc.total_size():,} bytes")
+    if disc.has_folder("AACS"):
+        lines.append("Protection: AACS")
+    elif disc.has_folder("BDSVM"):
+        lines.append("Protection: BD+")
+    lines.append(f"Playlist: {playlist.name}")
+    lines.append(f"Size: {size:,} bytes")
+    lines.append(f"Length: {format_length(duration)}")
+    if duration > 0:
+        lines.append(f"Total Bitrate: {size * 8 / duration / 1000000:.2f} Mbps")
+    lines.extend(_video_line(s, aspect_ratio) for s in playlist.streams_of("video"))
+    lines.extend(_audio_line(s) for s in playlist.streams_of("audio"))
+    lines.extend(f"Subtitle: {s.language_name}" for s in playlist.streams_of("subtitle"))
+    return "\n".join(lines) + "\n"
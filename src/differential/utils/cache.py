@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import platform
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from loguru import logger
+
+try:
+    import fcntl
+except ImportError:
+    # Windows locks the index with msvcrt instead
+    fcntl = None
+    import msvcrt
+
+
+CACHE_ENV_VAR = "DIFFERENTIAL_CACHE_DIR"
+
+
+def cache_root() -> Path:
+    if env_path := os.environ.get(CACHE_ENV_VAR):
+        return Path(env_path)
+    system = platform.system()
+    if system == "Windows":
+        base = os.environ.get("LOCALAPPDATA") or Path.home().joinpath("AppData", "Local")
+        return Path(base).joinpath("Differential", "Cache")
+    if system == "Darwin":
+        return Path.home().joinpath("Library", "Caches", "Differential")
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home().joinpath(".cache")
+    return Path(base).joinpath("differential")
+
+
+def cache_dir(*parts: str) -> Path:
+    path = cache_root().joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def read_json(path: Path, default: Any) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        logger.warning(f"[Cache] 缓存文件损坏，已忽略: {path}: {e}")
+        return default
+
+
+def write_bytes(path: Path, data: bytes) -> None:
+    """Write `data` next to `path` first and rename it over, so readers never see half a file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+
+def write_json(path: Path, data: Any) -> None:
+    write_bytes(path, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+@contextmanager
+def locked(lock_path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on `lock_path` across processes while reading and rewriting a shared index."""
+    with open(lock_path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class BlobCache:
+    """
+    Size-bounded store of byte blobs under ``cache_dir(name)``. An index file
+    records the size and last use of every entry; once the total goes over
+    `max_size` the least recently used entries are evicted. Every change is
+    merged into the index on disk under a lock file, so several instances,
+    in one process or many, never drop each other's entries.
+    """
+
+    INDEX_FILE = "index.json"
+    LOCK_FILE = "index.lock"
+
+    def __init__(self, name: str, max_size: int):
+        self.name = name
+        self.max_size = max_size
+        self.root = cache_dir(name)
+        self.index_path = self.root.joinpath(self.INDEX_FILE)
+        self.entries: Dict[str, dict] = read_json(self.index_path, {})
+
+    def _path(self, key: str) -> Path:
+        return self.root.joinpath(f"{key}.bin")
+
+    def get(self, key: str) -> Optional[bytes]:
+        if key not in self.entries:
+            # Another instance may have added it since the index was read
+            self.entries = read_json(self.index_path, {})
+            if key not in self.entries:
+                return None
+        try:
+            data = self._path(key).read_bytes()
+        except OSError:
+            self._update({key: None})
+            return None
+        self._update({key: {"size": len(data), "used": time.time()}})
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_size:
+            return
+        try:
+            write_bytes(self._path(key), data)
+        except OSError as e:
+            logger.warning(f"[Cache] 无法写入缓存{self._path(key)}: {e}")
+            return
+        self._update({key: {"size": len(data), "used": time.time()}})
+
+    def _update(self, changes: Dict[str, Optional[dict]]) -> None:
+        """Apply `changes` (None drops an entry) to the index on disk, evict, and write it back."""
+        try:
+            with self._locked():
+                entries = read_json(self.index_path, {})
+                self._apply(entries, changes)
+                write_json(self.index_path, entries)
+        except OSError as e:
+            logger.warning(f"[Cache] 无法写入缓存索引{self.index_path}: {e}")
+            entries = self.entries
+            self._apply(entries, changes)
+        self.entries = entries
+
+    def _apply(self, entries: Dict[str, dict], changes: Dict[str, Optional[dict]]) -> None:
+        for key, entry in changes.items():
+            if entry is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = entry
+        total = sum(entry["size"] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]["used"]):
+            if total <= self.max_size:
+                break
+            total -= entries.pop(key)["size"]
+            self._path(key).unlink(missing_ok=True)
+
+    def _locked(self):
+        return locked(self.root.joinpath(self.LOCK_FILE))
@@ -1,4 +1,6 @@
+import re
 import argparse
+from typing import List, Tuple
 from configparser import RawConfigParser
 
 from loguru import logger
@@ -21,6 +23,26 @@ def parse_screenshot_tonemap(value) -> str:
     return "auto"
 
 
+def parse_torrent_targets(value) -> List[Tuple[str, str]]:
+    if isinstance(value, str):
+        value = [value]
+    targets = []
+    for item in value or []:
+        if isinstance(item, (tuple, list)):
+            targets.append((str(item[0]), str(item[1])))
+            continue
+        for entry in re.split(r"[,\n]", str(item)):
+            entry = entry.strip()
+            if not entry:
+                continue
+            prefix, sep, announce = entry.partition("=")
+            if not sep or not prefix.strip() or not announce.strip():
+                logger.warning(f"Invalid torrent target {entry!r}, expected PREFIX=ANNOUNCE_URL; skipping")
+                continue
+            targets.append((prefix.strip(), announce.strip()))
+    return targets
+
+
 def merge_config(args: argparse.Namespace, section: str = '') -> dict:
     merged = {}
     config = None
@@ -63,6 +85,9 @@ def merge_config(args: argparse.Namespace, section: str = '') -> dict:
             merged["screenshot_tonemap"]
         )
 
+    if "torrent_targets" in merged:
+        merged["torrent_targets"] = parse_torrent_targets(merged["torrent_targets"])
+
     # Parse int args
     for arg in merged:
         if isinstance(merged[arg], str) and merged[arg].isdigit():
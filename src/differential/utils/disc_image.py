@@ -0,0 +1,522 @@
+import io
+import hmac
+import struct
+import secrets
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from loguru import logger
+
+from differential.utils.tree_scan import ScannedFile, TreeSnapshot
+
+
+SECTOR_SIZE = 2048
+UDF_ANCHOR_SECTOR = 256
+ISO9660_FIRST_DESCRIPTOR = 16
+
+# UDF descriptor tag identifiers (ECMA-167)
+TAG_ANCHOR = 2
+TAG_PARTITION = 5
+TAG_LOGICAL_VOLUME = 6
+TAG_TERMINATING = 8
+TAG_FILE_SET = 256
+TAG_FILE_IDENTIFIER = 257
+TAG_FILE_ENTRY = 261
+TAG_EXTENDED_FILE_ENTRY = 266
+
+# A data extent is (byte offset in the image, length); offset None reads as zeros
+Extent = Tuple[Optional[int], int]
+
+
+@dataclass(frozen=True)
+class ImageFile:
+    relative: str
+    size: int
+    extents: Tuple[Extent, ...]
+
+
+class ExtentReader(io.RawIOBase):
+    """Seekable, read-only view of one file stored in an image as a list of extents."""
+
+    def __init__(self, image_path: Path, image_file: ImageFile):
+        self.image_file = image_file
+        self.size = image_file.size
+        self.position = 0
+        self.handle = open(image_path, "rb")
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        wanted = min(len(view), self.size - self.position)
+        done = 0
+        start = 0
+        for offset, length in self.image_file.extents:
+            if done >= wanted:
+                break
+            end = start + length
+            if self.position + done < end:
+                skip = self.position + done - start
+                count = min(length - skip, wanted - done)
+                if offset is None:
+                    view[done : done + count] = bytes(count)
+                else:
+                    self.handle.seek(offset + skip)
+                    read = self.handle.readinto(view[done : done + count])
+                    if read < count:
+                        done += read
+                        break
+                done += count
+            start = end
+        self.position += done
+        return done
+
+    def close(self) -> None:
+        self.handle.close()
+        super().close()
+
+
+class DiscImage:
+    """
+    Read-only file listing of an ISO image, without mounting it. UDF (up to
+    2.50 with its metadata partition, as on Blu-ray) is preferred, with
+    ISO9660/Joliet as the fallback for images that have no UDF volume.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.files: Dict[str, ImageFile] = {}
+        self.folders = set()
+        self.handle = open(self.path, "rb")
+        try:
+            try:
+                self._read_udf()
+                self.format = "UDF"
+            except (ValueError, IndexError, struct.error) as e:
+                logger.debug(f"[ISO] 未找到可用的UDF文件系统，尝试ISO9660: {e}")
+                self.files.clear()
+                self.folders.clear()
+                self._read_iso9660()
+                self.format = "ISO9660"
+        except Exception:
+            self.handle.close()
+            raise
+
+    def close(self) -> None:
+        self.handle.close()
+
+    def __enter__(self) -> "DiscImage":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def name(self) -> str:
+        return self.path.stem
+
+    def __repr__(self) -> str:
+        return f"<DiscImage {self.path} ({len(self.files)} files)>"
+
+    # Lookups are case-insensitive, ISO9660 names are upper case and BDMV files are not
+
+    def find(self, relative: str) -> Optional[ImageFile]:
+        return self.files.get(relative.strip("/").lower())
+
+    def has_folder(self, relative: str) -> bool:
+        return relative.strip("/").lower() in self.folders
+
+    def list(self, folder: str) -> List[str]:
+        """Names of the files directly in `folder`, sorted."""
+        prefix = folder.strip("/").lower() + "/"
+        return sorted(
+            f.relative.rsplit("/", 1)[-1]
+            for key, f in self.files.items()
+            if key.startswith(prefix) and "/" not in key[len(prefix) :]
+        )
+
+    def size(self, relative: str) -> Optional[int]:
+        f = self.find(relative)
+        return f.size if f else None
+
+    def total_size(self) -> int:
+        return sum(f.size for f in self.files.values())
+
+    def open(self, relative: str) -> ExtentReader:
+        f = self.find(relative)
+        if f is None:
+            raise FileNotFoundError(f"{self.path}: {relative}")
+        return ExtentReader(self.path, f)
+
+    def read(self, relative: str) -> bytes:
+        with self.open(relative) as reader:
+            return reader.read()
+
+    def tree(self) -> TreeSnapshot:
+        """The image as a `TreeSnapshot`; paths point below the image file and cannot be opened directly."""
+        snapshot = TreeSnapshot(root=self.path)
+        for f in sorted(self.files.values(), key=lambda f: f.relative):
+            scanned = ScannedFile(self.path.joinpath(f.relative), f.relative, f.size)
+            snapshot.has_bdmv = snapshot.has_bdmv or scanned.suffix == ".bdmv"
+            snapshot.files.append(scanned)
+        snapshot.has_video_ts = any(folder.split("/")[-1] == "video_ts" for folder in self.folders)
+        return snapshot
+
+    def _read_at(self, offset: int, length: int) -> bytes:
+        self.handle.seek(offset)
+        data = self.handle.read(length)
+        if len(data) < length:
+            raise ValueError(f"image ends early at {offset + len(data)}")
+        return data
+
+    def _sector(self, sector: int) -> bytes:
+        return self._read_at(sector * SECTOR_SIZE, SECTOR_SIZE)
+
+    def _read_extents(self, extents) -> bytes:
+        return b"".join(bytes(length) if offset is None else self._read_at(offset, length) for offset, length in extents)
+
+    def _add_file(self, relative: str, size: int, extents) -> None:
+        self.files[relative.lower()] = ImageFile(relative, size, tuple(extents))
+
+    def _add_folder(self, relative: str) -> None:
+        if relative:
+            self.folders.add(relative.lower())
+
+    # UDF
+
+    def _read_udf(self) -> None:
+        anchor = self._sector(UDF_ANCHOR_SECTOR)
+        if _tag(anchor) != TAG_ANCHOR:
+            raise ValueError("no UDF anchor volume descriptor")
+        vds_length, vds_location = struct.unpack_from("<II", anchor, 16)
+
+        partition_starts: Dict[int, int] = {}
+        volume = None
+        for i in range(max(vds_length // SECTOR_SIZE, 1)):
+            descriptor = self._sector(vds_location + i)
+            tag = _tag(descriptor)
+            if tag == TAG_PARTITION:
+                (number,) = struct.unpack_from("<H", descriptor, 22)
+                (partition_starts[number],) = struct.unpack_from("<I", descriptor, 188)
+            elif tag == TAG_LOGICAL_VOLUME and volume is None:
+                volume = descriptor
+            elif tag == TAG_TERMINATING:
+                break
+        if volume is None or not partition_starts:
+            raise ValueError("no UDF logical volume or partition")
+        (block_size,) = struct.unpack_from("<I", volume, 212)
+        if block_size != SECTOR_SIZE:
+            raise ValueError(f"unsupported UDF block size {block_size}")
+
+        # Every partition reference resolves to (physical start sector, metadata extents or None)
+        (map_count,) = struct.unpack_from("<I", volume, 268)
+        self._maps: List[Tuple[int, Optional[List[Extent]]]] = []
+        pos = 440
+        metadata_maps = []
+        for _ in range(map_count):
+            map_type, map_length = volume[pos], volume[pos + 1]
+            if map_type == 1:
+                (number,) = struct.unpack_from("<H", volume, pos + 4)
+                self._maps.append((partition_starts[number], None))
+            elif map_type == 2:
+                identifier = volume[pos + 5 : pos + 28]
+                (number,) = struct.unpack_from("<H", volume, pos + 38)
+                self._maps.append((partition_starts[number], None))
+                if identifier.startswith(b"*UDF Metadata Partition"):
+                    (metadata_file,) = struct.unpack_from("<I", volume, pos + 40)
+                    metadata_maps.append((len(self._maps) - 1, metadata_file))
+            else:
+                raise ValueError(f"unknown UDF partition map type {map_type}")
+            pos += map_length
+        # The metadata partition is itself a file on the physical partition
+        for index, metadata_file in metadata_maps:
+            _, extents = self._file_entry(index, metadata_file, physical=True)
+            self._maps[index] = (self._maps[index][0], extents)
+
+        fsd_lbn, fsd_partition = struct.unpack_from("<IH", volume, 252)
+        fsd = self._read_at(self._block_offset(fsd_partition, fsd_lbn), SECTOR_SIZE)
+        if _tag(fsd) != TAG_FILE_SET:
+            raise ValueError("no UDF file set descriptor")
+        root_lbn, root_partition = struct.unpack_from("<IH", fsd, 404)
+        self._walk_udf(root_partition, root_lbn, "", set())
+
+    def _block_offset(self, partition: int, lbn: int) -> int:
+        start, metadata = self._maps[partition]
+        if metadata is None:
+            return (start + lbn) * SECTOR_SIZE
+        offset = lbn * SECTOR_SIZE
+        for extent_offset, length in metadata:
+            if offset < length and extent_offset is not None:
+                return extent_offset + offset
+            offset -= length
+        raise ValueError(f"block {lbn} outside the UDF metadata partition")
+
+    def _extents(self, partition: int, lbn: int, length: int, physical: bool) -> List[Extent]:
+        start, metadata = self._maps[partition]
+        if physical or metadata is None:
+            return [((start + lbn) * SECTOR_SIZE, length)]
+        # Blocks of the metadata partition need not be contiguous in the image
+        return [
+            (self._block_offset(partition, lbn + i // SECTOR_SIZE), min(SECTOR_SIZE, length - i))
+            for i in range(0, length, SECTOR_SIZE)
+        ]
+
+    def _file_entry(self, partition: int, lbn: int, physical: bool) -> Tuple[int, List[Extent]]:
+        """
+        Decode the (extended) file entry at `lbn` into its size and extents.
+        Directory data is addressed like the entry itself, on the metadata
+        partition for UDF 2.50; with `physical` the data is taken from the
+        physical partition below it, which is where file contents live.
+        """
+        offset = self._block_offset(partition, lbn)
+        entry = self._read_at(offset, SECTOR_SIZE)
+        tag = _tag(entry)
+        if tag == TAG_FILE_ENTRY:
+            ea_length, ad_length = struct.unpack_from("<II", entry, 168)
+            ad_start = 176 + ea_length
+        elif tag == TAG_EXTENDED_FILE_ENTRY:
+            ea_length, ad_length = struct.unpack_from("<II", entry, 208)
+            ad_start = 216 + ea_length
+        else:
+            raise ValueError(f"expected a UDF file entry at block {lbn}, found tag {tag}")
+        (flags,) = struct.unpack_from("<H", entry, 34)
+        (size,) = struct.unpack_from("<Q", entry, 56)
+        ad_type = flags & 0x07
+
+        if ad_type == 3:
+            # Data embedded in the entry itself
+            return size, [(offset + ad_start, min(size, ad_length))]
+        if ad_type not in (0, 1):
+            raise ValueError(f"unsupported UDF allocation descriptor type {ad_type}")
+
+        extents: List[Extent] = []
+        step = 8 if ad_type == 0 else 16
+        descriptors = entry[ad_start : ad_start + ad_length]
+        while descriptors:
+            continued = b""
+            for pos in range(0, len(descriptors) - step + 1, step):
+                (length,) = struct.unpack_from("<I", descriptors, pos)
+                kind, length = length >> 30, length & 0x3FFFFFFF
+                if length == 0:
+                    break
+                if ad_type == 0:
+                    (position,) = struct.unpack_from("<I", descriptors, pos + 4)
+                    ad_partition = partition
+                else:
+                    position, ad_partition = struct.unpack_from("<IH", descriptors, pos + 4)
+                if kind == 3:
+                    # The descriptors continue in another block
+                    continued = self._read_extents(self._extents(ad_partition, position, length, False))
+                    break
+                if kind == 0:
+                    extents.extend(self._extents(ad_partition, position, length, physical))
+                else:
+                    extents.append((None, length))
+            descriptors = continued
+        return size, extents
+
+    def _walk_udf(self, partition: int, lbn: int, prefix: str, seen: set) -> None:
+        if (partition, lbn) in seen:
+            return
+        seen.add((partition, lbn))
+        size, extents = self._file_entry(partition, lbn, physical=False)
+        data = self._read_extents(extents)[:size]
+
+        pos = 0
+        while pos + 38 <= len(data) and _tag(data[pos:]) == TAG_FILE_IDENTIFIER:
+            characteristics, name_length = data[pos + 18], data[pos + 19]
+            child_lbn, child_partition = struct.unpack_from("<IH", data, pos + 24)
+            (impl_length,) = struct.unpack_from("<H", data, pos + 36)
+            name_start = pos + 38 + impl_length
+            name = _udf_name(data[name_start : name_start + name_length])
+            pos += (38 + impl_length + name_length + 3) & ~3
+            if characteristics & 0x0C:
+                # Parent entry or deleted file
+                continue
+            relative = f"{prefix}{name}"
+            if characteristics & 0x02:
+                self._add_folder(relative)
+                self._walk_udf(child_partition, child_lbn, relative + "/", seen)
+            else:
+                child_size, child_extents = self._file_entry(child_partition, child_lbn, physical=True)
+                self._add_file(relative, child_size, child_extents)
+
+    # ISO9660
+
+    def _read_iso9660(self) -> None:
+        primary = joliet = None
+        sector = ISO9660_FIRST_DESCRIPTOR
+        while True:
+            descriptor = self._sector(sector)
+            if descriptor[1:6] != b"CD001":
+                raise ValueError("no ISO9660 volume descriptor")
+            kind = descriptor[0]
+            if kind == 1 and primary is None:
+                primary = descriptor
+            elif kind == 2 and descriptor[88:91] in (b"%/@", b"%/C", b"%/E"):
+                joliet = descriptor
+            elif kind == 255:
+                break
+            sector += 1
+        descriptor = joliet or primary
+        if descriptor is None:
+            raise ValueError("no ISO9660 primary volume descriptor")
+        lba, size = _iso_extent(descriptor, 156)
+        self._walk_iso9660(lba, size, "", joliet is not None, set())
+
+    def _walk_iso9660(self, lba: int, size: int, prefix: str, joliet: bool, seen: set) -> None:
+        if lba in seen:
+            return
+        seen.add(lba)
+        data = self._read_at(lba * SECTOR_SIZE, size)
+        pos = 0
+        pending: Dict[str, List[Extent]] = {}
+        while pos < len(data):
+            length = data[pos]
+            if length == 0:
+                # Records do not cross sector boundaries
+                pos = (pos // SECTOR_SIZE + 1) * SECTOR_SIZE
+                continue
+            child_lba, child_size = _iso_extent(data, pos)
+            flags, name_length = data[pos + 25], data[pos + 32]
+            raw_name = data[pos + 33 : pos + 33 + name_length]
+            pos += length
+            if raw_name in (b"\x00", b"\x01"):
+                continue
+            name = raw_name.decode("utf-16-be" if joliet else "latin-1", errors="replace")
+            name = name.split(";", 1)[0]
+            if not joliet:
+                name = name.rstrip(".")
+            relative = f"{prefix}{name}"
+            if flags & 0x02:
+                self._add_folder(relative)
+                self._walk_iso9660(child_lba, child_size, relative + "/", joliet, seen)
+                continue
+            # Files over 4 GiB are split into several records of the same name
+            extents = pending.setdefault(relative, [])
+            extents.append((child_lba * SECTOR_SIZE, child_size))
+            if not flags & 0x80:
+                self._add_file(relative, sum(length for _, length in extents), pending.pop(relative))
+
+
+def _tag(descriptor: bytes) -> int:
+    return struct.unpack_from("<H", descriptor, 0)[0]
+
+
+def _udf_name(raw: bytes) -> str:
+    if not raw:
+        return ""
+    if raw[0] == 16:
+        return raw[1:].decode("utf-16-be", errors="replace")
+    return raw[1:].decode("latin-1")
+
+
+def _iso_extent(data: bytes, record: int) -> Tuple[int, int]:
+    # Both-endian fields, the little-endian half comes first
+    (lba,) = struct.unpack_from("<I", data, record + 2)
+    (size,) = struct.unpack_from("<I", data, record + 10)
+    return lba, size
+
+
+class ImageFileServer:
+    """
+    Serves files of a `DiscImage` over HTTP on the loopback interface, with
+    range requests, so ffmpeg can seek inside a file of an unmounted image.
+    Every URL starts with a random token, so other local users cannot read
+    the image through the server.
+    """
+
+    def __init__(self, image: DiscImage):
+        self.image = image
+        self.token = secrets.token_urlsafe(16)
+        image_path = image.path
+        token = self.token
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def _serve(self, send_body: bool):
+                path_token, _, relative = self.path.lstrip("/").partition("/")
+                if not hmac.compare_digest(path_token, token):
+                    self.send_error(403)
+                    return
+                found = image.find(unquote(relative))
+                if found is None:
+                    self.send_error(404)
+                    return
+                start, end = 0, found.size - 1
+                status = 200
+                if ranges := self.headers.get("Range", "").partition("bytes=")[2]:
+                    first, _, last = ranges.split(",", 1)[0].partition("-")
+                    try:
+                        if first:
+                            start = int(first)
+                            end = min(int(last), end) if last else end
+                        elif last:
+                            start = max(found.size - int(last), 0)
+                    except ValueError:
+                        start = found.size
+                    if start >= found.size or end < start:
+                        self.send_error(416)
+                        return
+                    status = 206
+                self.send_response(status)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{found.size}")
+                self.end_headers()
+                if not send_body:
+                    return
+                with ExtentReader(image_path, found) as reader:
+                    reader.seek(start)
+                    remaining = end - start + 1
+                    try:
+                        while remaining > 0:
+                            chunk = reader.read(min(remaining, 1024 * 1024))
+                            if not chunk:
+                                break
+                            self.wfile.write(chunk)
+                            remaining -= len(chunk)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # ffmpeg drops the connection whenever it seeks
+                        pass
+
+            def log_message(self, format, *args):
+                logger.trace(f"[ISO] {format % args}")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, relative: str) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/{self.token}/{quote(relative)}"
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
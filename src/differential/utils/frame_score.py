@@ -0,0 +1,74 @@
+import math
+from collections import Counter
+from dataclasses import dataclass
+
+try:
+    import numpy
+except ImportError:
+    # Optional; the same statistics are computed in plain Python, only slower
+    numpy = None
+
+
+# Small grayscale frames are enough to tell black, flat and blurry frames apart
+SCORE_WIDTH = 160
+SCORE_HEIGHT = 90
+
+BLACK_LUMA = 24
+WHITE_LUMA = 235
+MIN_ENTROPY = 3.0
+
+
+@dataclass(frozen=True)
+class FrameStats:
+    mean: float
+    sharpness: float
+    entropy: float
+
+    @property
+    def score(self) -> float:
+        """0 for black, white and nearly flat frames such as fades and credits; higher is sharper and busier."""
+        if not BLACK_LUMA <= self.mean <= WHITE_LUMA or self.entropy < MIN_ENTROPY:
+            return 0.0
+        return self.entropy * math.log1p(self.sharpness)
+
+
+def frame_stats(gray: bytes, width: int = SCORE_WIDTH, height: int = SCORE_HEIGHT) -> FrameStats:
+    """Mean luma, variance of the Laplacian and histogram entropy (bits) of an 8-bit grayscale frame."""
+    if len(gray) < width * height:
+        raise ValueError(f"expected {width * height} bytes, got {len(gray)}")
+    if numpy is not None:
+        return _numpy_stats(gray, width, height)
+    return _python_stats(gray, width, height)
+
+
+def _numpy_stats(gray: bytes, width: int, height: int) -> FrameStats:
+    values = numpy.frombuffer(gray, dtype=numpy.uint8, count=width * height)
+    pixels = values.reshape(height, width).astype(numpy.int32)
+    laplacian = (
+        pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:] - 4 * pixels[1:-1, 1:-1]
+    )
+    histogram = numpy.bincount(values, minlength=256) / values.size
+    histogram = histogram[histogram > 0]
+    return FrameStats(
+        mean=float(values.mean()),
+        sharpness=float(laplacian.var()),
+        entropy=float(-(histogram * numpy.log2(histogram)).sum()),
+    )
+
+
+def _python_stats(gray: bytes, width: int, height: int) -> FrameStats:
+    size = width * height
+    gray = memoryview(gray)[:size]
+    total = total_squares = 0
+    for y in range(1, height - 1):
+        for i in range(y * width + 1, y * width + width - 1):
+            value = gray[i - width] + gray[i + width] + gray[i - 1] + gray[i + 1] - 4 * gray[i]
+            total += value
+            total_squares += value * value
+    count = max((width - 2) * (height - 2), 1)
+    entropy = -sum(n / size * math.log2(n / size) for n in Counter(gray).values())
+    return FrameStats(
+        mean=sum(gray) / size,
+        sharpness=total_squares / count - (total / count) ** 2,
+        entropy=entropy,
+    )
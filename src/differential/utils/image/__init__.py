@@ -1,6 +1,7 @@
 from pathlib import Path
 from typing import Generator
 from differential.utils.image.types import ImageUploaded
+from differential.utils.image.buffer import ImageBuffer, image_file
 from differential.utils.image.byr import byr_upload
 from differential.utils.image.hdbits import hdbits_upload
 from differential.utils.image.imgbox import imgbox_upload
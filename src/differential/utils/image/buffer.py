@@ -0,0 +1,42 @@
+import io
+from pathlib import Path
+from typing import BinaryIO, Tuple, Union
+
+
+class ImageBuffer:
+    """
+    An image held in memory, named after the file it is kept as, so the
+    uploaders and their upload cache treat it like that file.
+    """
+
+    def __init__(self, path: Path, data: bytes):
+        self.path = Path(path)
+        self.data = data
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def stem(self) -> str:
+        return self.path.stem
+
+    @property
+    def parent(self) -> Path:
+        return self.path.parent
+
+    def __fspath__(self) -> str:
+        return str(self.path)
+
+    def __lt__(self, other) -> bool:
+        return str(self) < str(other)
+
+    def __str__(self) -> str:
+        return str(self.path)
+
+
+def image_file(img: Union[Path, ImageBuffer]) -> Tuple[str, BinaryIO]:
+    """(file name, content) of an image for a multipart upload, read from memory when it is there."""
+    if isinstance(img, ImageBuffer):
+        return img.name, io.BytesIO(img.data)
+    return img.name, open(img, "rb")
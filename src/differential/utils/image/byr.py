@@ -6,6 +6,7 @@ import requests
 from loguru import logger
 
 from differential.constants import ImageHosting
+from differential.utils.image.buffer import image_file
 from differential.utils.image.types import ImageUploaded
 
 # TODO
@@ -49,7 +50,7 @@ def byr_upload(images: List[Path], cookie: Optional[str], url: Optional[str] = N
 def _byr_upload(img: Path, cookie: str, url: Optional[str] = None) -> Optional[ImageUploaded]:
     headers = {'cookie': cookie}
     data = {'type': 'torrent'}
-    files = {'file': open(img, 'rb')}
+    files = {'file': image_file(img)}
 
     req = requests.post(f"{'https://byr.pt' if not url else url}/uploadimage.php", data=data, files=files, headers=headers)
 
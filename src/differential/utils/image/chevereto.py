@@ -7,6 +7,7 @@ import requests
 from loguru import logger
 
 from differential.constants import ImageHosting
+from differential.utils.image.buffer import image_file
 from differential.utils.image.types import ImageUploaded
 
 sessions = {}
@@ -35,7 +36,7 @@ def chevereto_upload(images: List[Path], url: Optional[str], api_key: Optional[s
 
 def chevereto_api_upload(img: Path, url: str, api_key: str) -> Optional[ImageUploaded]:
     data = {'key': api_key}
-    files = {'source': open(img, 'rb')}
+    files = {'source': image_file(img)}
     req = requests.post(f'{url}/api/1/upload', data=data, files=files)
 
     try:
@@ -61,7 +62,7 @@ def chevereto_api_upload(img: Path, url: str, api_key: str) -> Optional[ImageUpl
 def chevereto_cookie_upload(img: Path, url: str, cookie: str, auth_token: str) -> Optional[ImageUploaded]:
     headers = {'cookie': cookie}
     data = {'type': 'file', 'action': 'upload', 'nsfw': 0, 'auth_token': auth_token}
-    files = {'source': open(img, 'rb')}
+    files = {'source': image_file(img)}
     req = requests.post(f'{url}/json', data=data, files=files, headers=headers)
 
     try:
@@ -113,7 +114,7 @@ def with_session(func):
 @with_session
 def chevereto_username_upload(session: requests.Session, img: Path, url: str, auth_token: str) -> Optional[ImageUploaded]:
     data = {'type': 'file', 'action': 'upload', 'nsfw': 0, 'auth_token': auth_token}
-    files = {'source': open(img, 'rb')}
+    files = {'source': image_file(img)}
     req = session.post(f'{url}/json', data=data, files=files)
 
     try:
@@ -10,6 +10,7 @@ import requests
 from loguru import logger
 
 from differential.constants import ImageHosting
+from differential.utils.image.buffer import image_file
 from differential.utils.image.types import ImageUploaded
 
 
@@ -38,7 +39,7 @@ def _cloudinary_upload(img: Path, folder_name: str, cloud_name: str, api_key: st
     data['signature'] = hashlib.sha1(serialized.encode('utf-8')).hexdigest()
     data['api_key'] = api_key
     files = {
-        'file': open(img, "rb"),
+        'file': image_file(img),
     }
 
     req = requests.post(f'https://api.cloudinary.com/v1_1/{cloud_name}/image/upload', data=data, files=files)
@@ -10,6 +10,7 @@ from loguru import logger
 from lxml.html import fromstring
 
 from differential.constants import ImageHosting
+from differential.utils.image.buffer import image_file
 from differential.utils.image.types import ImageUploaded
 
 
@@ -46,7 +47,7 @@ def hdbits_upload(
             "existgallery": 1,
         }
         files = {
-            "file": open(img, "rb"),
+            "file": image_file(img),
         }
         req = requests.post(
             f"https://img.hdbits.org/upload.php?uploadid={uploadid}",
@@ -6,6 +6,7 @@ import requests
 from loguru import logger
 
 from differential.constants import ImageHosting
+from differential.utils.image.buffer import image_file
 from differential.utils.image.types import ImageUploaded
 
 
@@ -103,7 +104,7 @@ def imgbox_upload(
                 "comments_enabled": str(int(allow_comment)),
             }
             files = {
-                "files[]": open(img, "rb"),
+                "files[]": image_file(img),
             }
             req = session.post(
                 "https://imgbox.com/upload/process",
@@ -6,6 +6,7 @@ import requests
 from loguru import logger
 
 from differential.constants import ImageHosting
+from differential.utils.image.buffer import image_file
 from differential.utils.image.types import ImageUploaded
 
 
@@ -31,7 +32,7 @@ def imgurl_upload(images: List[Path], url: Optional[str], api_key: Optional[str]
 
 def _imgurl_upload(img: Path, url: str, api_key: str) -> Optional[ImageUploaded]:
     data = {'token': api_key}
-    files = {'file': open(img, 'rb')}
+    files = {'file': image_file(img)}
     req = requests.post(f'{url}/api/upload', data=data, files=files)
 
     try:
@@ -7,6 +7,7 @@ import requests
 from loguru import logger
 
 from differential.constants import ImageHosting
+from differential.utils.image.buffer import image_file
 from differential.utils.image.types import ImageUploaded
 
 tokens = {}
@@ -48,7 +49,7 @@ def lsky_api_upload(img: Path, url: str, token: str) -> Optional[ImageUploaded]:
     if not token.startswith("Bearer "):
         token = f"Bearer {token}"
     headers = {"Authorization": token, "Accept": "application/json"}
-    files = {"file": open(img, "rb")}
+    files = {"file": image_file(img)}
     logger.info(f"正在上传图片: {img.name}")
     req = requests.post(f"{url}/api/v1/upload", headers=headers, files=files)
 
@@ -6,6 +6,7 @@ import requests
 from loguru import logger
 
 from differential.constants import ImageHosting
+from differential.utils.image.buffer import image_file
 from differential.utils.image.types import ImageUploaded
 
 
@@ -20,7 +21,7 @@ def ptpimg_upload(imgs: List[Path], api_key: str) -> List[ImageUploaded]:
 
 
 def _ptpimg_upload(img: Path, api_key: str) -> Optional[ImageUploaded]:
-    files = {'file-upload[0]': open(img, 'rb')}
+    files = {'file-upload[0]': image_file(img)}
     req = requests.post('https://ptpimg.me/upload.php', data={'api_key': api_key}, files=files)
 
     try:
@@ -6,6 +6,7 @@ import requests
 from loguru import logger
 
 from differential.constants import ImageHosting
+from differential.utils.image.buffer import image_file
 from differential.utils.image.types import ImageUploaded
 
 
@@ -24,7 +25,7 @@ def smms_upload(images: List[Path], api_key: Optional[str]) -> List[ImageUploade
 
 def _smms_upload(img: Path, api_key: str) -> Optional[ImageUploaded]:
     headers = {'Authorization': api_key}
-    files = {'smfile': open(img, 'rb'), 'format': 'json'}
+    files = {'smfile': image_file(img), 'format': 'json'}
     req = requests.post('https://sm.ms/api/v2/upload', headers=headers, files=files)
 
     try:
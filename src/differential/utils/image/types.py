@@ -21,6 +21,8 @@ class ImageUploaded:
             return None
 
     def __post_init__(self):
+        # An in-memory image is recorded as the file it is kept as
+        self.image = Path(self.image)
         with open(self.image.parent.joinpath(f".{self.image.stem}.{self.hosting.value}"), 'wb') as f:
             pickle.dump(self, f)
 
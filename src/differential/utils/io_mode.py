@@ -0,0 +1,56 @@
+import os
+import mmap
+from typing import BinaryIO, Optional
+
+
+# "buffered" reads through the page cache like any other program. "stream"
+# hints the kernel that files are read once front to back and drops every
+# page after it was hashed, so a large payload does not push the seeding
+# client's hot data out of the page cache.
+IO_MODES = ("buffered", "stream")
+PAGE_SIZE = mmap.PAGESIZE
+
+_io_mode = "buffered"
+
+
+def set_io_mode(mode: Optional[str]) -> None:
+    global _io_mode
+    mode = mode or "buffered"
+    if mode not in IO_MODES:
+        raise ValueError(f"不支持的I/O模式: {mode}，可选: {', '.join(IO_MODES)}")
+    _io_mode = mode
+
+
+def get_io_mode() -> str:
+    return _io_mode
+
+
+def streaming(mode: Optional[str] = None) -> bool:
+    return (mode or _io_mode) == "stream" and hasattr(os, "posix_fadvise")
+
+
+def open_for_read(path, sequential: bool = True, mode: Optional[str] = None) -> BinaryIO:
+    """
+    Open `path` for reading. In stream mode the file is unbuffered, since
+    reads go straight into the caller's buffer, and the kernel is told to
+    read ahead aggressively when `sequential`.
+    """
+    if not streaming(mode):
+        return open(path, "rb")
+    handle = open(path, "rb", buffering=0)
+    if sequential:
+        os.posix_fadvise(handle.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    return handle
+
+
+def release(handle: BinaryIO, start: int, end: int, mode: Optional[str] = None) -> None:
+    """
+    Drop the whole pages of `[start, end)` from the page cache in stream
+    mode. The partial page at `end` is kept for the read that follows.
+    """
+    if not streaming(mode):
+        return
+    start = start // PAGE_SIZE * PAGE_SIZE
+    end = end // PAGE_SIZE * PAGE_SIZE
+    if end > start:
+        os.posix_fadvise(handle.fileno(), start, end - start, os.POSIX_FADV_DONTNEED)
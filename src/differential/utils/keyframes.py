@@ -0,0 +1,278 @@
+import json
+import bisect
+import hashlib
+import platform
+import subprocess
+from decimal import Decimal
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+from differential.utils.binary import execute
+from differential.utils.cache import BlobCache
+
+
+KEYFRAMES_CACHE_NAME = "keyframes"
+KEYFRAMES_CACHE_SIZE = 8 * 1024 * 1024
+MATROSKA_SUFFIXES = (".mkv", ".mka", ".webm")
+# Seconds searched on each side of a screenshot for its keyframe when the index is probed in windows
+KEYFRAME_WINDOW = 10.0
+
+# Matroska element IDs, with their length marker
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMESTAMP_SCALE = 0x2AD7B1
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_TYPE = 0x83
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_TRACK = 0xF7
+CLUSTER = 0x1F43B675
+
+DEFAULT_TIMESTAMP_SCALE = 1000000
+MATROSKA_VIDEO_TRACK = 1
+
+
+def keyframe_index(
+    path: Path,
+    media_input: Optional[str] = None,
+    cache_key: Optional[str] = None,
+    timeout: Optional[float] = None,
+    windows: Optional[Sequence[Tuple[float, float]]] = None,
+) -> List[float]:
+    """
+    Presentation times in seconds of the video keyframes of `path`, from the
+    start of the file. Matroska cues are read directly; other containers are
+    probed with ffprobe, only inside `windows` ((start, end) in seconds) when
+    given instead of over every packet. With a `cache_key` the result, empty
+    ones included, is kept in the cache so a failed probe is not repeated.
+    """
+    cache = BlobCache(KEYFRAMES_CACHE_NAME, KEYFRAMES_CACHE_SIZE) if cache_key else None
+    key = hashlib.sha256(f"keyframes\0{cache_key}\0{windows}".encode()).hexdigest() if cache_key else None
+    if key:
+        cached = cache.get(key)
+        if cached is not None:
+            try:
+                keyframes = json.loads(cached.decode("utf-8"))
+                logger.info(f"[Keyframes] 命中缓存: {path}")
+                return keyframes
+            except ValueError as e:
+                logger.warning(f"[Keyframes] 缓存损坏，重新生成: {e}")
+
+    keyframes = None
+    if media_input is None and path.suffix.lower() in MATROSKA_SUFFIXES:
+        try:
+            keyframes = read_matroska_cues(path)
+        except (OSError, ValueError, IndexError) as e:
+            logger.debug(f"[Keyframes] 无法读取Matroska索引: {path}: {e}")
+    if keyframes is None:
+        logger.info(f"[Keyframes] 正在用ffprobe生成关键帧索引: {path}")
+        keyframes = probe_keyframes(media_input or path, timeout, windows)
+    if key:
+        cache.put(key, json.dumps(keyframes).encode("utf-8"))
+    return keyframes
+
+
+def probe_keyframes(
+    source: Union[Path, str], timeout: Optional[float] = None, windows: Optional[Sequence[Tuple[float, float]]] = None
+) -> List[float]:
+    """
+    Keyframe times from the packet flags of the first video stream, relative
+    to the file's start time. With `windows` ffprobe seeks to each of them and
+    reads only their packets.
+    """
+    source = str(source.absolute()) if isinstance(source, Path) else source
+    if platform.system() != "Windows":
+        source = source.replace('"', '\\"')
+    try:
+        intervals = ""
+        if windows:
+            # -read_intervals seeks by absolute timestamp, so shift by the start time first
+            offset = _start_time(source, timeout)
+            intervals = " -read_intervals " + ",".join(
+                f"{offset + max(start, 0):.3f}%{offset + end:.3f}" for start, end in windows
+            )
+        output = execute(
+            "ffprobe",
+            f"-v quiet -select_streams v:0 -show_entries packet=pts_time,flags:format=start_time -of csv{intervals} "
+            f'-i "{source}"',
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        logger.warning(f"[Keyframes] ffprobe超过{timeout}秒未完成，已终止")
+        return []
+
+    start_time = 0.0
+    keyframes = []
+    for line in output.splitlines():
+        fields = line.strip().split(",")
+        try:
+            if fields[0] == "packet" and len(fields) >= 3 and "K" in fields[2]:
+                keyframes.append(float(fields[1]))
+            elif fields[0] == "format" and len(fields) >= 2:
+                start_time = float(fields[1])
+        except ValueError:
+            # pts_time is N/A for packets without a timestamp
+            continue
+    return sorted({round(t - start_time, 6) for t in keyframes})
+
+
+def _start_time(source: str, timeout: Optional[float] = None) -> float:
+    output = execute("ffprobe", f'-v quiet -show_entries format=start_time -of csv=p=0 -i "{source}"', timeout=timeout)
+    try:
+        return float(output.split()[0])
+    except (IndexError, ValueError):
+        return 0.0
+
+
+def read_matroska_cues(path: Path) -> Optional[List[float]]:
+    """
+    Keyframe times from the Cues of a Matroska file, without reading any
+    cluster. None when the file has no cues to read.
+    """
+    with open(path, "rb") as f:
+        element, payload, size = _element_header(f, 0)
+        if element != EBML_HEADER:
+            raise ValueError("not a Matroska file")
+        element, segment, _ = _element_header(f, payload + size)
+        if element != SEGMENT:
+            raise ValueError("no Matroska segment")
+
+        # Top level elements up to the first cluster; the seek head points at the rest
+        found: Dict[int, Tuple[int, int]] = {}
+        positions: Dict[int, int] = {}
+        pos = segment
+        while True:
+            try:
+                element, payload, size = _element_header(f, pos)
+            except (ValueError, IndexError):
+                break
+            if element == CLUSTER or size is None:
+                break
+            if element in (INFO, TRACKS, CUES):
+                found.setdefault(element, (payload, size))
+            elif element == SEEK_HEAD:
+                for seek in _children(_read(f, payload, size), SEEK):
+                    entries = dict(_child_values(seek))
+                    if SEEK_ID in entries and SEEK_POSITION in entries:
+                        seek_id = int.from_bytes(entries[SEEK_ID], "big")
+                        positions.setdefault(seek_id, segment + int.from_bytes(entries[SEEK_POSITION], "big"))
+            pos = payload + size
+        for element in (INFO, TRACKS, CUES):
+            if element not in found and element in positions:
+                found_element, payload, size = _element_header(f, positions[element])
+                if found_element == element and size is not None:
+                    found[element] = (payload, size)
+        if CUES not in found:
+            return None
+
+        scale = DEFAULT_TIMESTAMP_SCALE
+        if INFO in found:
+            for element, value in _child_values(_read(f, *found[INFO])):
+                if element == TIMESTAMP_SCALE:
+                    scale = int.from_bytes(value, "big")
+        video_tracks = set()
+        if TRACKS in found:
+            for entry in _children(_read(f, *found[TRACKS]), TRACK_ENTRY):
+                values = dict(_child_values(entry))
+                if int.from_bytes(values.get(TRACK_TYPE, b""), "big") == MATROSKA_VIDEO_TRACK:
+                    video_tracks.add(int.from_bytes(values.get(TRACK_NUMBER, b""), "big"))
+
+        times = set()
+        for point in _children(_read(f, *found[CUES]), CUE_POINT):
+            cue_time, tracks = None, set()
+            for element, value in _child_values(point):
+                if element == CUE_TIME:
+                    cue_time = int.from_bytes(value, "big")
+                elif element == CUE_TRACK_POSITIONS:
+                    tracks.update(int.from_bytes(v, "big") for e, v in _child_values(value) if e == CUE_TRACK)
+            if cue_time is not None and (not video_tracks or tracks & video_tracks):
+                times.add(cue_time)
+    return [round(t * scale / 1e9, 6) for t in sorted(times)]
+
+
+def snap_timestamps(targets_ms: Sequence, keyframes: Sequence[float], max_distance_ms: Optional[float] = None) -> List:
+    """
+    Move every target (in ms) to the nearest keyframe no other target took.
+    Targets keep their time when there are no keyframes left to pick within
+    `max_distance_ms`.
+    """
+    keyframes_ms = [Decimal(round(t * 1000000)) / 1000 for t in keyframes]
+    used = set()
+    snapped = []
+    for target in targets_ms:
+        after = bisect.bisect_left(keyframes_ms, target)
+        before = after - 1
+        while before in used:
+            before -= 1
+        while after in used:
+            after += 1
+        candidates = [i for i in (before, after) if 0 <= i < len(keyframes_ms)]
+        if max_distance_ms is not None:
+            candidates = [i for i in candidates if abs(keyframes_ms[i] - target) <= max_distance_ms]
+        if not candidates:
+            snapped.append(target)
+            continue
+        choice = min(candidates, key=lambda i: abs(keyframes_ms[i] - target))
+        used.add(choice)
+        snapped.append(keyframes_ms[choice])
+    return snapped
+
+
+def _read(f: BinaryIO, pos: int, size: int) -> bytes:
+    f.seek(pos)
+    data = f.read(size)
+    if len(data) < size:
+        raise ValueError(f"Matroska element ends early at {pos + len(data)}")
+    return data
+
+
+def _vint(data: bytes, pos: int, keep_marker: bool) -> Tuple[Optional[int], int]:
+    first = data[pos]
+    if first == 0:
+        raise ValueError(f"invalid EBML number at {pos}")
+    length = 9 - first.bit_length()
+    value = first if keep_marker else first & ((1 << (8 - length)) - 1)
+    for byte in data[pos + 1 : pos + length]:
+        value = (value << 8) | byte
+    if pos + length > len(data):
+        raise ValueError(f"EBML number cut off at {pos}")
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        # Unknown size, as in live streams
+        return None, length
+    return value, length
+
+
+def _element_header(f: BinaryIO, pos: int) -> Tuple[int, int, Optional[int]]:
+    """(element ID, payload position, payload size) of the element at `pos`."""
+    f.seek(pos)
+    data = f.read(12)
+    element, id_length = _vint(data, 0, keep_marker=True)
+    size, size_length = _vint(data, id_length, keep_marker=False)
+    return element, pos + id_length + size_length, size
+
+
+def _child_values(data: bytes):
+    pos = 0
+    while pos < len(data):
+        element, id_length = _vint(data, pos, keep_marker=True)
+        size, size_length = _vint(data, pos + id_length, keep_marker=False)
+        start = pos + id_length + size_length
+        if size is None:
+            size = len(data) - start
+        yield element, data[start : start + size]
+        pos = start + size
+
+
+def _children(data: bytes, element_id: int) -> List[bytes]:
+    return [value for element, value in _child_values(data) if element == element_id]
@@ -1,6 +1,9 @@
 import hashlib
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import List, Optional
+
+from differential.utils.io_mode import open_for_read, release
+from differential.utils.tree_scan import ScannedFile, TreeSnapshot, scan_tree
 
 
 IDENTITY_VERSION = "v1"
@@ -23,17 +26,32 @@ def sampled_file_hash(path: Path, sample_size: int = SAMPLE_SIZE) -> str:
     else:
         offsets = [0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)]
 
-    with path.open("rb") as handle:
+    buffer = bytearray(sample_size)
+    with open_for_read(path, sequential=False) as handle:
         for offset in offsets:
             handle.seek(offset)
+            read = _read_fully(handle, buffer)
+            release(handle, offset, offset + read)
             digest.update(str(offset).encode("ascii"))
             digest.update(b"\0")
-            digest.update(handle.read(sample_size))
+            digest.update(memoryview(buffer)[:read])
             digest.update(b"\0")
 
     return digest.hexdigest()
 
 
+def _read_fully(handle, buffer: bytearray) -> int:
+    """Fill `buffer` from `handle` until it is full or the file ends; unbuffered reads may come back short."""
+    view = memoryview(buffer)
+    filled = 0
+    while filled < len(view):
+        read = handle.readinto(view[filled:])
+        if not read:
+            break
+        filled += read
+    return filled
+
+
 def media_file_identity(path: Path) -> str:
     path = Path(path)
     size = path.stat().st_size
@@ -46,42 +64,42 @@ def media_file_identity(path: Path) -> str:
     return digest.hexdigest()
 
 
-def bdmv_identity(folder: Path) -> str:
+def bdmv_identity(folder: Path, tree: Optional[TreeSnapshot] = None) -> str:
     folder = Path(folder)
     digest = hashlib.sha256()
     digest.update(IDENTITY_VERSION.encode("ascii"))
     digest.update(b"\0bdmv\0")
 
-    files = list(_bdmv_relevant_files(folder))
-    for file_path in files:
-        relative = file_path.relative_to(folder).as_posix().lower()
-        digest.update(relative.encode("utf-8", errors="surrogateescape"))
+    files = _bdmv_relevant_files(folder, tree)
+    for f in files:
+        digest.update(f.relative.lower().encode("utf-8", errors="surrogateescape"))
         digest.update(b"\0")
-        digest.update(str(file_path.stat().st_size).encode("ascii"))
+        digest.update(str(f.size).encode("ascii"))
         digest.update(b"\0")
 
     streams = sorted(
-        (path for path in files if path.suffix.lower() == ".m2ts"),
-        key=lambda path: path.stat().st_size,
+        (f for f in files if f.suffix == ".m2ts"),
+        key=lambda f: f.size,
         reverse=True,
     )[:BDMV_HASHED_STREAMS]
     for stream in streams:
-        relative = stream.relative_to(folder).as_posix().lower()
         digest.update(b"stream-hash\0")
-        digest.update(relative.encode("utf-8", errors="surrogateescape"))
+        digest.update(stream.relative.lower().encode("utf-8", errors="surrogateescape"))
         digest.update(b"\0")
-        digest.update(sampled_file_hash(stream).encode("ascii"))
+        digest.update(sampled_file_hash(stream.path).encode("ascii"))
         digest.update(b"\0")
 
     return digest.hexdigest()
 
 
-def media_identity(path: Path, main_file: Optional[Path] = None, is_bdmv: bool = False) -> str:
+def media_identity(
+    path: Path, main_file: Optional[Path] = None, is_bdmv: bool = False, tree: Optional[TreeSnapshot] = None
+) -> str:
     path = Path(path)
     if path.is_file():
         return media_file_identity(path)
     if is_bdmv:
-        return bdmv_identity(path)
+        return bdmv_identity(path, tree)
     if main_file:
         return media_file_identity(Path(main_file))
     raise ValueError(f"cannot build stable media identity without a main file: {path}")
@@ -91,10 +109,8 @@ def bdinfo_cache_key(identity: str) -> str:
     return f"Differential.bdinfo.{BDINFO_CACHE_VERSION}.{identity}"
 
 
-def _bdmv_relevant_files(folder: Path) -> Iterable[Path]:
-    roots = [folder / "BDMV", folder / "CERTIFICATE"]
-    files = []
-    for root in roots:
-        if root.is_dir():
-            files.extend(path for path in root.rglob("*") if path.is_file())
-    return sorted(files, key=lambda path: path.relative_to(folder).as_posix().lower())
+def _bdmv_relevant_files(folder: Path, tree: Optional[TreeSnapshot] = None) -> List[ScannedFile]:
+    """Files under BDMV and CERTIFICATE; reuses the handler's `tree` of `folder` when there is one."""
+    if tree is None or Path(tree.root) != folder:
+        tree = scan_tree(folder)
+    return tree.files_under("BDMV", "CERTIFICATE")
@@ -1,40 +1,227 @@
-import re
+import os
+import hashlib
+import functools
+import multiprocessing
 from pathlib import Path
 from decimal import Decimal
-from typing import Optional, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Optional, List, Sequence, Tuple
 
+import pymediainfo
 from loguru import logger
 from pymediainfo import Track, MediaInfo
 
-from differential.utils.binary import ffprobe
+from differential.utils.binary import ffprobe_json
+from differential.utils.cache import BlobCache
+from differential.utils.media_identity import bdinfo_cache_key, media_file_identity
+
+
+MEDIAINFO_CACHE_NAME = "mediainfo"
+MEDIAINFO_CACHE_SIZE = 64 * 1024 * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def mediainfo_library_version() -> Tuple[str, Tuple[int, ...]]:
+    try:
+        lib, handle, version_str, version = MediaInfo._get_library()
+        lib.MediaInfo_Delete(handle)
+        return version_str, version
+    except Exception as e:
+        logger.debug(f"[MediaInfo] 无法获取libmediainfo版本: {e}")
+        return "unknown", ()
+
+
+def parse_mediainfo(path: Path, cache_key: Optional[str] = None, source: Optional[BinaryIO] = None) -> MediaInfo:
+    """
+    Parse `path` with libmediainfo. With a `cache_key` the XML report is kept
+    in the cache and a later call for the same media and the same
+    libmediainfo/pymediainfo build is rebuilt from it without touching the
+    file. A seekable `source` is read instead of `path`, e.g. a file inside
+    an unmounted image.
+    """
+    if not cache_key:
+        return _with_complete_name(MediaInfo.parse(source or path), path, source)
+
+    key = _report_cache_key(cache_key)
+    cache = BlobCache(MEDIAINFO_CACHE_NAME, MEDIAINFO_CACHE_SIZE)
+    media_info = _cached_report(cache, key, path)
+    if media_info is not None:
+        return _with_complete_name(media_info, path, source)
+
+    xml = _parse_xml(source or path)
+    cache.put(key, xml.encode("utf-8"))
+    return _with_complete_name(MediaInfo(xml), path, source)
+
+
+def _report_cache_key(cache_key: str) -> str:
+    version_str, _ = mediainfo_library_version()
+    return hashlib.sha256(
+        f"{cache_key}\0libmediainfo {version_str}\0pymediainfo {pymediainfo.__version__}".encode()
+    ).hexdigest()
+
+
+def _cached_report(cache: BlobCache, key: str, path: Path) -> Optional[MediaInfo]:
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    try:
+        media_info = MediaInfo(cached.decode("utf-8"))
+    except Exception as e:
+        logger.warning(f"[MediaInfo] 缓存损坏，重新解析: {e}")
+        return None
+    logger.info(f"[MediaInfo] 命中缓存: {path}")
+    return media_info
+
+
+def _parse_xml(source) -> str:
+    """The XML report of `source`, a path or a seekable stream."""
+    _, version = mediainfo_library_version()
+    # The XML option was renamed to OLDXML in libmediainfo 17.10, same as pymediainfo does
+    return MediaInfo.parse(source, output="OLDXML" if not version or version >= (17, 10) else "XML")
+
+
+def _with_complete_name(media_info: MediaInfo, path: Path, source: Optional[BinaryIO]) -> MediaInfo:
+    # libmediainfo has no file name for a stream it was handed
+    if source is not None:
+        for track in media_info.general_tracks:
+            if not getattr(track, "complete_name", None):
+                track.complete_name = str(path)
+    return media_info
+
+
+ALTERNATIVE_NAMES = {
+    "ID": "track_id",
+    "Format/Info": "format_info",
+    "Codec ID/Info": "codec_id_info",
+    "Channel(s)": "channel_s",
+    "Bits/(Pixel*Frame)": "bits__pixel_frame",
+}
+
+TRACK_FORMAT = {
+    "general": [
+        "Unique ID",
+        "Complete name",
+        "Format",
+        "Format version",
+        "File Size",
+        "Duration",
+        "Overall bit rate",
+        "Encoded date",
+        "Writing application",
+        "Writing library",
+        "Attachments",
+    ],
+    "video": [
+        "ID",
+        "Format",
+        "Format/Info",
+        "Format profile",
+        "Codec ID",
+        "Duration",
+        "Bit rate",
+        "Width",
+        "Height",
+        "Display aspect ratio",
+        "Frame rate mode",
+        "Frame rate",
+        "Color space",
+        "Chroma subsampling",
+        "Bit depth",
+        "Bits/(Pixel*Frame)",
+        "Stream size",
+        "Writing library",
+        "Encoding settings",
+        "Title",
+        "Default",
+        "Forced",
+        "Color range",
+        "Color primaries",
+        "Transfer characteristics",
+        "Matrix coefficients",
+        "Mastering display color primaries",
+        "Mastering display luminance",
+        "Maximum Content Light Level",
+        "Maximum Frame-Average Light Level",
+    ],
+    "audio": [
+        "ID",
+        "Format",
+        "Format/Info",
+        "Commercial name",
+        "Codec ID",
+        "Duration",
+        "Bit rate mode",
+        "Bit rate",
+        "Channel(s)",
+        "Channel layout",
+        "Sampling rate",
+        "Frame rate",
+        "Compression mode",
+        "Stream size",
+        "Title",
+        "Language",
+        "Service kind",
+        "Default",
+        "Forced",
+    ],
+    "text": [
+        "ID",
+        "Format",
+        "Muxing mode",
+        "Codec ID",
+        "Codec ID/Info",
+        "Duration",
+        "Bit rate",
+        "Count of elements",
+        "Stream size",
+        "Title",
+        "Language",
+        "Default",
+        "Forced",
+    ],
+}
+
+
+class FieldAccessor:
+    """The attribute names a MediaInfo label is looked up by, worked out once per label."""
+
+    __slots__ = ("name", "alternative", "other", "plain")
+
+    def __init__(self, name: str):
+        key = name.replace(" ", "_").lower()
+        self.name = name
+        self.alternative = ALTERNATIVE_NAMES.get(name)
+        self.other = "other_" + key
+        self.plain = key
+
+    def value(self, data: dict, use_other: bool = True) -> Optional[str]:
+        attr = None
+        if self.alternative:
+            attr = data.get(self.alternative)
+        if not attr and use_other:
+            attrs = data.get(self.other)
+            # Always get the first options
+            if attrs:
+                attr = attrs[0]
+        if not attr:
+            attr = data.get(self.plain)
+        return attr
+
+
+@functools.lru_cache(maxsize=None)
+def field_accessor(name: str) -> FieldAccessor:
+    return FieldAccessor(name)
+
+
+TRACK_FIELDS = {
+    track_name: tuple(field_accessor(name) for name in names) for track_name, names in TRACK_FORMAT.items()
+}
 
 
 def get_track_attr(
     track: Track, name: str, attr_only: bool = False, use_other: bool = True
 ) -> Optional[str]:
-    alternative_name = None
-    if name == "ID":
-        alternative_name = "track_id"
-    elif name == "Format/Info":
-        alternative_name = "format_info"
-    elif name == "Codec ID/Info":
-        alternative_name = "codec_id_info"
-    elif name == "Channel(s)":
-        alternative_name = "channel_s"
-    elif name == "Bits/(Pixel*Frame)":
-        alternative_name = "bits__pixel_frame"
-
-    attr = None
-    if alternative_name:
-        attr = getattr(track, alternative_name)
-    if not attr and use_other:
-        attrs = getattr(track, "other_" + name.replace(" ", "_").lower())
-        # Always get the first options
-        if attrs and len(attrs):
-            attr = attrs[0]
-    if not attr:
-        attr = getattr(track, name.replace(" ", "_").lower())
-
+    attr = field_accessor(name).value(vars(track), use_other)
     if attr:
         return attr if attr_only else "{}: {}".format(name, attr)
     return None
@@ -49,150 +236,208 @@ def get_track_attrs(track: Track, names: List[str], join_str: str = " ") -> str:
     return join_str.join(attrs)
 
 
-def get_full_mediainfo(mediainfo: MediaInfo) -> str:
-    track_format = {
-        "general": [
-            "Unique ID",
-            "Complete name",
-            "Format",
-            "Format version",
-            "File Size",
-            "Duration",
-            "Overall bit rate",
-            "Encoded date",
-            "Writing application",
-            "Writing library",
-            "Attachments",
-        ],
-        "video": [
-            "ID",
-            "Format",
-            "Format/Info",
-            "Format profile",
-            "Codec ID",
-            "Duration",
-            "Bit rate",
-            "Width",
-            "Height",
-            "Display aspect ratio",
-            "Frame rate mode",
-            "Frame rate",
-            "Color space",
-            "Chroma subsampling",
-            "Bit depth",
-            "Bits/(Pixel*Frame)",
-            "Stream size",
-            "Writing library",
-            "Encoding settings",
-            "Title",
-            "Default",
-            "Forced",
-            "Color range",
-            "Color primaries",
-            "Transfer characteristics",
-            "Matrix coefficients",
-            "Mastering display color primaries",
-            "Mastering display luminance",
-            "Maximum Content Light Level",
-            "Maximum Frame-Average Light Level",
-        ],
-        "audio": [
-            "ID",
-            "Format",
-            "Format/Info",
-            "Commercial name",
-            "Codec ID",
-            "Duration",
-            "Bit rate mode",
-            "Bit rate",
-            "Channel(s)",
-            "Channel layout",
-            "Sampling rate",
-            "Frame rate",
-            "Compression mode",
-            "Stream size",
-            "Title",
-            "Language",
-            "Service kind",
-            "Default",
-            "Forced",
-        ],
-        "text": [
-            "ID",
-            "Format",
-            "Muxing mode",
-            "Codec ID",
-            "Codec ID/Info",
-            "Duration",
-            "Bit rate",
-            "Count of elements",
-            "Stream size",
-            "Title",
-            "Language",
-            "Default",
-            "Forced",
-        ],
-    }
-    media_info = ""
-    for track_name in track_format.keys():
-        for idx, track in enumerate(getattr(mediainfo, "{}_tracks".format(track_name))):
-            if len(getattr(mediainfo, "{}_tracks".format(track_name))) > 1:
-                media_info += "{} #{}\n".format(track_name.capitalize(), idx + 1)
+class CompactTrack:
+    """
+    The fields one track contributes to `get_full_mediainfo`, read from the
+    pymediainfo `Track` in a single pass over its attributes.
+    """
+
+    __slots__ = ("kind", "index", "heading", "fields")
+
+    def __init__(self, kind: str, index: int, heading: str, fields: Tuple[Tuple[str, object], ...]):
+        self.kind = kind
+        self.index = index
+        self.heading = heading
+        self.fields = fields
+
+    @classmethod
+    def from_track(cls, track: Track, kind: str, index: int, heading: str) -> "CompactTrack":
+        data = vars(track)
+        fields = []
+        for accessor in TRACK_FIELDS[kind]:
+            attr = accessor.value(data)
+            if attr:
+                fields.append((accessor.name, attr))
+        return cls(kind, index, heading, tuple(fields))
+
+    @classmethod
+    def from_menu(cls, track: Track, index: int) -> "CompactTrack":
+        # Chapters are the attributes named after their timestamp, e.g. 00_01_30_000
+        data = vars(track)
+        fields = tuple(
+            (name[:-3].replace("_", ":") + "." + name[-3:], data[name]) for name in sorted(data) if name[:2].isdigit()
+        )
+        return cls("menu", index, "Menu", fields)
+
+    def render(self) -> str:
+        if self.kind == "menu":
+            return self.heading + "\n" + "".join("{} : {}\n".format(name, attr) for name, attr in self.fields) + "\n"
+        return self.heading + "\n" + "\n".join("{}: {}".format(name, attr) for name, attr in self.fields) + "\n\n"
+
+
+def compact_mediainfo(mediainfo: MediaInfo) -> List[CompactTrack]:
+    tracks = []
+    for kind in TRACK_FIELDS:
+        typed_tracks = getattr(mediainfo, "{}_tracks".format(kind))
+        for idx, track in enumerate(typed_tracks):
+            if len(typed_tracks) > 1:
+                heading = "{} #{}".format(kind.capitalize(), idx + 1)
             else:
-                media_info += "{}\n".format(track_name.capitalize())
-
-            media_info += (
-                "\n".join(
-                    filter(
-                        lambda a: a is not None,
-                        [
-                            get_track_attr(track, name)
-                            for name in track_format[track_name]
-                        ],
-                    )
-                )
-                + "\n\n"
-            )
-    # Special treatment with charters
-    for track in mediainfo.menu_tracks:
-        # Assuming there are always one menu tracks
-        media_info += "Menu\n"
-        for name in dir(track):
-            # TODO: needs improvement
-            if name[:2].isdigit():
-                media_info += "{} : {}\n".format(
-                    name[:-3].replace("_", ":") + "." + name[-3:], getattr(track, name)
-                )
-        media_info += "\n"
-    media_info.strip()
-    return media_info
+                heading = kind.capitalize()
+            tracks.append(CompactTrack.from_track(track, kind, idx, heading))
+    # Special treatment with charters, assuming there are always one menu tracks
+    for idx, track in enumerate(mediainfo.menu_tracks):
+        tracks.append(CompactTrack.from_menu(track, idx))
+    return tracks
+
+
+def get_full_mediainfo(mediainfo: MediaInfo) -> str:
+    return "".join(track.render() for track in compact_mediainfo(mediainfo))
+
+
+# Fields that change from one episode to the next even within one encode
+EPISODE_VARIABLE_FIELDS = frozenset(
+    (
+        "Unique ID",
+        "Complete name",
+        "File Size",
+        "Duration",
+        "Overall bit rate",
+        "Encoded date",
+        "Bit rate",
+        "Stream size",
+        "Count of elements",
+        "Title",
+    )
+)
+
+
+def _episode_cache_key(path: Path) -> Optional[str]:
+    try:
+        return _report_cache_key(f"{bdinfo_cache_key(media_file_identity(path))}:{path.name}")
+    except Exception as e:
+        logger.debug(f"[MediaInfo] 稳定媒体缓存Key生成失败: {e}")
+        return None
+
+
+def parse_mediainfos(files: Sequence[Path], workers: Optional[int] = None, cached: bool = True) -> List[MediaInfo]:
+    """
+    Parse every file in `files`, in order, spread over a process pool of
+    `workers` (one per core by default). Reports are looked up in and added
+    to the same cache as `parse_mediainfo`, but only here: the workers just
+    return the XML. The workers are spawned rather than forked, as other
+    threads (e.g. the torrent job) may be holding locks.
+    """
+    keys = [_episode_cache_key(Path(f)) if cached else None for f in files]
+    cache = BlobCache(MEDIAINFO_CACHE_NAME, MEDIAINFO_CACHE_SIZE) if any(keys) else None
+    reports = [_cached_report(cache, key, Path(f)) if key else None for f, key in zip(files, keys)]
+    missing = [i for i, report in enumerate(reports) if report is None]
+
+    workers = min(workers or os.cpu_count() or 1, len(missing))
+    if workers <= 1:
+        xmls = [_parse_xml(str(files[i])) for i in missing]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            xmls = list(pool.map(_parse_xml, [str(files[i]) for i in missing]))
+
+    for i, xml in zip(missing, xmls):
+        reports[i] = MediaInfo(xml)
+        if keys[i]:
+            cache.put(keys[i], xml.encode("utf-8"))
+    return reports
 
-def get_duration(main_file:Path, media_info: MediaInfo) -> Optional[Decimal]:
+
+def mediainfo_differences(reports: Dict[str, MediaInfo]) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compare the reports of a season pack, keyed by file name. Returns every
+    field that is not the same in all of them as
+    ``{"Video / Bit depth": {"10 bits": [names...], "8 bits": [...]}}``.
+    A track missing from some files shows up as "-".
+    """
+    values: Dict[str, Dict[str, object]] = {}
+    for name, report in reports.items():
+        for track in compact_mediainfo(report):
+            if track.kind == "menu":
+                continue
+            prefix = "{} #{}".format(track.kind.capitalize(), track.index + 1)
+            for field, attr in track.fields:
+                if field not in EPISODE_VARIABLE_FIELDS:
+                    values.setdefault(f"{prefix} / {field}", {})[name] = attr
+
+    differences = {}
+    for field, per_file in values.items():
+        grouped: Dict[str, List[str]] = {}
+        for name in reports:
+            grouped.setdefault(str(per_file.get(name, "-")), []).append(name)
+        if len(grouped) > 1:
+            differences[field] = grouped
+    return differences
+
+
+def format_mediainfo_differences(differences: Dict[str, Dict[str, List[str]]]) -> str:
+    lines = []
+    for field, grouped in differences.items():
+        lines.append(f"{field}:")
+        for attr, names in grouped.items():
+            lines.append(f"  {attr}: {', '.join(names)}")
+    return "\n".join(lines)
+
+
+def _video_track(media_info: MediaInfo) -> Optional[Track]:
     for track in media_info.tracks:
         if track.track_type == "Video":
-            return Decimal(track.duration)
-    logger.error(f"未找到视频Track，请检查{main_file}是否为支持的文件")
+            return track
     return None
 
-def get_resolution(main_file: Path, media_info: MediaInfo) -> Optional[str]:
-    # 利用ffprobe获取视频基本信息
-    ffprobe_out = ffprobe(main_file)
-    m = re.search(r"Stream.*?Video.*?(\d{2,5})x(\d{2,5})", ffprobe_out)
-    if not m:
-        logger.debug(ffprobe_out)
-        logger.warning("无法获取到视频的分辨率")
+
+def probe_video_stream(main_file: Path) -> dict:
+    """The first video stream of the shared ffprobe fallback probe."""
+    for stream in ffprobe_json(main_file).get("streams", []):
+        if stream.get("codec_type") == "video":
+            return stream
+    return {}
+
+
+def _decimal(value) -> Optional[Decimal]:
+    try:
+        return Decimal(str(value))
+    except (ArithmeticError, TypeError, ValueError):
         return None
 
-    # 获取视频分辨率以及长度等信息
-    width, height = int(m.group(1)), int(m.group(2))
-    for track in media_info.tracks:
-        if track.track_type == "Video":
-            pixel_aspect_ratio = Decimal(track.pixel_aspect_ratio)
-            break
-    else:
+
+def get_duration(main_file: Path, media_info: MediaInfo) -> Optional[Decimal]:
+    track = _video_track(media_info)
+    duration = _decimal(track.duration) if track else None
+    if duration is None:
+        # ffprobe reports seconds, MediaInfo milliseconds
+        seconds = _decimal(ffprobe_json(main_file).get("format", {}).get("duration"))
+        duration = seconds * 1000 if seconds is not None else None
+    if duration is None:
         logger.error(f"未找到视频Track，请检查{main_file}是否为支持的文件")
+    return duration
+
+
+def get_resolution(main_file: Path, media_info: MediaInfo) -> Optional[str]:
+    # 优先使用MediaInfo中的视频信息，只有缺少时才用ffprobe
+    track = _video_track(media_info)
+    width = _decimal(track.width) if track else None
+    height = _decimal(track.height) if track else None
+    pixel_aspect_ratio = _decimal(track.pixel_aspect_ratio) if track else None
+    if width is None or height is None or pixel_aspect_ratio is None:
+        stream = probe_video_stream(main_file)
+        if width is None or height is None:
+            width, height = _decimal(stream.get("width")), _decimal(stream.get("height"))
+        if pixel_aspect_ratio is None:
+            num, _, den = str(stream.get("sample_aspect_ratio", "")).partition(":")
+            if num.isdigit() and den.isdigit() and int(num) and int(den):
+                pixel_aspect_ratio = Decimal(num) / Decimal(den)
+    if width is None or height is None:
+        logger.warning("无法获取到视频的分辨率")
         return None
+    if pixel_aspect_ratio is None:
+        pixel_aspect_ratio = Decimal(1)
 
+    width, height = int(width), int(height)
     resolution = None
     if pixel_aspect_ratio <= 1:
         pheight = int(height * pixel_aspect_ratio) + (
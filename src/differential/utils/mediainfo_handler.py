@@ -1,27 +1,49 @@
 import glob
 import os
 import re
+import json
+import hashlib
 import sys
 import platform
 import tempfile
 import shutil
+import time
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from loguru import logger
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pymediainfo import MediaInfo
 
 from differential import tools
 from differential.version import version
+from differential.utils import bluray
 from differential.utils.binary import execute_with_output
+from differential.utils.cache import BlobCache
+from differential.utils.disc_image import DiscImage, ImageFileServer
 from differential.utils.media_identity import bdinfo_cache_key, media_identity
-from differential.utils.mediainfo import get_full_mediainfo, get_duration, get_resolution
+from differential.utils.media_name import parse_media_name
+from differential.utils.mediainfo import (
+    format_mediainfo_differences,
+    get_duration,
+    get_full_mediainfo,
+    get_resolution,
+    mediainfo_differences,
+    parse_mediainfo,
+    parse_mediainfos,
+)
 from differential.utils.privilege import run_command, run_with_sudo_fallback
+from differential.utils.tree_scan import TreeSnapshot, scan_tree
 
 
 BDINFO_ENV_VAR = "BDINFOPATH"
 BDINFO_BINARY_NAMES = ("BDInfo", "bdinfo")
+DEFAULT_BDINFO_WORKERS = 2
+BDINFO_CACHE_NAME = "bdinfo"
+DEFAULT_BDINFO_CACHE_SIZE = 32
+# Episodes of one pack are within this share of the biggest one's size; samples and extras are not
+EPISODE_MIN_SIZE_RATIO = 0.3
 
 
 def _escape_shell_path(path) -> str:
@@ -59,17 +81,19 @@ class BDInfoRunner:
     executable: str
     use_mono: bool = False
 
-    def run(self, bd_path: Path, report_dir: str) -> None:
+    def run(self, bd_path: Path, report_dir: str, playlist: Optional[str] = None) -> None:
+        """Scan the whole disc, or only `playlist` (e.g. 00800.MPLS) when given."""
         bd_path_arg = _escape_shell_path(bd_path)
         report_dir_arg = _escape_shell_path(report_dir)
+        scan_arg = f'-m "{_escape_shell_path(playlist)}"' if playlist else "-w"
 
         if self.use_mono:
             executable_arg = _escape_shell_path(self.executable)
-            args = f'"{executable_arg}" -w "{bd_path_arg}" "{report_dir_arg}"'
+            args = f'"{executable_arg}" {scan_arg} "{bd_path_arg}" "{report_dir_arg}"'
             execute_with_output("mono", args, abort=True)
             return
 
-        args = f'-w "{bd_path_arg}" "{report_dir_arg}"'
+        args = f'{scan_arg} "{bd_path_arg}" "{report_dir_arg}"'
         execute_with_output(self.executable, args, abort=True)
 
 
@@ -86,12 +110,21 @@ class MediaInfoHandler:
         create_folder: bool,
         use_short_bdinfo: bool,
         scan_bdinfo: bool,
+        bdinfo_workers: Optional[int] = None,
+        native_bdinfo: bool = False,
+        bdinfo_cache_size: Optional[int] = None,
+        probe_episodes: bool = False,
     ):
         self.folder = folder
         self.original_folder = folder
         self.create_folder = create_folder
         self.use_short_bdinfo = use_short_bdinfo
         self.scan_bdinfo = scan_bdinfo
+        self.bdinfo_workers = bdinfo_workers or DEFAULT_BDINFO_WORKERS
+        self.native_bdinfo = native_bdinfo
+        # In MB
+        self.bdinfo_cache_size = bdinfo_cache_size or DEFAULT_BDINFO_CACHE_SIZE
+        self.probe_episodes = probe_episodes
         self.media_name = self._media_name(folder)
         self.cache_key = self._sanitize_name(self.media_name)
         self.stable_cache_key: Optional[str] = None
@@ -99,9 +132,14 @@ class MediaInfoHandler:
         self.is_bdmv = False
         self.bdinfo = None
         self.main_file = None
+        self.tree: Optional[TreeSnapshot] = None
+        self.episode_mediainfos: Dict[Path, MediaInfo] = {}
+        self.episode_differences = ""
         self.iso_mount_dir: Optional[Path] = None
         self.iso_mount_parent: Optional[Path] = None
         self.iso_mount_platform: Optional[str] = None
+        self.image: Optional[DiscImage] = None
+        self.image_server: Optional[ImageFileServer] = None
 
     def find_mediainfo(self):
         """
@@ -115,9 +153,11 @@ class MediaInfoHandler:
         """
         logger.info(f"正在获取Mediainfo: {self.folder}")
         if self.folder.is_file() and self.folder.suffix.lower() == ".iso":
-            self._mount_iso()
+            if not self._open_image():
+                self._mount_iso()
 
-        self._handle_single_or_folder()
+        if not self.image:
+            self._handle_single_or_folder()
         self._set_stable_cache_key()
         if not self.main_file:
             logger.error("未找到可分析的文件，请确认路径。")
@@ -127,9 +167,15 @@ class MediaInfoHandler:
             logger.error("请先挂载ISO文件再使用。")
             sys.exit(1)
 
-        self.mediainfo = MediaInfo.parse(self.main_file)
+        if self.image:
+            with self.image.open(self._image_relative(self.main_file)) as source:
+                self.mediainfo = parse_mediainfo(self.main_file, self._mediainfo_cache_key(), source)
+        else:
+            self.mediainfo = parse_mediainfo(self.main_file, self._mediainfo_cache_key())
         logger.info(f"[MediaInfo] 已获取: {self.main_file}")
         logger.trace(self.mediainfo.to_data())
+        if self.probe_episodes:
+            self._probe_episodes()
 
         # If BDMV found, handle BDInfo
         if self.is_bdmv:
@@ -141,6 +187,12 @@ class MediaInfoHandler:
         return self.main_file
 
     def cleanup(self) -> None:
+        if self.image_server:
+            self.image_server.close()
+            self.image_server = None
+        if self.image:
+            self.image.close()
+            self.image = None
         if not self.iso_mount_dir:
             return
 
@@ -200,6 +252,29 @@ class MediaInfoHandler:
             ).returncode == 0
         return False
 
+    def _open_image(self) -> bool:
+        """Read the ISO's file system without mounting it; False if it cannot be read."""
+        try:
+            image = DiscImage(self.original_folder)
+        except Exception as e:
+            logger.warning(f"[ISO] 无法直接读取ISO，改为挂载: {e}")
+            return False
+        self.image = image
+        self.tree = image.tree()
+        self.main_file = self.tree.biggest_file
+        self.is_bdmv = self.tree.has_bdmv
+        logger.info(f"[ISO] 已直接读取{image.format}文件系统（{len(image.files)}个文件），无需挂载")
+        return True
+
+    def _image_relative(self, path: Path) -> str:
+        return path.relative_to(self.image.path).as_posix()
+
+    def _mount_image_for_bdinfo(self, playlists: Dict) -> Dict:
+        """BDInfo reads discs through the file system, so a full scan of an image still needs it mounted."""
+        playlist = playlists.get(self.image)
+        self._mount_iso()
+        return {disc: playlist for disc in self._discs()}
+
     def _mount_iso(self) -> None:
         system = platform.system()
         if system not in ("Linux", "Darwin"):
@@ -242,6 +317,29 @@ class MediaInfoHandler:
         else:
             return get_full_mediainfo(self.mediainfo)
 
+    @property
+    def media_infos(self) -> List[str]:
+        """One full MediaInfo per media file; a BDMV has none."""
+        if self.is_bdmv:
+            return []
+        if self.episode_mediainfos:
+            return [get_full_mediainfo(m) for m in self.episode_mediainfos.values()]
+        return [get_full_mediainfo(self.mediainfo)]
+
+    @property
+    def media_input(self) -> str:
+        """What ffmpeg opens for the main file; a file inside an unmounted image is served over loopback HTTP."""
+        if self.image and self.main_file:
+            if self.image_server is None:
+                self.image_server = ImageFileServer(self.image)
+            return self.image_server.url(self._image_relative(self.main_file))
+        return str(self.main_file.absolute())
+
+    @property
+    def main_file_cache_key(self) -> Optional[str]:
+        """Cache key of the main file itself, for anything derived from its streams."""
+        return self._mediainfo_cache_key() if self.main_file else None
+
     @property
     def resolution(self):
         return get_resolution(self.main_file, self.mediainfo)
@@ -273,21 +371,45 @@ class MediaInfoHandler:
                 self.main_file = self.folder
         else:
             logger.info("目标为文件夹，正在获取最大的文件...")
-            biggest_size = -1
-            biggest_file = None
-            has_bdmv = False
-
-            for f in self.folder.glob("**/*"):
-                if f.is_file():
-                    if f.suffix.lower() == ".bdmv":
-                        has_bdmv = True
-                    s = f.stat().st_size
-                    if s > biggest_size:
-                        biggest_size = s
-                        biggest_file = f
-
-            self.main_file = biggest_file
-            self.is_bdmv = has_bdmv
+            self.tree = scan_tree(self.folder)
+            self.main_file = self.tree.biggest_file
+            self.is_bdmv = self.tree.has_bdmv
+
+    def _probe_episodes(self) -> None:
+        """
+        Parse every media file of a season pack next to the main file, so
+        per-episode reports are available and mixed encodes are reported.
+        Movies with samples or extras are left alone.
+        """
+        if self.is_bdmv or not self.tree or self.image:
+            return
+        media_files = self._episode_files()
+        if len(media_files) < 2:
+            return
+
+        logger.info(f"[MediaInfo] 正在并行获取{len(media_files)}个文件的Mediainfo...")
+        others = [f for f in media_files if f != self.main_file]
+        parsed = dict(zip(others, parse_mediainfos(others, cached=bool(self.stable_cache_key))))
+        parsed[self.main_file] = self.mediainfo
+        self.episode_mediainfos = {f: parsed[f] for f in media_files}
+
+        differences = mediainfo_differences(
+            {f.relative_to(self.folder).as_posix(): m for f, m in self.episode_mediainfos.items()}
+        )
+        if differences:
+            self.episode_differences = format_mediainfo_differences(differences)
+            logger.warning(f"[MediaInfo] 各文件的参数不一致:\n{self.episode_differences}")
+
+    def _episode_files(self) -> List[Path]:
+        """Media files that parse as episodes and are close in size to the main file, which must be one of them."""
+        sizes = {f.path: f.size for f in self.tree.files}
+        main_size = sizes.get(self.main_file, 0)
+        episodes = [
+            f
+            for f in self.tree.media_files
+            if sizes[f] >= main_size * EPISODE_MIN_SIZE_RATIO and parse_media_name(f).episode is not None
+        ]
+        return episodes if self.main_file in episodes else []
 
     def _get_bdinfo(self) -> str:
         """
@@ -296,56 +418,193 @@ class MediaInfoHandler:
         """
         logger.info("[BDMV] 发现 BDMV 结构，准备扫描BDInfo...")
 
-        # Check existing BDInfo in temp
-        if cached := self._find_cached_bdinfo():
+        # Opt-in: the QUICK SUMMARY read from the playlists lacks channel layouts and bitrates
+        if self.use_short_bdinfo and self.native_bdinfo:
+            if summary := self._native_quick_summary():
+                return summary
+
+        # Only the main feature is posted, so BDInfo only needs to scan its playlist
+        playlists = self._main_playlists()
+
+        if cached := self._find_cached_bdinfo(playlists):
             logger.info("[BDMV] 已发现之前的 BDInfo，跳过重复扫描")
             return cached
 
+        runner = self._select_bdinfo_runner()
+        if runner is None:
+            if summary := self._native_quick_summary():
+                logger.warning("[BDInfo] 没有可用的BDInfo，仅能提供由播放列表生成的QUICK SUMMARY")
+                return summary
+            return "[BDINFO HERE]"
+
+        if self.image:
+            playlists = self._mount_image_for_bdinfo(playlists)
+
         # Otherwise, run BDInfo scanning
-        if self.stable_cache_key:
-            temp_dir = tempfile.mkdtemp(prefix=f"{self.stable_cache_key}.")
+        scan_key = self._scan_cache_key(playlists)
+        if scan_key:
+            temp_dir = tempfile.mkdtemp(prefix=f"{scan_key}.")
         else:
             temp_dir = tempfile.mkdtemp(prefix=f"Differential.bdinfo.{version}.", suffix=f".{self.cache_key}")
-        self._run_bdinfo_scan(temp_dir)
-        return self._collect_bdinfo_from_temp(temp_dir)
+        self._run_bdinfo_scan(temp_dir, runner, playlists)
+        return self._collect_bdinfo_from_temp(temp_dir, scan_key)
 
-    def _find_cached_bdinfo(self) -> Optional[str]:
+    def _find_cached_bdinfo(self, playlists: Optional[Dict[Path, Optional[str]]] = None) -> Optional[str]:
         """
-        Look in the temp dir for an existing BDInfo scan matching this media.
+        Reuse the reports of an earlier scan of this media and the playlists
+        it was limited to, from the BDInfo cache or from a temp dir an older
+        version scanned into.
         """
-        if self.stable_cache_key:
-            pattern = f"{glob.escape(self.stable_cache_key)}.*"
+        scan_key = self._scan_cache_key(playlists)
+        reports = self._cached_reports(scan_key)
+        if reports is None:
+            reports = self._find_temp_reports(scan_key)
+            if reports and scan_key:
+                self._store_reports(scan_key, reports)
+        return self._extract_bdinfo_text(reports) if reports else None
+
+    def _bdinfo_cache(self) -> BlobCache:
+        return BlobCache(BDINFO_CACHE_NAME, self.bdinfo_cache_size * 1024 * 1024)
+
+    @staticmethod
+    def _report_cache_key(scan_key: str) -> str:
+        return hashlib.sha256(scan_key.encode()).hexdigest()
+
+    def _cached_reports(self, scan_key: Optional[str]) -> Optional[List[str]]:
+        if not scan_key:
+            return None
+        data = self._bdinfo_cache().get(self._report_cache_key(scan_key))
+        if data is None:
+            logger.info(f"[BDInfo] 缓存未命中: {scan_key}")
+            return None
+        try:
+            reports = json.loads(data.decode("utf-8"))
+        except ValueError as e:
+            logger.warning(f"[BDInfo] 缓存损坏，重新扫描: {e}")
+            return None
+        logger.info(f"[BDInfo] 命中缓存: {scan_key}")
+        return reports
+
+    def _store_reports(self, scan_key: str, reports: List[str]) -> bool:
+        cache = self._bdinfo_cache()
+        key = self._report_cache_key(scan_key)
+        cache.put(key, json.dumps(reports, ensure_ascii=False).encode("utf-8"))
+        if key not in cache.entries:
+            logger.warning(f"[BDInfo] 报告未能写入缓存（超出{self.bdinfo_cache_size}MB上限或无法写入）")
+            return False
+        return True
+
+    def _find_temp_reports(self, scan_key: Optional[str]) -> Optional[List[str]]:
+        patterns = [f"{glob.escape(scan_key)}.*"] if scan_key else []
+        patterns.append(f"Differential.bdinfo.{glob.escape(version)}.*.{glob.escape(self.cache_key)}")
+        for pattern in patterns:
             for d in (Path(p) for p in glob.glob(str(Path(tempfile.gettempdir()).joinpath(pattern)))):
                 if d.is_dir():
-                    if txt_files := list(d.glob("*.txt")):
-                        return self._extract_bdinfo_content(txt_files)
-
-        pattern = f"Differential.bdinfo.{glob.escape(version)}.*.{glob.escape(self.cache_key)}"
-        for d in (Path(p) for p in glob.glob(str(Path(tempfile.gettempdir()).joinpath(pattern)))):
-            if d.is_dir():
-                if txt_files := list(d.glob("*.txt")):
-                    return self._extract_bdinfo_content(txt_files)
+                    if txt_files := self._report_files(d):
+                        return [txt.read_text(errors="ignore") for txt in txt_files]
         return None
 
+    def _mediainfo_cache_key(self) -> Optional[str]:
+        """The main file is part of the key, as a disc identity covers every stream on it."""
+        if not self.stable_cache_key:
+            return None
+        try:
+            relative = self.main_file.relative_to(self.folder).as_posix()
+        except ValueError:
+            relative = self.main_file.name
+        return f"{self.stable_cache_key}:{relative}"
+
     def _set_stable_cache_key(self) -> None:
         try:
             identity_root = self.folder
             if self.original_folder.is_file() and self.original_folder.suffix.lower() == ".iso":
                 identity = media_identity(self.original_folder)
             else:
-                identity = media_identity(identity_root, self.main_file, self.is_bdmv)
+                identity = media_identity(identity_root, self.main_file, self.is_bdmv, self.tree)
             self.stable_cache_key = bdinfo_cache_key(identity)
         except Exception as e:
             self.stable_cache_key = None
             logger.debug(f"[MediaInfo] 稳定媒体缓存Key生成失败: {e}")
 
-    def _run_bdinfo_scan(self, temp_dir: str) -> None:
-        runner = self._select_bdinfo_runner()
-        for bdmv_path in self.folder.glob("**/BDMV"):
-            logger.info(f"[BDInfo] 扫描: {bdmv_path.parent}")
-            runner.run(bdmv_path.parent, temp_dir)
+    def _discs(self) -> List[bluray.Disc]:
+        if self.image and not self.iso_mount_dir:
+            return [self.image] if self.is_bdmv else []
+        return sorted((p.parent for p in self.folder.glob("**/BDMV")), key=lambda p: p.as_posix().lower())
+
+    def _main_playlists(self) -> Dict[Path, Optional[str]]:
+        """The main playlist of every disc, None where the playlists cannot be read."""
+        playlists = {}
+        for disc in self._discs():
+            try:
+                playlist = bluray.main_playlist(disc)
+            except Exception as e:
+                logger.debug(f"[BDMV] 解析播放列表失败: {disc}: {e}")
+                playlist = None
+            playlists[disc] = playlist.name if playlist else None
+            if playlist:
+                logger.info(f"[BDInfo] 主播放列表: {playlist.name} ({bluray.format_length(playlist.duration)})")
+        return playlists
+
+    def _scan_cache_key(self, playlists: Optional[Dict[Path, Optional[str]]] = None) -> Optional[str]:
+        """`stable_cache_key` plus the scanned playlists, as a report of one playlist is not one of the whole disc."""
+        if not self.stable_cache_key:
+            return None
+        if not playlists or not any(playlists.values()):
+            return self.stable_cache_key
+        names = "-".join(Path(name).stem if name else "all" for name in playlists.values())
+        return f"{self.stable_cache_key}.mpls-{names}"
+
+    def _native_quick_summary(self) -> Optional[str]:
+        """QUICK SUMMARY of every disc read straight from its MPLS/CLPI files, None if any disc fails."""
+        started = time.monotonic()
+        summaries = []
+        for disc in self._discs():
+            try:
+                summary = bluray.quick_summary(disc)
+            except Exception as e:
+                logger.debug(f"[BDMV] 解析播放列表失败: {disc}: {e}")
+                summary = None
+            if not summary:
+                logger.info(f"[BDMV] 无法从播放列表生成QUICK SUMMARY: {disc}")
+                return None
+            summaries.append(summary)
+        if not summaries:
+            return None
+        logger.info(f"[BDMV] 已从播放列表生成QUICK SUMMARY，用时{time.monotonic() - started:.2f}秒")
+        return "\n\n".join(summaries)
+
+    def _run_bdinfo_scan(
+        self,
+        temp_dir: str,
+        runner: Optional[BDInfoRunner] = None,
+        playlists: Optional[Dict[Path, Optional[str]]] = None,
+    ) -> None:
+        """
+        Scan every disc of the folder, up to `bdinfo_workers` at a time. Each
+        disc reports into its own numbered folder so the merge keeps disc order.
+        Discs with a known main playlist only have that playlist scanned.
+        """
+        runner = runner or self._select_bdinfo_runner()
+        playlists = playlists or {}
+        discs = self._discs()
+        if not discs:
+            return
 
-    def _select_bdinfo_runner(self) -> BDInfoRunner:
+        def scan(index: int, disc: Path) -> None:
+            report_dir = Path(temp_dir).joinpath(f"{index:03d}")
+            report_dir.mkdir(exist_ok=True)
+            playlist = playlists.get(disc)
+            logger.info(f"[BDInfo] 扫描: {disc}" + (f" ({playlist})" if playlist else ""))
+            runner.run(disc, str(report_dir), playlist)
+
+        workers = min(self.bdinfo_workers, len(discs))
+        if workers > 1:
+            logger.info(f"[BDInfo] 共{len(discs)}张碟，同时扫描{workers}张")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for future in [pool.submit(scan, index, disc) for index, disc in enumerate(discs)]:
+                future.result()
+
+    def _select_bdinfo_runner(self) -> Optional[BDInfoRunner]:
         bundled_bdinfo = _bundled_bdinfo_path()
         if platform.system() == "Windows":
             logger.info(f"[BDInfo] 使用内置BDInfo: {bundled_bdinfo}")
@@ -356,20 +615,35 @@ class MediaInfoHandler:
             logger.info(f"[BDInfo] 使用原生BDInfo: {native_bdinfo}")
             return BDInfoRunner("native", str(native_bdinfo))
 
+        if not shutil.which("mono"):
+            logger.warning("[BDInfo] 未找到原生BDInfo，也未安装Mono")
+            return None
+
         logger.info("[BDInfo] 未找到原生BDInfo，回退到Mono运行内置BDInfo")
         return BDInfoRunner("mono", str(bundled_bdinfo), use_mono=True)
 
-    def _collect_bdinfo_from_temp(self, temp_dir: str) -> str:
-        txt_files = sorted(Path(temp_dir).glob("*.txt"))
+    @staticmethod
+    def _report_files(report_dir: Path) -> List[Path]:
+        """Reports in disc order: a flat scan's files first, then the numbered per-disc folders."""
+        return sorted(report_dir.glob("*.txt")) + sorted(report_dir.glob("*/*.txt"))
+
+    def _collect_bdinfo_from_temp(self, temp_dir: str, scan_key: Optional[str] = None) -> str:
+        """
+        Read the reports of a finished scan. With a `scan_key` they are moved
+        into the BDInfo cache, where they outlive reboots and temp cleaners.
+        """
+        txt_files = self._report_files(Path(temp_dir))
         if not txt_files:
             logger.warning(f"[BDInfo] 未找到BDInfo信息：{temp_dir}")
             return "[BDINFO HERE]"
-        return self._extract_bdinfo_content(txt_files)
+        reports = [txt.read_text(errors="ignore") for txt in txt_files]
+        if scan_key and self._store_reports(scan_key, reports):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return self._extract_bdinfo_text(reports)
 
-    def _extract_bdinfo_content(self, txt_files: List[Path]) -> str:
+    def _extract_bdinfo_text(self, reports: List[str]) -> str:
         bdinfos = []
-        for txt in txt_files:
-            content = txt.read_text(errors="ignore")
+        for content in reports:
             if self.use_short_bdinfo:
                 # Extract QUICK SUMMARY
                 if m := re.search(r"(QUICK SUMMARY:\r?\n+(?:[^\r\n].*(?:\r?\n|$))+)", content):
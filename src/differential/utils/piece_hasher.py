@@ -0,0 +1,512 @@
+import os
+import math
+import time
+import bisect
+import random
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from differential.utils.io_mode import get_io_mode, open_for_read, release, set_io_mode
+
+
+# Each worker task covers this many bytes of pieces and reads them front to back
+TASK_SIZE = 64 * 1024 * 1024
+# Size of the reusable read buffer, rounded up to a whole number of pieces
+READ_SIZE = 8 * 1024 * 1024
+PROGRESS_INTERVAL = 1
+# BitTorrent v2 merkle trees are built over SHA-256 hashes of 16 KiB blocks
+BLOCK_SIZE = 16 * 1024
+ZERO_HASH = bytes(32)
+
+FileEntry = Tuple[str, int]
+ProgressCallback = Callable[[int, int, float], None]
+# (pieces root, piece layer, v1 pieces) of one file; the root is None for empty files
+FileHashes = Tuple[Optional[bytes], bytes, bytes]
+
+
+class HashingStopped(Exception):
+    """Raised when the `stop` event of a hashing call is set between two tasks."""
+
+
+class SpanReader:
+    """
+    Reads byte ranges from an ordered list of files as if they were one
+    contiguous stream, the way BitTorrent v1 lays out pieces. Files are
+    opened through `io_mode`, so in stream mode every range is dropped from
+    the page cache once it has been read.
+    """
+
+    def __init__(self, files: Sequence[FileEntry]):
+        self.files = [(str(path), int(size)) for path, size in files]
+        self.offsets = []
+        total = 0
+        for _, size in self.files:
+            self.offsets.append(total)
+            total += size
+        self.total_size = total
+        self._handle = None
+        self._handle_idx = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        if self._handle:
+            self._handle.close()
+        self._handle = None
+        self._handle_idx = -1
+
+    def _open(self, idx: int):
+        if idx != self._handle_idx:
+            self.close()
+            self._handle = open_for_read(self.files[idx][0])
+            self._handle_idx = idx
+        return self._handle
+
+    def readinto(self, offset: int, view: memoryview) -> int:
+        filled = 0
+        idx = bisect.bisect_right(self.offsets, offset) - 1
+        while filled < len(view) and 0 <= idx < len(self.files):
+            path, size = self.files[idx]
+            file_offset = offset + filled - self.offsets[idx]
+            if file_offset >= size:
+                idx += 1
+                continue
+            want = min(len(view) - filled, size - file_offset)
+            handle = self._open(idx)
+            handle.seek(file_offset)
+            read = handle.readinto(view[filled:filled + want])
+            if not read:
+                raise OSError(f"文件在读取时被截断: {path}")
+            release(handle, file_offset, file_offset + read)
+            filled += read
+        return filled
+
+
+def piece_count(total_size: int, piece_size: int) -> int:
+    return (total_size + piece_size - 1) // piece_size
+
+
+def read_size_for(piece_size: int) -> int:
+    return max(1, READ_SIZE // piece_size) * piece_size
+
+
+def hash_range(reader: SpanReader, piece_size: int, first_piece: int, count: int, buffer: bytearray) -> bytes:
+    start = first_piece * piece_size
+    end = min(reader.total_size, start + count * piece_size)
+    digests = []
+    offset = start
+    while offset < end:
+        view = memoryview(buffer)[:min(len(buffer), end - offset)]
+        if reader.readinto(offset, view) != len(view):
+            raise OSError(f"读取数据不完整，偏移: {offset}")
+        for p in range(0, len(view), piece_size):
+            digests.append(hashlib.sha1(view[p:p + piece_size]).digest())
+        offset += len(view)
+    return b"".join(digests)
+
+
+_worker_reader: Optional[SpanReader] = None
+_worker_buffer: Optional[bytearray] = None
+
+
+def _init_worker(files: Sequence[FileEntry], piece_size: int, io_mode: Optional[str] = None) -> None:
+    global _worker_reader, _worker_buffer
+    set_io_mode(io_mode)
+    _worker_reader = SpanReader(files)
+    _worker_buffer = bytearray(read_size_for(piece_size))
+
+
+def _worker_hash_range(piece_size: int, first_piece: int, count: int) -> bytes:
+    try:
+        return hash_range(_worker_reader, piece_size, first_piece, count, _worker_buffer)
+    finally:
+        _worker_reader.close()
+
+
+def next_power_of_two(n: int) -> int:
+    return 1 << (n - 1).bit_length() if n > 1 else 1
+
+
+def merkle_root(leaves: Sequence[bytes], width: int, pad: bytes = ZERO_HASH) -> bytes:
+    """Root of the SHA-256 merkle tree over `leaves`, padded with `pad` up to `width` (a power of two) leaves."""
+    layer = list(leaves) + [pad] * (width - len(leaves))
+    while len(layer) > 1:
+        layer = [hashlib.sha256(layer[i] + layer[i + 1]).digest() for i in range(0, len(layer), 2)]
+    return layer[0]
+
+
+def hash_file_range(
+    reader: SpanReader,
+    file_offset: int,
+    file_size: int,
+    piece_size: int,
+    first_piece: int,
+    count: int,
+    buffer: bytearray,
+    v1: bool = False,
+    pad_v1: bool = False,
+) -> Tuple[bytes, bytes]:
+    """
+    Hash pieces `first_piece`..`first_piece + count` of the file starting at
+    `file_offset` in the reader, with pieces aligned to the file start.
+
+    Returns the v2 hash of every piece (the merkle root of its blocks, padded
+    to a full piece; for a file of at most one piece the file's own root) and,
+    with `v1`, the SHA-1 of every piece, zero padded to `piece_size` when
+    `pad_v1` is set, all from the same read.
+    """
+    if file_size > piece_size:
+        width = piece_size // BLOCK_SIZE
+    else:
+        width = next_power_of_two((file_size + BLOCK_SIZE - 1) // BLOCK_SIZE)
+    start = first_piece * piece_size
+    end = min(file_size, start + count * piece_size)
+    v1_digests, v2_digests = [], []
+    offset = start
+    while offset < end:
+        view = memoryview(buffer)[:min(len(buffer), end - offset)]
+        if reader.readinto(file_offset + offset, view) != len(view):
+            raise OSError(f"读取数据不完整，偏移: {file_offset + offset}")
+        for p in range(0, len(view), piece_size):
+            piece = view[p:p + piece_size]
+            leaves = [hashlib.sha256(piece[b:b + BLOCK_SIZE]).digest() for b in range(0, len(piece), BLOCK_SIZE)]
+            v2_digests.append(merkle_root(leaves, width))
+            if v1:
+                sha1 = hashlib.sha1(piece)
+                if pad_v1 and len(piece) < piece_size:
+                    sha1.update(bytes(piece_size - len(piece)))
+                v1_digests.append(sha1.digest())
+        offset += len(view)
+    return b"".join(v1_digests), b"".join(v2_digests)
+
+
+def _worker_hash_file_range(
+    file_offset: int, file_size: int, piece_size: int, first_piece: int, count: int, v1: bool, pad_v1: bool
+) -> Tuple[bytes, bytes]:
+    try:
+        return hash_file_range(
+            _worker_reader, file_offset, file_size, piece_size, first_piece, count, _worker_buffer, v1, pad_v1
+        )
+    finally:
+        _worker_reader.close()
+
+
+def _batches(total_pieces: int, piece_size: int) -> List[Tuple[int, int]]:
+    per_task = max(1, TASK_SIZE // piece_size)
+    return [(first, min(per_task, total_pieces - first)) for first in range(0, total_pieces, per_task)]
+
+
+def _runs(indices: Sequence[int], piece_size: int) -> List[Tuple[int, int]]:
+    """Group sorted piece indices into contiguous (first, count) ranges of at most one task each."""
+    per_task = max(1, TASK_SIZE // piece_size)
+    runs = []
+    for idx in indices:
+        if runs and runs[-1][0] + runs[-1][1] == idx and runs[-1][1] < per_task:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((idx, 1))
+    return runs
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def _map_tasks(
+    files: Sequence[FileEntry],
+    piece_size: int,
+    func: Callable,
+    tasks: Sequence[tuple],
+    workers: Optional[int] = None,
+    stop: Optional[threading.Event] = None,
+) -> Iterator:
+    """
+    Yield `func(*task)` for every task, in order, with the reader and buffer
+    set up by `_init_worker`. Closing the generator early cancels the tasks
+    not started yet; so does setting `stop`, which raises `HashingStopped`.
+    Workers are spawned rather than forked, as hashing usually runs next to
+    other threads that may be holding locks.
+    """
+    global _worker_reader, _worker_buffer
+    workers = min(workers or default_workers(), len(tasks)) or 1
+    if workers <= 1:
+        _init_worker(files, piece_size, get_io_mode())
+        try:
+            for task in tasks:
+                _check_stop(stop)
+                yield func(*task)
+        finally:
+            _worker_reader.close()
+            _worker_reader = _worker_buffer = None
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=([(str(path), int(size)) for path, size in files], piece_size, get_io_mode()),
+    ) as executor:
+        futures = [executor.submit(func, *task) for task in tasks]
+        try:
+            for future in futures:
+                _check_stop(stop)
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _check_stop(stop: Optional[threading.Event]) -> None:
+    if stop is not None and stop.is_set():
+        raise HashingStopped("hashing stopped")
+
+
+def hash_ranges(
+    files: Sequence[FileEntry],
+    piece_size: int,
+    ranges: Sequence[Tuple[int, int]],
+    workers: Optional[int] = None,
+    stop: Optional[threading.Event] = None,
+) -> Iterator[bytes]:
+    """
+    Yield the concatenated piece hashes of every `(first_piece, count)` range,
+    in order. Closing the generator early cancels the ranges not started yet.
+    """
+    tasks = [(piece_size, first, count) for first, count in ranges]
+    return _map_tasks(files, piece_size, _worker_hash_range, tasks, workers, stop)
+
+
+def hash_pieces(
+    files: Sequence[FileEntry],
+    piece_size: int,
+    workers: Optional[int] = None,
+    callback: Optional[ProgressCallback] = None,
+    known: Optional[Dict[int, bytes]] = None,
+    stop: Optional[threading.Event] = None,
+) -> bytes:
+    """
+    Return the concatenated SHA-1 piece hashes of `files`.
+
+    Pieces are split into contiguous ranges; every worker process reads its
+    ranges sequentially and only sends the 20-byte digests back, so the data
+    itself never crosses a process boundary. Pieces whose digest is already
+    in `known` are not read at all. Setting `stop` raises `HashingStopped`
+    before the next range.
+    """
+    total_size = sum(size for _, size in files)
+    total_pieces = piece_count(total_size, piece_size)
+    if known:
+        batches = _runs([i for i in range(total_pieces) if i not in known], piece_size)
+    else:
+        batches = _batches(total_pieces, piece_size)
+
+    digests = bytearray(total_pieces * 20)
+    for idx, digest in (known or {}).items():
+        digests[idx * 20:(idx + 1) * 20] = digest
+    if not batches:
+        # Every piece was carried over
+        return bytes(digests)
+    progress = _Progress(sum(count for _, count in batches), piece_size, total_size, callback)
+    for (first, count), result in zip(batches, hash_ranges(files, piece_size, batches, workers, stop)):
+        digests[first * 20:(first + count) * 20] = result
+        progress.advance(count)
+    progress.finish()
+    return bytes(digests)
+
+
+def carried_pieces(
+    old_files: Sequence[FileEntry],
+    old_pieces: bytes,
+    new_files: Sequence[FileEntry],
+    piece_size: int,
+    unchanged: Collection[str],
+) -> Dict[int, bytes]:
+    """
+    Find the pieces of the new layout that can keep their old digest.
+
+    A new piece qualifies when every file it touches is in `unchanged` and
+    all of those files sit at the same shift from their old offsets, the
+    shifted start is an old piece boundary and the old piece has the same
+    length. The old piece then covers exactly the same bytes.
+    """
+    old_offsets = {}
+    old_total = 0
+    for name, size in old_files:
+        old_offsets[name] = old_total
+        old_total += size
+
+    names, starts, ends = [], [], []
+    new_total = 0
+    for name, size in new_files:
+        if size:
+            names.append(name)
+            starts.append(new_total)
+            ends.append(new_total + size)
+        new_total += size
+
+    known = {}
+    for idx in range(piece_count(new_total, piece_size)):
+        start = idx * piece_size
+        end = min(start + piece_size, new_total)
+        shift = None
+        pos = start
+        i = bisect.bisect_right(starts, start) - 1
+        while pos < end:
+            name = names[i]
+            if name not in unchanged or name not in old_offsets:
+                break
+            if shift is None:
+                shift = old_offsets[name] - starts[i]
+            elif shift != old_offsets[name] - starts[i]:
+                break
+            pos = ends[i]
+            i += 1
+        else:
+            old_start = start + shift
+            old = old_start // piece_size
+            if old_start % piece_size == 0 and min(old_start + piece_size, old_total) - old_start == end - start:
+                known[idx] = old_pieces[old * 20:(old + 1) * 20]
+    return known
+
+
+def hash_files_v2(
+    files: Sequence[FileEntry],
+    piece_size: int,
+    workers: Optional[int] = None,
+    callback: Optional[ProgressCallback] = None,
+    v1: bool = False,
+    stop: Optional[threading.Event] = None,
+) -> List[FileHashes]:
+    """
+    Hash every file into its BitTorrent v2 pieces root and piece layer. The
+    piece layer is empty for files of at most one piece, as BEP 52 leaves
+    them out of ``piece layers``.
+
+    With `v1` the same read also produces the SHA-1 pieces of the hybrid v1
+    layout, where every file starts on a piece boundary and all but the last
+    file are zero padded to a whole piece. Large files are split into ranges
+    of whole pieces, so one big file still keeps every worker busy.
+    """
+    tasks, owners = [], []
+    offset = 0
+    for idx, (_, size) in enumerate(files):
+        pad_v1 = idx < len(files) - 1
+        for first, count in _batches(piece_count(size, piece_size), piece_size):
+            tasks.append((offset, size, piece_size, first, count, v1, pad_v1))
+            owners.append(idx)
+        offset += size
+    total_size = offset
+    progress = _Progress(sum(task[4] for task in tasks), piece_size, total_size, callback)
+
+    v1_parts = [[] for _ in files]
+    v2_parts = [[] for _ in files]
+    for idx, task, (v1_digests, v2_digests) in zip(
+        owners, tasks, _map_tasks(files, piece_size, _worker_hash_file_range, tasks, workers, stop)
+    ):
+        v1_parts[idx].append(v1_digests)
+        v2_parts[idx].append(v2_digests)
+        progress.advance(task[4])
+    progress.finish()
+
+    pad = merkle_root([], piece_size // BLOCK_SIZE)
+    hashes = []
+    for (_, size), v1_digests, v2_digests in zip(files, v1_parts, v2_parts):
+        v1_digests, layer = b"".join(v1_digests), b"".join(v2_digests)
+        if not size:
+            hashes.append((None, b"", v1_digests))
+        elif size <= piece_size:
+            hashes.append((layer, b"", v1_digests))
+        else:
+            nodes = [layer[i:i + 32] for i in range(0, len(layer), 32)]
+            hashes.append((merkle_root(nodes, next_power_of_two(len(nodes)), pad), layer, v1_digests))
+    return hashes
+
+
+def sample_pieces(total_pieces: int, ratio: float, seed: Optional[int] = None) -> List[int]:
+    """
+    Pick about `ratio` of all pieces at random. The first and the last piece
+    are always included since truncated or padded payloads show up there.
+    """
+    if total_pieces <= 0:
+        return []
+    count = min(total_pieces, max(1, math.ceil(total_pieces * ratio)))
+    picked = set(random.Random(seed).sample(range(total_pieces), count))
+    picked.update({0, total_pieces - 1})
+    return sorted(picked)
+
+
+def verify_pieces(
+    files: Sequence[FileEntry],
+    piece_size: int,
+    expected: bytes,
+    workers: Optional[int] = None,
+    sample_ratio: Optional[float] = None,
+    stop_on_first: bool = True,
+    callback: Optional[ProgressCallback] = None,
+    stop: Optional[threading.Event] = None,
+) -> List[int]:
+    """
+    Compare the on-disk data with the expected piece hashes and return the
+    indices of mismatching pieces. By default the scan stops at the first
+    mismatch; with `sample_ratio` only that share of pieces is checked.
+    """
+    total_size = sum(size for _, size in files)
+    total_pieces = piece_count(total_size, piece_size)
+    if len(expected) != total_pieces * 20:
+        raise ValueError(f"piece数量不一致: 期望{len(expected) // 20}个，实际数据有{total_pieces}个")
+
+    if sample_ratio:
+        ranges = _runs(sample_pieces(total_pieces, sample_ratio), piece_size)
+    else:
+        ranges = _batches(total_pieces, piece_size)
+    progress = _Progress(sum(count for _, count in ranges), piece_size, total_size, callback)
+
+    mismatched = []
+    results = hash_ranges(files, piece_size, ranges, workers, stop)
+    try:
+        for (first, count), digests in zip(ranges, results):
+            for i in range(count):
+                idx = first + i
+                if digests[i * 20:(i + 1) * 20] != expected[idx * 20:(idx + 1) * 20]:
+                    mismatched.append(idx)
+            progress.advance(count)
+            if mismatched and stop_on_first:
+                break
+    finally:
+        results.close()
+    progress.finish()
+    return mismatched[:1] if stop_on_first else mismatched
+
+
+class _Progress:
+    def __init__(self, total_pieces: int, piece_size: int, total_size: int, callback: Optional[ProgressCallback]):
+        self.total_pieces = total_pieces
+        self.piece_size = piece_size
+        self.total_size = total_size
+        self.callback = callback
+        self.done = 0
+        self.started = time.monotonic()
+        self.reported = self.started
+
+    def advance(self, pieces: int) -> None:
+        self.done += pieces
+        now = time.monotonic()
+        if self.callback and now - self.reported >= PROGRESS_INTERVAL:
+            self.reported = now
+            self.callback(self.done, self.total_pieces, self.bytes_per_second(now))
+
+    def finish(self) -> None:
+        if self.callback and self.total_pieces:
+            self.callback(self.done, self.total_pieces, self.bytes_per_second(time.monotonic()))
+
+    def bytes_per_second(self, now: float) -> float:
+        elapsed = now - self.started
+        hashed = min(self.done * self.piece_size, self.total_size)
+        return hashed / elapsed if elapsed > 0 else 0.0
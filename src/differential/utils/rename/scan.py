@@ -2,8 +2,8 @@ from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, List, Optional
 
-from differential.utils.media_name import MEDIA_EXTENSIONS
 from differential.utils.mediainfo_handler import MediaInfoHandler
+from differential.utils.tree_scan import scan_tree
 from differential.utils.rename.formatter import normalize_audio_codec, normalize_resolution, normalize_video_codec
 
 
@@ -32,7 +32,12 @@ def scan_media(path: Path, scan_bdinfo: bool = True) -> RenameScan:
     )
     main_file = handler.find_mediainfo()
     root = path
-    media_files = [path] if path.is_file() else _find_media_files(path)
+    if path.is_file():
+        media_files = [path]
+    elif handler.tree and handler.tree.root == path:
+        media_files = handler.tree.media_files
+    else:
+        media_files = _find_media_files(path)
     resolution = handler.resolution or ""
     return RenameScan(
         root=root,
@@ -200,11 +205,4 @@ def _disc_release_type(resolution: str) -> str:
 
 
 def _find_media_files(root: Path) -> List[Path]:
-    return sorted(
-        (
-            path
-            for path in root.rglob("*")
-            if path.is_file() and path.suffix.lower() in MEDIA_EXTENSIONS
-        ),
-        key=lambda path: path.as_posix().lower(),
-    )
+    return scan_tree(root).media_files
@@ -1,16 +1,24 @@
+import io
 import os
 import shutil
 import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PIL import Image
 from loguru import logger
 from pathlib import Path
 from decimal import Decimal
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
 
 from differential.version import version
-from differential.utils.binary import execute
+from differential.utils.binary import execute, execute_bytes
+from differential.utils.frame_score import SCORE_HEIGHT, SCORE_WIDTH, frame_stats
+from differential.utils.keyframes import KEYFRAME_WINDOW, keyframe_index, snap_timestamps
+from differential.utils.mediainfo import probe_video_stream
 from differential.constants import ImageHosting, SCREENSHOT_TONEMAP_STATES
 from differential.utils.image import (
+    ImageBuffer,
     get_all_images,
     byr_upload,
     hdbits_upload,
@@ -23,6 +31,16 @@ from differential.utils.image import (
     lsky_upload,
 )
 
+
+DEFAULT_SCREENSHOT_WORKERS = 2
+# In seconds, for each ffmpeg run
+DEFAULT_SCREENSHOT_TIMEOUT = 300
+# Candidates scored per screenshot, at most this far (ms) from its evenly spaced time
+SCREENSHOT_CANDIDATES = 3
+MAX_CANDIDATE_SPREAD = 15000
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
 class ScreenshotHandler:
     """
     Manages creating (ffmpeg) and uploading screenshots
@@ -40,6 +58,12 @@ class ScreenshotHandler:
         screenshot_path: str = None,
         optimize_screenshot: bool = True,
         screenshot_tonemap: str = "auto",
+        screenshot_workers: int = None,
+        screenshot_timeout: int = None,
+        screenshot_single_pass: bool = False,
+        screenshot_keyframes: bool = True,
+        screenshot_content_aware: bool = False,
+        screenshot_in_memory: bool = False,
         image_hosting: ImageHosting = ImageHosting.PTPIMG,
         chevereto_hosting_url: str = "",
         imgurl_hosting_url: str = "",
@@ -70,6 +94,12 @@ class ScreenshotHandler:
         self.screenshot_path = screenshot_path
         self.optimize_screenshot = optimize_screenshot
         self.screenshot_tonemap = self._normalize_tonemap_mode(screenshot_tonemap)
+        self.screenshot_workers = screenshot_workers or DEFAULT_SCREENSHOT_WORKERS
+        self.screenshot_timeout = screenshot_timeout or DEFAULT_SCREENSHOT_TIMEOUT
+        self.screenshot_single_pass = screenshot_single_pass
+        self.screenshot_keyframes = screenshot_keyframes
+        self.screenshot_content_aware = screenshot_content_aware
+        self.screenshot_in_memory = screenshot_in_memory
         self.image_hosting = image_hosting
         self.chevereto_hosting_url = chevereto_hosting_url
         self.imgurl_hosting_url = imgurl_hosting_url
@@ -103,11 +133,16 @@ class ScreenshotHandler:
         resolution: str,
         duration: Decimal,
         tracks=None,
+        media_input: Optional[str] = None,
+        cache_key: Optional[str] = None,
     ) -> list:
         """
         If screenshot_path is given, use images from that folder.
-        Otherwise, generate screenshots from main_file.
-        Then upload them.
+        Otherwise, generate screenshots from main_file, which ffmpeg reads
+        from `media_input` when given (e.g. a URL into an unmounted image).
+        The keyframe index of main_file is cached under `cache_key`.
+        With screenshot_in_memory, the generated screenshots are uploaded
+        from memory. Then upload them.
         Returns a list of ImageUploaded objects.
         """
         if self.screenshot_count <= 0:
@@ -116,6 +151,12 @@ class ScreenshotHandler:
         if self.screenshot_path:
             logger.info("[Screenshots] 使用提供的截图文件夹...")
             self.screenshots = self._upload_screenshots(self.screenshot_path)
+        elif self.screenshot_in_memory:
+            logger.info("[Screenshots] 生成并上传截图...")
+            images = self._pipe_screenshots(main_file, resolution, duration, tracks, media_input, cache_key)
+            if not images:
+                return
+            self.screenshots = self._upload_images(images)
         else:
             logger.info("[Screenshots] 生成并上传截图...")
             temp_dir = self._generate_screenshots(
@@ -123,6 +164,8 @@ class ScreenshotHandler:
                 resolution,
                 duration,
                 tracks,
+                media_input,
+                cache_key,
             )
             if not temp_dir:
                 return
@@ -134,11 +177,112 @@ class ScreenshotHandler:
         resolution: str,
         duration: Decimal,
         tracks=None,
+        media_input: Optional[str] = None,
+        cache_key: Optional[str] = None,
     ) -> str:
         if not resolution or not duration:
             logger.warning("[Screenshots] 文件无法提取分辨率或时长，无法生成截图")
             return None
 
+        cached = self._cached_screenshot_dir()
+        if cached:
+            return cached
+
+        tmp_dir = tempfile.mkdtemp(prefix=f"Differential.screenshots.{version}.", suffix=f".{self.folder.name}")
+        jobs = self._screenshot_jobs(tmp_dir, main_file, duration, media_input, cache_key)
+
+        # ffmpeg runs are bounded by screenshot_workers; PNG optimization has
+        # its own pool, so it never holds up the next decode
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="optimize") as optimize_pool:
+            optimizations = []
+            if self.screenshot_single_pass:
+                done = self._grab_screenshots_in_one_run(main_file, jobs, resolution, tracks, media_input)
+                if self.optimize_screenshot:
+                    optimizations.extend(optimize_pool.submit(self._optimize_screenshot, path) for path in done)
+                jobs = [job for job in jobs if job[0] not in done]
+                if jobs:
+                    logger.warning(f"[Screenshots] {len(jobs)}张截图未能在同一次ffmpeg中生成，改为逐张生成")
+
+            if jobs:
+                workers = min(self.screenshot_workers, len(jobs))
+                logger.info(f"[Screenshots] 正在生成{len(jobs)}张截图，同时运行{workers}个ffmpeg...")
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ffmpeg") as ffmpeg_pool:
+                    grabs = {
+                        ffmpeg_pool.submit(
+                            self._grab_screenshot,
+                            path,
+                            self._build_ffmpeg_args(main_file, path, resolution, timestamp_ms, tracks, media_input),
+                        ): path
+                        for path, timestamp_ms in jobs
+                    }
+                    for future in as_completed(grabs):
+                        if future.result() and self.optimize_screenshot:
+                            optimizations.append(optimize_pool.submit(self._optimize_screenshot, grabs[future]))
+            for future in optimizations:
+                future.result()
+
+        return tmp_dir
+
+    def _pipe_screenshots(
+        self,
+        main_file: Path,
+        resolution: str,
+        duration: Decimal,
+        tracks=None,
+        media_input: Optional[str] = None,
+        cache_key: Optional[str] = None,
+    ) -> Optional[list]:
+        """
+        Like _generate_screenshots, but ffmpeg writes the PNGs to a pipe and
+        they are optimized in memory, then returned as ImageBuffers for the
+        uploader. Only the final PNGs are written to the screenshot folder,
+        so a later run can reuse them.
+        """
+        if not resolution or not duration:
+            logger.warning("[Screenshots] 文件无法提取分辨率或时长，无法生成截图")
+            return None
+
+        cached = self._cached_screenshot_dir()
+        if cached:
+            return sorted(get_all_images(cached))
+
+        tmp_dir = tempfile.mkdtemp(prefix=f"Differential.screenshots.{version}.", suffix=f".{self.folder.name}")
+        jobs = self._screenshot_jobs(tmp_dir, main_file, duration, media_input, cache_key)
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="optimize") as optimize_pool:
+            kept = {}
+            if self.screenshot_single_pass:
+                logger.info(f"[Screenshots] 正在用一个ffmpeg生成{len(jobs)}张截图...")
+                timeout = self.screenshot_timeout * len(jobs)
+                times = [timestamp_ms for _, timestamp_ms in jobs]
+                pngs = self._pipe_frames(main_file, times, resolution, tracks, media_input, timeout)
+                # The frames of a single run cannot be told apart unless all of them came out
+                if len(pngs) == len(jobs):
+                    for (path, _), png in zip(jobs, pngs):
+                        kept[path] = optimize_pool.submit(self._keep_screenshot, path, png)
+                    jobs = []
+                else:
+                    logger.warning("[Screenshots] 未能在同一次ffmpeg中生成全部截图，改为逐张生成")
+
+            if jobs:
+                workers = min(self.screenshot_workers, len(jobs))
+                logger.info(f"[Screenshots] 正在生成{len(jobs)}张截图，同时运行{workers}个ffmpeg...")
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ffmpeg") as ffmpeg_pool:
+                    grabs = {
+                        ffmpeg_pool.submit(
+                            self._pipe_frames, main_file, [timestamp_ms], resolution, tracks, media_input
+                        ): path
+                        for path, timestamp_ms in jobs
+                    }
+                    for future in as_completed(grabs):
+                        pngs = future.result()
+                        if pngs:
+                            kept[grabs[future]] = optimize_pool.submit(self._keep_screenshot, grabs[future], pngs[0])
+                        else:
+                            logger.warning(f"[Screenshots] 截图生成失败: {grabs[future].name}")
+            return sorted(future.result() for future in kept.values())
+
+    def _cached_screenshot_dir(self) -> Optional[Path]:
         for f in Path(tempfile.gettempdir()).glob(
             f"Differential.screenshots.{version}.*.{self.folder.name}"
         ):
@@ -146,30 +290,237 @@ class ScreenshotHandler:
                 if 0 < self.screenshot_count == len(list(f.glob("*.png"))):
                     logger.info("[Screenshots] 发现已生成的{}张截图，跳过截图...".format(self.screenshot_count))
                     return f.absolute()
+        return None
 
-        tmp_dir = tempfile.mkdtemp(prefix=f"Differential.screenshots.{version}.", suffix=f".{self.folder.name}")
-        for i in range(1, self.screenshot_count + 1):
-            logger.info(f"正在生成第{i}张截图...")
-            timestamp_ms = int(i * duration / (self.screenshot_count + 1))
-            output_path = Path(tmp_dir).joinpath(f"{main_file.stem}.thumb_{i:02d}.png")
+    def _screenshot_jobs(
+        self,
+        tmp_dir: str,
+        main_file: Path,
+        duration: Decimal,
+        media_input: Optional[str] = None,
+        cache_key: Optional[str] = None,
+    ) -> List[Tuple[Path, Decimal]]:
+        """(output path, timestamp in ms) of every screenshot to take."""
+        timestamps = [int(i * duration / (self.screenshot_count + 1)) for i in range(1, self.screenshot_count + 1)]
+        keyframes = []
+        if self.screenshot_keyframes:
+            reach = max(self._candidate_offsets(len(timestamps), duration)) if self.screenshot_content_aware else 0
+            windows = [
+                (float(t - reach) / 1000 - KEYFRAME_WINDOW, float(t + reach) / 1000 + KEYFRAME_WINDOW)
+                for t in timestamps
+            ]
+            keyframes = self._keyframes(main_file, media_input, cache_key, windows)
+        if self.screenshot_content_aware:
+            timestamps = self._select_by_content(main_file, timestamps, duration, keyframes, media_input)
+        elif keyframes:
+            timestamps = snap_timestamps(timestamps, keyframes, KEYFRAME_WINDOW * 1000)
+        return [
+            (Path(tmp_dir).joinpath(f"{main_file.stem}.thumb_{i:02d}.png"), timestamp_ms)
+            for i, timestamp_ms in enumerate(timestamps, start=1)
+        ]
+
+    def _keyframes(
+        self,
+        main_file: Path,
+        media_input: Optional[str] = None,
+        cache_key: Optional[str] = None,
+        windows: Optional[List[Tuple[float, float]]] = None,
+    ) -> list:
+        """
+        Keyframe times the screenshots are moved onto, so the seek of each
+        grab lands on the frame it keeps and only that frame is decoded.
+        Outside Matroska only the `windows` around the screenshots are probed.
+        """
+        keyframes = keyframe_index(main_file, media_input, cache_key, timeout=self.screenshot_timeout, windows=windows)
+        if keyframes:
+            logger.info(f"[Screenshots] 截图时间将对齐到关键帧（共{len(keyframes)}个关键帧）")
+        else:
+            logger.info("[Screenshots] 没有可用的关键帧索引，按时长均匀截图")
+        return keyframes
 
-            args = self._build_ffmpeg_args(
-                main_file,
-                output_path,
-                resolution,
-                timestamp_ms,
-                tracks,
+    def _select_by_content(
+        self,
+        main_file: Path,
+        timestamps: list,
+        duration: Decimal,
+        keyframes: Optional[list] = None,
+        media_input: Optional[str] = None,
+    ) -> list:
+        """
+        Score a few small grayscale candidates around every timestamp and
+        keep the best one, so black, fading and blurry frames are skipped.
+        Slots whose candidates cannot be decoded keep their timestamp.
+        """
+        offsets = self._candidate_offsets(len(timestamps), duration)
+        candidates = [max(t + offset, 0) for t in timestamps for offset in offsets]
+        if keyframes:
+            candidates = snap_timestamps(candidates, keyframes, KEYFRAME_WINDOW * 1000)
+        slots = [candidates[i : i + len(offsets)] for i in range(0, len(candidates), len(offsets))]
+
+        logger.info(f"[Screenshots] 正在为{len(slots)}张截图挑选画面，每张比较{len(offsets)}个候选...")
+        with ThreadPoolExecutor(max_workers=min(self.screenshot_workers, len(slots))) as pool:
+            scores = list(pool.map(lambda times: self._score_candidates(main_file, times, media_input), slots))
+
+        selected = []
+        middle = (len(offsets) - 1) // 2
+        for i, (times, slot_scores) in enumerate(zip(slots, scores), start=1):
+            if not slot_scores:
+                selected.append(times[middle])
+                continue
+            # Ties, e.g. all black, go to the candidate closest to the even spacing
+            best = max(range(len(times)), key=lambda k: (slot_scores[k], -abs(k - middle)))
+            logger.info(f"[Screenshots] 第{i}张截图选用{float(times[best]) / 1000:.1f}秒处的画面（得分{slot_scores[best]:.1f}）")
+            selected.append(times[best])
+        return selected
+
+    @staticmethod
+    def _candidate_offsets(count: int, duration: Decimal) -> List[int]:
+        """Offsets in ms of the content-aware candidates from each evenly spaced timestamp."""
+        spread = min(int(duration / (count + 1) / 4), MAX_CANDIDATE_SPREAD)
+        return [(k - (SCREENSHOT_CANDIDATES - 1) // 2) * spread for k in range(SCREENSHOT_CANDIDATES)]
+
+    def _score_candidates(self, main_file: Path, times: list, media_input: Optional[str] = None) -> Optional[list]:
+        """Scores of the frames at `times`, decoded small and gray in one ffmpeg run; None if any is missing."""
+        try:
+            data = execute_bytes(
+                "ffmpeg",
+                self._build_candidate_ffmpeg_args(main_file, times, media_input),
+                timeout=self.screenshot_timeout,
             )
-            execute("ffmpeg", args)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"[Screenshots] 候选画面解码超过{self.screenshot_timeout}秒，已终止")
+            return None
+        frame_size = SCORE_WIDTH * SCORE_HEIGHT
+        if len(data) < frame_size * len(times):
+            logger.warning("[Screenshots] 未能解码全部候选画面，保留原截图时间")
+            return None
+        return [frame_stats(data[i * frame_size : (i + 1) * frame_size]).score for i in range(len(times))]
 
-            if self.optimize_screenshot and output_path.exists():
-                try:
-                    img = Image.open(output_path)
-                    img.save(output_path, format="PNG", optimize=True)
-                except Exception as e:
-                    logger.error(f"Screenshot optimization failed: {e}")
+    @staticmethod
+    def _build_candidate_ffmpeg_args(main_file: Path, times: list, media_input: Optional[str] = None) -> str:
+        source = media_input or main_file.absolute()
+        inputs = " ".join(f'-ss {t}ms -skip_frame nokey -i "{source}"' for t in times)
+        chains = "".join(
+            f"[{i}:v:0]trim=end_frame=1,scale={SCORE_WIDTH}:{SCORE_HEIGHT},setsar=1,format=gray[c{i}];"
+            for i in range(len(times))
+        )
+        concat = "".join(f"[c{i}]" for i in range(len(times))) + f"concat=n={len(times)}:v=1:a=0[out]"
+        return f'-v error {inputs} -filter_complex "{chains}{concat}" -map "[out]" -f rawvideo -pix_fmt gray -'
 
-        return tmp_dir
+    def _grab_screenshots_in_one_run(
+        self,
+        main_file: Path,
+        jobs: List[Tuple[Path, Decimal]],
+        resolution: str,
+        tracks=None,
+        media_input: Optional[str] = None,
+    ) -> List[Path]:
+        """
+        Take every screenshot with a single ffmpeg run. Each timestamp still
+        opens its own seeked input, but the first frames go through one
+        tonemap/scale chain, so the process start and the filter setup are
+        paid once. Returns the screenshots it produced.
+        """
+        logger.info(f"[Screenshots] 正在用一个ffmpeg生成{len(jobs)}张截图...")
+        args = self._build_multi_frame_ffmpeg_args(main_file, jobs, resolution, tracks, media_input)
+        timeout = self.screenshot_timeout * len(jobs)
+        try:
+            execute("ffmpeg", args, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"[Screenshots] ffmpeg超过{timeout}秒未完成，已终止")
+            # Any of them may be half written
+            for path, _ in jobs:
+                path.unlink(missing_ok=True)
+            return []
+        return [path for path, _ in jobs if path.exists()]
+
+    def _grab_screenshot(self, output_path: Path, args: str) -> bool:
+        try:
+            execute("ffmpeg", args, timeout=self.screenshot_timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"[Screenshots] ffmpeg超过{self.screenshot_timeout}秒未完成，已终止: {output_path.name}")
+            output_path.unlink(missing_ok=True)
+            return False
+        if not output_path.exists():
+            logger.warning(f"[Screenshots] 截图生成失败: {output_path.name}")
+            return False
+        logger.info(f"[Screenshots] 已生成: {output_path.name}")
+        return True
+
+    def _pipe_frames(
+        self,
+        main_file: Path,
+        times: list,
+        resolution: str,
+        tracks=None,
+        media_input: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> List[bytes]:
+        """The PNGs ffmpeg wrote to its stdout for `times`, in order; fewer when frames are missing."""
+        timeout = timeout or self.screenshot_timeout
+        try:
+            data = execute_bytes(
+                "ffmpeg", self._build_pipe_ffmpeg_args(main_file, times, resolution, tracks, media_input), timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            logger.warning(f"[Screenshots] ffmpeg超过{timeout}秒未完成，已终止")
+            return []
+        return self._split_pngs(data)
+
+    def _keep_screenshot(self, output_path: Path, png: bytes) -> ImageBuffer:
+        if self.optimize_screenshot:
+            png = self._optimized_png(png)
+        # Written next to the screenshot first, so a cached folder never holds a half-written PNG
+        temp_path = output_path.with_name(f"{output_path.name}.tmp")
+        try:
+            temp_path.write_bytes(png)
+            os.replace(temp_path, output_path)
+        except OSError as e:
+            logger.warning(f"[Screenshots] 截图无法保存，仅上传: {output_path.name}: {e}")
+            temp_path.unlink(missing_ok=True)
+        logger.info(f"[Screenshots] 已生成: {output_path.name}")
+        return ImageBuffer(output_path, png)
+
+    @staticmethod
+    def _optimized_png(png: bytes) -> bytes:
+        try:
+            output = io.BytesIO()
+            with Image.open(io.BytesIO(png)) as img:
+                img.save(output, format="PNG", optimize=True)
+            return output.getvalue()
+        except Exception as e:
+            logger.error(f"Screenshot optimization failed: {e}")
+            return png
+
+    @staticmethod
+    def _split_pngs(data: bytes) -> List[bytes]:
+        """The PNGs of an image2pipe stream, up to the first one that is cut off."""
+        pngs = []
+        start = 0
+        while data.startswith(PNG_SIGNATURE, start):
+            end = start + len(PNG_SIGNATURE)
+            chunk_type = None
+            while chunk_type != b"IEND" and end + 8 <= len(data):
+                chunk_type = data[end + 4 : end + 8]
+                # Length, type, data and CRC
+                end += 12 + int.from_bytes(data[end : end + 4], "big")
+            if chunk_type != b"IEND" or end > len(data):
+                break
+            pngs.append(data[start:end])
+            start = end
+        return pngs
+
+    @staticmethod
+    def _optimize_screenshot(output_path: Path) -> None:
+        # Written next to the screenshot first, so a cached folder never holds a half-written PNG
+        temp_path = output_path.with_name(f"{output_path.name}.tmp")
+        try:
+            with Image.open(output_path) as img:
+                img.save(temp_path, format="PNG", optimize=True)
+            os.replace(temp_path, output_path)
+        except Exception as e:
+            logger.error(f"Screenshot optimization failed: {e}")
+            temp_path.unlink(missing_ok=True)
 
     def _build_ffmpeg_args(
         self,
@@ -178,22 +529,103 @@ class ScreenshotHandler:
         resolution: str,
         timestamp_ms: int,
         tracks=None,
+        media_input: Optional[str] = None,
     ) -> str:
-        video_filter_or_size = f"-s {resolution}"
-        if self._should_tonemap(tracks):
-            filters = [self._tonemap_filter(tracks)]
-            scale_filter = self._scale_filter(resolution)
-            if scale_filter:
-                filters.append(scale_filter)
-            filters.append("format=rgb24")
-            video_filter_or_size = f'-vf "{",".join(filters)}"'
-
+        video_filter_or_size = self._video_filter_or_size(main_file, resolution, tracks)
         return (
             f'-y -ss {timestamp_ms}ms -skip_frame nokey '
-            f'-i "{main_file.absolute()}" '
+            f'-i "{media_input or main_file.absolute()}" '
             f'{video_filter_or_size} -vsync 0 -vframes 1 -c:v png "{output_path}"'
         )
 
+    def _build_multi_frame_ffmpeg_args(
+        self,
+        main_file: Path,
+        jobs: List[Tuple[Path, Decimal]],
+        resolution: str,
+        tracks=None,
+        media_input: Optional[str] = None,
+    ) -> str:
+        """One seeked input per job; the filtered frames are split back into one output file each."""
+        filters = self._video_filters(main_file, resolution, tracks)
+        source = media_input or main_file.absolute()
+        inputs = " ".join(f'-ss {timestamp_ms}ms -skip_frame nokey -i "{source}"' for _, timestamp_ms in jobs)
+        split = "".join(f"[a{i}]" for i in range(len(jobs)))
+        picks = "".join(f";[a{i}]trim=start_frame={i}:end_frame={i + 1}[o{i}]" for i in range(len(jobs)))
+        graph = self._first_frames_graph(len(jobs), filters, f",split={len(jobs)}{split}{picks}")
+        outputs = " ".join(f'-map "[o{i}]" -vsync 0 -vframes 1 -c:v png "{path}"' for i, (path, _) in enumerate(jobs))
+        return f'-y {inputs} -filter_complex "{graph}" {outputs}'
+
+    def _build_pipe_ffmpeg_args(
+        self,
+        main_file: Path,
+        times: list,
+        resolution: str,
+        tracks=None,
+        media_input: Optional[str] = None,
+    ) -> str:
+        """One seeked input per timestamp; their first frames are written to stdout as a stream of PNGs."""
+        filters = self._video_filters(main_file, resolution, tracks)
+        source = media_input or main_file.absolute()
+        inputs = " ".join(f'-ss {t}ms -skip_frame nokey -i "{source}"' for t in times)
+        graph = self._first_frames_graph(len(times), filters, "[out]")
+        return f'-v error {inputs} -filter_complex "{graph}" -map "[out]" -vsync 0 -f image2pipe -c:v png -'
+
+    @staticmethod
+    def _first_frames_graph(count: int, filters: str, tail: str) -> str:
+        """
+        Concatenate the first frame of each of `count` inputs and run them
+        through a single `filters` chain, so the tonemap is set up once per
+        run rather than once per input; `tail` is appended to the chain.
+        """
+        trims = "".join(f"[{i}:v:0]trim=end_frame=1[f{i}];" for i in range(count))
+        concat = "".join(f"[f{i}]" for i in range(count)) + f"concat=n={count}:v=1:a=0"
+        return f"{trims}{concat},{filters}{tail}"
+
+    def _video_filter_or_size(self, main_file: Path, resolution: str, tracks=None) -> str:
+        tracks = self._tracks_with_probe_fallback(main_file, tracks)
+        if not self._should_tonemap(tracks):
+            return f"-s {resolution}"
+        return f'-vf "{",".join(self._tonemap_filters(resolution, tracks))}"'
+
+    def _video_filters(self, main_file: Path, resolution: str, tracks=None) -> str:
+        """_video_filter_or_size as a single filter chain, for filter graphs."""
+        tracks = self._tracks_with_probe_fallback(main_file, tracks)
+        if self._should_tonemap(tracks):
+            return ",".join(self._tonemap_filters(resolution, tracks))
+        return self._scale_filter(resolution) or "null"
+
+    def _tonemap_filters(self, resolution: str, tracks=None) -> List[str]:
+        filters = [self._tonemap_filter(tracks)]
+        scale_filter = self._scale_filter(resolution)
+        if scale_filter:
+            filters.append(scale_filter)
+        filters.append("format=rgb24")
+        return filters
+
+    def _tracks_with_probe_fallback(self, main_file: Path, tracks=None):
+        """
+        When MediaInfo has no video track to judge HDR from, describe the
+        video stream of the shared ffprobe probe as one instead.
+        """
+        if self.screenshot_tonemap != "auto" or any(
+            getattr(track, "track_type", "") == "Video" for track in tracks or []
+        ):
+            return tracks
+        stream = probe_video_stream(main_file)
+        if not stream:
+            return tracks
+        side_data = " ".join(str(data.get("side_data_type", "")) for data in stream.get("side_data_list", []))
+        probed = SimpleNamespace(
+            track_type="Video",
+            transfer_characteristics=stream.get("color_transfer"),
+            color_primaries=stream.get("color_primaries"),
+            hdr_format="Dolby Vision" if "dovi" in side_data.lower() else None,
+            codec_id=stream.get("codec_tag_string"),
+            format=stream.get("codec_name"),
+        )
+        return list(tracks or []) + [probed]
+
     def _should_tonemap(self, tracks=None) -> bool:
         if self.screenshot_tonemap == "always":
             return True
@@ -338,6 +770,7 @@ class ScreenshotHandler:
             "smpte2084",
             "st 2084",
             "arib std-b67",
+            "arib-std-b67",
         )
         return any(token in text for token in hdr_tokens)
 
@@ -354,7 +787,10 @@ class ScreenshotHandler:
         Upload screenshots from the given directory to the chosen image host.
         Returns a list of ImageUploaded objects.
         """
-        images = sorted(get_all_images(img_dir))
+        return self._upload_images(sorted(get_all_images(img_dir)))
+
+    def _upload_images(self, images: list) -> list:
+        """Upload image files or ImageBuffers to the chosen image host."""
         if not images:
             logger.warning("[Screenshots] 未找到可用图片.")
             return []
@@ -1,69 +1,499 @@
+import os
+import mmap
+import hashlib
+import threading
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import bencodepy
 from torf import Torrent
 from loguru import logger
 
 from differential.version import version
+from differential.utils.bencode_scan import dict_spans, decode_int, decode_string, encode_int, encode_raw_dict, encode_string
+from differential.utils.cache import BlobCache
+from differential.utils.media_identity import media_file_identity
+from differential.utils.piece_hasher import carried_pieces, hash_files_v2, hash_pieces, piece_count, verify_pieces
+from differential.utils.torrent_index import (
+    FileIdentities,
+    TorrentIndex,
+    TorrentLayout,
+    layout_key,
+    pieces_digest,
+    read_torrent_layout,
+    torrent_layout,
+)
 
 
-def remake_torrent(path: Path, tracker: str, old_torrent: str) -> Optional[bytes]:
+TorrentTarget = Tuple[Optional[str], str]
+
+TORRENT_VERSIONS = ("v1", "v2", "hybrid")
+
+PIECE_CACHE_NAME = "pieces"
+PIECE_CACHE_SIZE = 64 * 1024 * 1024
+
+REMAKE_INFO_KEYS = (b'length', b'files', b'name', b'piece length', b'pieces', b'meta version', b'file tree')
+
+
+def remake_torrent(path: Path, tracker: str, old_torrent: str, source: Optional[str] = None) -> Optional[bytes]:
+    """
+    Rebuild `old_torrent` for a new tracker. The kept ``info`` values are
+    copied byte for byte out of the memory-mapped file, so ``pieces`` is never
+    decoded and an info dict with only those keys keeps its infohash. The
+    same holds for the v2 ``file tree`` and ``piece layers``.
+    """
     if not Path(old_torrent).is_file():
         return None
     try:
-        with open(old_torrent, 'rb') as f:
-            t = f.read()
-            torrent = bencodepy.decode(t)
-    except:
-        import traceback
-        traceback.print_exc()
+        with open(old_torrent, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            spans = dict_spans(data)
+            info = dict_spans(data, spans[b'info'][0])
+            _name = decode_string(data, info[b'name']).decode()
+            new_info = {k: data[start:end] for k, (start, end) in info.items() if k in REMAKE_INFO_KEYS}
+            # v2 and hybrid torrents keep the per-file hashes outside of ``info``
+            piece_layers = data[slice(*spans[b'piece layers'])] if b'piece layers' in spans else None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"无法读取基础种子{old_torrent}: {e}")
         return None
 
-    _name = torrent.get(b'info', {}).get(b'name').decode()
     if _name != path.name:
         logger.warning(f"洗种的基础种子很可能不匹配！基础种子文件名为：{_name}，而将要制种的文件名为：{path.name}")
 
-    new_torrent = {}
+    new_info[b'private'] = encode_int(1)
+    if source:
+        new_info[b'source'] = encode_string(source)
+    new_torrent = {
+        b'created by': encode_string(f"Differential {version}"),
+        b'comment': encode_string(f"Generate by Differential {version} made by XGCM"),
+        b'info': encode_raw_dict(new_info),
+    }
+    if piece_layers:
+        new_torrent[b'piece layers'] = piece_layers
     if tracker:
-        new_torrent[b'announce'] = tracker
-    new_torrent[b'created by'] = f"Differential {version}"
-    new_torrent[b'comment'] = f"Generate by Differential {version} made by XGCM"
-    new_torrent[b'info'] = {b'private': 1}
-    for k, v in torrent[b'info'].items():
-        if k in (b'length', b'files', b'name', b'piece length', b'pieces'):
-            new_torrent[b'info'][k] = v
-    return bencodepy.encode(new_torrent)
-
-
-def make_torrent_progress(torrent, filepath, pieces_done, pieces_total):
-    logger.info(f'制种进度: {pieces_done/pieces_total*100:3.0f} %')
-
-def make_torrent(path: Path, tracker: str, prefix: str = None, reuse_torrent: bool = True, from_torrent: str = None):
-    torrent_name = path.resolve().parent.joinpath((f"[{prefix}]." if prefix else '') + f"{path.name if path.is_dir() else path.stem}.torrent")
-    if from_torrent and Path(from_torrent).is_file():
+        new_torrent[b'announce'] = encode_string(tracker)
+    return encode_raw_dict(new_torrent)
+
+
+def make_torrent_progress(pieces_done, pieces_total, bytes_per_second):
+    if not pieces_total:
+        return
+    logger.info(f'制种进度: {pieces_done/pieces_total*100:3.0f} %  {bytes_per_second/1024/1024:.1f} MB/s')
+
+
+def verify_progress(pieces_done, pieces_total, bytes_per_second):
+    if not pieces_total:
+        return
+    logger.info(f'校验进度: {pieces_done/pieces_total*100:3.0f} %  {bytes_per_second/1024/1024:.1f} MB/s')
+
+
+def read_torrent_pieces(torrent_file: Path) -> Optional[Tuple[int, bytes]]:
+    try:
+        with open(torrent_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            info_span = dict_spans(data)[b'info']
+            info = dict_spans(data, info_span[0])
+            return decode_int(data, info[b'piece length']), decode_string(data, info[b'pieces'])
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"无法读取种子{torrent_file}: {e}")
+        return None
+
+
+def payload_files(path: Path, layout: TorrentLayout) -> List[Tuple[str, int]]:
+    _, files = layout
+    if path.is_file():
+        return [(str(path), files[0][1])] if len(files) == 1 else []
+    return [(str(path.joinpath(*relpath.split("/"))), size) for relpath, size in files]
+
+
+def verify_torrent(
+    torrent_file: Path,
+    path: Path,
+    workers: Optional[int] = None,
+    sample_ratio: Optional[float] = None,
+    stop_on_first: bool = True,
+    stop: Optional[threading.Event] = None,
+) -> bool:
+    """
+    Check that the data under `path` matches the piece hashes of
+    `torrent_file`. With `sample_ratio` only that share of pieces is hashed.
+    """
+    layout = read_torrent_layout(torrent_file)
+    pieces = read_torrent_pieces(torrent_file)
+    if not layout or not pieces:
+        logger.warning(f"[Verify] 无法读取种子: {torrent_file}")
+        return False
+
+    files = payload_files(Path(path), layout)
+    if not files:
+        logger.warning(f"[Verify] 种子与文件结构不一致: {torrent_file} -> {path}")
+        return False
+    for filepath, size in files:
+        actual = Path(filepath).stat().st_size if Path(filepath).is_file() else None
+        if actual != size:
+            logger.warning(f"[Verify] 文件缺失或大小不一致: {filepath}，种子中为{size}字节，实际为{actual}")
+            return False
+
+    piece_size, expected = pieces
+    mode = f"抽样{sample_ratio * 100:g}%" if sample_ratio else "全部"
+    logger.info(f"[Verify] 正在校验{torrent_file}（{mode}piece）...")
+    try:
+        mismatched = verify_pieces(
+            files,
+            piece_size,
+            expected,
+            workers=workers,
+            sample_ratio=sample_ratio,
+            stop_on_first=stop_on_first,
+            callback=verify_progress,
+            stop=stop,
+        )
+    except (OSError, ValueError) as e:
+        logger.warning(f"[Verify] 校验失败: {e}")
+        return False
+    if mismatched:
+        logger.warning(f"[Verify] 有{len(mismatched)}个piece不匹配，第一个为#{mismatched[0]}: {torrent_file}")
+        return False
+    logger.info(f"[Verify] 校验通过: {torrent_file}")
+    return True
+
+
+def torrent_files(torrent: Torrent) -> List[Tuple[str, int]]:
+    return [(str(fp), f.size) for fp, f in zip(torrent.filepaths, torrent.files)]
+
+
+def torrent_path(path: Path, prefix: Optional[str] = None) -> Path:
+    return path.resolve().parent.joinpath((f"[{prefix}]." if prefix else '') + f"{path.name if path.is_dir() else path.stem}.torrent")
+
+
+def read_torrent_version(torrent_file) -> Optional[str]:
+    """``v1``, ``v2`` or ``hybrid`` going by the keys of the info dict, None if it cannot be read."""
+    try:
+        with open(torrent_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            info = dict_spans(data, dict_spans(data)[b'info'][0])
+    except (OSError, ValueError, KeyError):
+        return None
+    if b'meta version' not in info:
+        return "v1"
+    return "hybrid" if b'pieces' in info else "v2"
+
+
+def _write_remade_torrents(path: Path, targets: List[TorrentTarget], old_torrent, with_source: bool) -> Optional[List[Path]]:
+    remade = []
+    for prefix, tracker in targets:
+        torrent = remake_torrent(path, tracker, old_torrent, prefix if with_source else None)
+        if not torrent:
+            return None
+        remade.append((torrent_path(path, prefix), torrent))
+    for torrent_name, torrent in remade:
+        with open(torrent_name, 'wb') as f:
+            f.write(torrent)
+        logger.info(f"种子制作完成：{torrent_name.absolute()}")
+    return [torrent_name for torrent_name, _ in remade]
+
+
+def make_torrent(
+    path: Path,
+    tracker: str,
+    prefix: str = None,
+    reuse_torrent: bool = True,
+    from_torrent: str = None,
+    workers: Optional[int] = None,
+    targets: Optional[List[TorrentTarget]] = None,
+    verify: bool = False,
+    verify_sample: Optional[float] = None,
+    torrent_version: str = "v1",
+    stop: Optional[threading.Event] = None,
+) -> List[Path]:
+    """
+    Make one private torrent per `(prefix, announce)` target from a single
+    hashing pass. Without `targets` only `(prefix, tracker)` is made and no
+    ``source`` is set; with `targets` every torrent gets its prefix as
+    ``source`` so the per-site infohashes differ.
+
+    With `verify`, a reused or `from_torrent` base is only trusted after its
+    pieces (or a `verify_sample` share of them) match the data on disk.
+
+    `torrent_version` selects ``v1``, ``v2`` or ``hybrid`` metainfo; v2 and
+    hybrid torrents are always hashed afresh. A `from_torrent` base of
+    another version is not remade, since that would keep its version.
+
+    Setting `stop` makes the hashing raise `HashingStopped` between tasks.
+    """
+    with_source = targets is not None
+    targets = list(targets) if targets is not None else [(prefix, tracker)]
+    index = _open_index()
+    base_version = read_torrent_version(from_torrent) if from_torrent and Path(from_torrent).is_file() else None
+    if base_version and base_version != torrent_version:
+        logger.warning(f"{from_torrent}是{base_version}种子，与要制作的{torrent_version}种子不符，将重新制种")
+    elif from_torrent and Path(from_torrent).is_file():
         logger.info(f"正在基于{from_torrent}制作种子...")
-        torrent = remake_torrent(path, tracker, from_torrent)
-        if torrent:
-            with open(torrent_name, 'wb') as f:
-                f.write(torrent)
-            logger.info(f"种子制作完成：{torrent_name.absolute()}")
-            return
-    if reuse_torrent:
-        for f in path.resolve().parent.glob(f'*{path.name if path.is_dir() else path.stem}.torrent'):
-            logger.info(f"正在基于{f.name}制作种子...")
-            torrent = remake_torrent(path, tracker, f)
-            if torrent:
-                with open(torrent_name, 'wb') as f:
-                    f.write(torrent)
-                logger.info(f"种子制作完成：{torrent_name.absolute()}")
-                return
-        
-    logger.info("正在生成种子...")
-    t = Torrent(path=path, trackers=[tracker],
+        # The index maps v1 layouts only; a v2 or hybrid base must not be offered to a v1 run
+        key = index.add_torrent_file(from_torrent) if index and torrent_version == "v1" else None
+        if verify and not verify_torrent(from_torrent, path, workers, verify_sample, stop=stop):
+            logger.warning(f"{from_torrent}与本地文件不一致，将重新制种")
+        elif made := _write_remade_torrents(path, targets, from_torrent, with_source):
+            _index_torrents(index, key, made)
+            return made
+
+    t = Torrent(path=path, trackers=[targets[0][1]],
                 created_by=f"Differential {version}",
                 comment=f"Generate by Differential {version} made by XGCM")
     t.private = True
-    t.generate(callback=make_torrent_progress, interval=1)
-    t.write(torrent_name, overwrite=True)
-    logger.info(f"种子制作完成：{torrent_name.absolute()}")
+    if torrent_version != "v1":
+        return _write_v2_torrents(path, t, targets, with_source, torrent_version == "hybrid", workers, stop)
+
+    key = layout_key(*torrent_layout(t))
+    if reuse_torrent:
+        for f in _reuse_candidates(path, index, key):
+            if verify and not verify_torrent(f, path, workers, verify_sample, stop=stop):
+                continue
+            logger.info(f"正在基于{f.name}制作种子...")
+            if made := _write_remade_torrents(path, targets, f, with_source):
+                _index_torrents(index, key, made)
+                return made
+
+    logger.info("正在生成种子...")
+    identities = file_identities(t)
+    cache = _open_piece_cache()
+    cache_key = piece_cache_key(t.piece_size, identities) if identities and cache else None
+    pieces = _cached_pieces(cache, cache_key, t)
+    if pieces is None:
+        pieces = hash_pieces(
+            torrent_files(t),
+            t.piece_size,
+            workers=workers,
+            callback=make_torrent_progress,
+            known=_unchanged_pieces(index, path, t, identities),
+            stop=stop,
+        )
+        if cache_key:
+            cache.put(cache_key, pieces)
+    t.metainfo['info']['pieces'] = pieces
+
+    made = []
+    for target_prefix, target_tracker in targets:
+        torrent_name = torrent_path(path, target_prefix)
+        t.trackers = [target_tracker]
+        t.source = target_prefix if with_source else None
+        t.write(torrent_name, overwrite=True)
+        logger.info(f"种子制作完成：{torrent_name.absolute()}")
+        made.append(torrent_name)
+    _index_torrents(index, key, made)
+    if identities and index:
+        index.set_snapshot(path, made[0], t.metainfo['info']['pieces'], identities)
+    return made
+
+
+def make_v2_info(
+    torrent: Torrent, hybrid: bool = False, workers: Optional[int] = None, stop: Optional[threading.Event] = None
+) -> Tuple[dict, dict]:
+    """
+    Build the BEP 52 ``info`` dict and ``piece layers`` for the files torf
+    picked for `torrent`. With `hybrid` the info dict also carries the v1
+    ``pieces`` and a ``files`` list padded so every file starts on a piece
+    boundary, both computed from the same read as the merkle trees.
+    """
+    info = torrent.metainfo['info']
+    if 'files' in info:
+        entries = [(f['path'], str(fp), f['length']) for f, fp in zip(info['files'], torrent.filepaths)]
+    else:
+        entries = [([info['name']], str(torrent.filepaths[0]), info['length'])]
+    # v1 files of a hybrid torrent must follow the order of the file tree
+    entries.sort(key=lambda entry: [part.encode() for part in entry[0]])
+    piece_size = torrent.piece_size
+    hashes = hash_files_v2(
+        [(filepath, size) for _, filepath, size in entries],
+        piece_size,
+        workers=workers,
+        callback=make_torrent_progress,
+        v1=hybrid,
+        stop=stop,
+    )
+
+    file_tree, piece_layers, files, pieces = {}, {}, [], []
+    for i, ((parts, _, size), (root, layer, v1_pieces)) in enumerate(zip(entries, hashes)):
+        node = file_tree
+        for part in parts:
+            node = node.setdefault(part.encode(), {})
+        node[b''] = {b'length': size, b'pieces root': root} if root else {b'length': size}
+        if layer:
+            piece_layers[root] = layer
+        files.append({b'length': size, b'path': [part.encode() for part in parts]})
+        pieces.append(v1_pieces)
+        padding = -size % piece_size
+        if padding and i < len(entries) - 1:
+            files.append({b'attr': b'p', b'length': padding, b'path': [b'.pad', str(padding).encode()]})
+
+    new_info = {
+        b'name': info['name'].encode(),
+        b'piece length': piece_size,
+        b'meta version': 2,
+        b'file tree': file_tree,
+        b'private': 1,
+    }
+    if hybrid:
+        new_info[b'pieces'] = b''.join(pieces)
+        if 'files' in info:
+            new_info[b'files'] = files
+        else:
+            new_info[b'length'] = info['length']
+    return new_info, piece_layers
+
+
+def _write_v2_torrents(
+    path: Path,
+    torrent: Torrent,
+    targets: List[TorrentTarget],
+    with_source: bool,
+    hybrid: bool,
+    workers: Optional[int],
+    stop: Optional[threading.Event] = None,
+) -> List[Path]:
+    logger.info(f"正在生成{'hybrid' if hybrid else 'v2'}种子...")
+    info, piece_layers = make_v2_info(torrent, hybrid, workers, stop)
+    made = []
+    for target_prefix, target_tracker in targets:
+        info.pop(b'source', None)
+        if with_source and target_prefix:
+            info[b'source'] = target_prefix.encode()
+        metainfo = {
+            b'created by': f"Differential {version}".encode(),
+            b'comment': f"Generate by Differential {version} made by XGCM".encode(),
+            b'info': info,
+            b'piece layers': piece_layers,
+        }
+        if target_tracker:
+            metainfo[b'announce'] = target_tracker.encode()
+        torrent_name = torrent_path(path, target_prefix)
+        with open(torrent_name, 'wb') as f:
+            f.write(bencodepy.encode(metainfo))
+        logger.info(f"种子制作完成：{torrent_name.absolute()}")
+        made.append(torrent_name)
+    return made
+
+
+def file_identities(torrent: Torrent) -> Optional[FileIdentities]:
+    """
+    Size, sampled media identity, mtime and inode of every file. The sample
+    alone misses an edit outside the sampled ranges, so anything reused from
+    an earlier hash also needs the file to be untouched since.
+    """
+    _, files = torrent_layout(torrent)
+    identities = {}
+    try:
+        for (relpath, size), fp in zip(files, torrent.filepaths):
+            stat = os.stat(fp)
+            identities[relpath] = (size, media_file_identity(fp), stat.st_mtime_ns, stat.st_ino)
+    except OSError as e:
+        logger.debug(f"[TorrentIndex] 无法读取文件特征: {e}")
+        return None
+    return identities
+
+
+def piece_cache_key(piece_size: int, identities: FileIdentities) -> str:
+    """
+    Key the v1 pieces by piece length and the size, identity and mtime of
+    every file in order. File and folder names are left out, so renaming the
+    payload still hits the cache.
+    """
+    digest = hashlib.sha256(f"pieces\0{piece_size}\0".encode("ascii"))
+    for size, identity, mtime_ns, _ in identities.values():
+        digest.update(f"{size}\0{identity}\0{mtime_ns}\0".encode("ascii"))
+    return digest.hexdigest()
+
+
+def _open_index() -> Optional[TorrentIndex]:
+    """The torrent index, or None when the cache folder cannot be used, e.g. under a read-only home."""
+    try:
+        return TorrentIndex()
+    except OSError as e:
+        logger.warning(f"[TorrentIndex] 无法打开种子索引，本次不使用: {e}")
+        return None
+
+
+def _open_piece_cache() -> Optional[BlobCache]:
+    try:
+        return BlobCache(PIECE_CACHE_NAME, PIECE_CACHE_SIZE)
+    except OSError as e:
+        logger.warning(f"[Cache] 无法打开piece缓存，本次不使用: {e}")
+        return None
+
+
+def _cached_pieces(cache: Optional[BlobCache], key: Optional[str], torrent: Torrent) -> Optional[bytes]:
+    if not key:
+        return None
+    pieces = cache.get(key)
+    if pieces is None:
+        logger.debug(f"[Cache] 未命中piece缓存: {key}")
+        return None
+    if len(pieces) != piece_count(torrent.size, torrent.piece_size) * 20:
+        logger.warning(f"[Cache] piece缓存长度不符，已忽略: {key}")
+        return None
+    logger.info("命中piece缓存，无需重新计算哈希")
+    return pieces
+
+
+def _unchanged_pieces(
+    index: Optional[TorrentIndex], path: Path, torrent: Torrent, identities: Optional[FileIdentities]
+) -> Optional[Dict[int, bytes]]:
+    """
+    Digests of the new pieces that only cover files whose size, sampled
+    identity, mtime and inode are the same as when `path` was last hashed
+    from scratch.
+    """
+    snapshot = index.snapshot(path) if index else None
+    if not snapshot or not identities:
+        return None
+    old_torrent, old_digest, old_identities = snapshot
+    layout = read_torrent_layout(old_torrent) if old_torrent.is_file() else None
+    pieces = read_torrent_pieces(old_torrent) if layout else None
+    if not pieces or pieces[0] != torrent.piece_size or pieces_digest(pieces[1]) != old_digest:
+        return None
+    piece_size, old_pieces = pieces
+    _, old_files = layout
+    if len(old_pieces) != piece_count(sum(size for _, size in old_files), piece_size) * 20:
+        return None
+
+    old_sizes = dict(old_files)
+    unchanged = {
+        relpath
+        for relpath, entry in identities.items()
+        if old_identities.get(relpath) == entry and old_sizes.get(relpath) == entry[0]
+    }
+    _, new_files = torrent_layout(torrent)
+    known = carried_pieces(old_files, old_pieces, new_files, piece_size, unchanged)
+    if known:
+        total = piece_count(sum(size for _, size in new_files), piece_size)
+        logger.info(f"基于{old_torrent.name}增量制种：{len(known)}/{total}个piece未变化，无需重新计算")
+    return known
+
+
+def _reuse_candidates(path: Path, index: Optional[TorrentIndex], key: str) -> Iterator[Path]:
+    """
+    Yield indexed torrents for this exact layout first. Only when the index
+    knows none, fall back to scanning the parent folder once; anything found
+    there is indexed so the next run is a single lookup.
+
+    Only v1 torrents are yielded: a single-file hybrid torrent has the same
+    layout, but remaking it would carry its v2 keys into the new torrent.
+    """
+    indexed = [f for f in index.lookup(key) if read_torrent_version(f) == "v1"] if index else []
+    if indexed:
+        logger.debug(f"[TorrentIndex] 命中种子索引: {len(indexed)}个候选")
+        yield from indexed
+        return
+    for f in path.resolve().parent.glob(f'*{path.name if path.is_dir() else path.stem}.torrent'):
+        if read_torrent_version(f) != "v1":
+            continue
+        if index:
+            found = index.add_torrent_file(f)
+        else:
+            layout = read_torrent_layout(f)
+            found = layout_key(*layout) if layout else None
+        if found == key:
+            yield f
+
+
+def _index_torrents(index: Optional[TorrentIndex], key: Optional[str], torrents: List[Path]) -> None:
+    if key and index:
+        for torrent_file in torrents:
+            index.add(key, torrent_file)
@@ -0,0 +1,163 @@
+import mmap
+import time
+import hashlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import bencodepy
+from loguru import logger
+from torf import Torrent
+
+from differential.utils.bencode_scan import decode_int, decode_string, dict_spans
+from differential.utils.cache import cache_dir, locked, read_json, write_json
+
+
+INDEX_VERSION = 1
+INDEX_FILE = "torrents.json"
+# Payload roots whose per-file identities are kept for incremental hashing
+MAX_SNAPSHOTS = 200
+
+TorrentLayout = Tuple[str, List[Tuple[str, int]]]
+# relpath -> (size, media identity, mtime in ns, inode) of every file at the time it was hashed
+FileIdentities = Dict[str, Tuple[int, str, int, int]]
+
+
+def layout_key(name: str, files: Sequence[Tuple[str, int]]) -> str:
+    """Key a torrent by its info name, total length and the (path, size) of every file."""
+    digest = hashlib.sha256()
+    total = sum(size for _, size in files)
+    digest.update(f"v{INDEX_VERSION}\0{name}\0{total}\0".encode("utf-8", errors="surrogateescape"))
+    for relpath, size in files:
+        digest.update(f"{relpath}\0{size}\0".encode("utf-8", errors="surrogateescape"))
+    return digest.hexdigest()
+
+
+def pieces_digest(pieces: bytes) -> str:
+    return hashlib.sha256(pieces).hexdigest()
+
+
+def torrent_layout(torrent: Torrent) -> TorrentLayout:
+    info = torrent.metainfo['info']
+    if 'files' in info:
+        return info['name'], [("/".join(f['path']), f['length']) for f in info['files']]
+    return info['name'], [(info['name'], info['length'])]
+
+
+def read_torrent_layout(torrent_file: Path) -> Optional[TorrentLayout]:
+    """Read the file layout of a .torrent without decoding its pieces."""
+    try:
+        with open(torrent_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            info_span = dict_spans(data)[b'info']
+            info = dict_spans(data, info_span[0])
+            name = decode_string(data, info[b'name']).decode(errors="surrogateescape")
+            if b'files' in info:
+                start, end = info[b'files']
+                files = [
+                    (b"/".join(f[b'path']).decode(errors="surrogateescape"), f[b'length'])
+                    for f in bencodepy.decode(data[start:end])
+                ]
+            else:
+                files = [(name, decode_int(data, info[b'length']))]
+    except (OSError, ValueError, KeyError, TypeError, bencodepy.BencodeDecodeError) as e:
+        logger.debug(f"[TorrentIndex] 无法读取种子{torrent_file}: {e}")
+        return None
+    return name, files
+
+
+class TorrentIndex:
+    """
+    Persistent map from layout key to the .torrent files Differential made or
+    was given for that layout, so reusing a base torrent is a single lookup.
+
+    It also remembers, per payload root, the last torrent hashed from scratch
+    together with the identity of every file, so a later run on a partly
+    changed payload can keep the pieces of the files that did not change.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else cache_dir().joinpath(INDEX_FILE)
+        self.lock_path = self.path.with_name(f"{self.path.name}.lock")
+        self.entries, self.snapshots = self._read()
+
+    def lookup(self, key: str) -> List[Path]:
+        paths = [Path(p) for p in self.entries.get(key, [])]
+        existing = [p for p in paths if p.is_file()]
+        if len(existing) != len(paths):
+            missing = {str(p) for p in paths if p not in existing}
+
+            def drop_missing(entries: Dict[str, List[str]], snapshots: Dict[str, dict]) -> None:
+                kept = [p for p in entries.get(key, []) if p not in missing]
+                if kept:
+                    entries[key] = kept
+                else:
+                    entries.pop(key, None)
+
+            self._update(drop_missing)
+        return existing
+
+    def add(self, key: str, torrent_file: Path) -> None:
+        torrent_file = str(Path(torrent_file).resolve())
+
+        def add_first(entries: Dict[str, List[str]], snapshots: Dict[str, dict]) -> None:
+            entries[key] = [torrent_file] + [p for p in entries.get(key, []) if p != torrent_file]
+
+        self._update(add_first)
+
+    def add_torrent_file(self, torrent_file: Path) -> Optional[str]:
+        layout = read_torrent_layout(torrent_file)
+        if not layout:
+            return None
+        key = layout_key(*layout)
+        self.add(key, torrent_file)
+        return key
+
+    def snapshot(self, root: Path) -> Optional[Tuple[Path, str, FileIdentities]]:
+        snapshot = self.snapshots.get(str(Path(root).resolve()))
+        if not snapshot:
+            return None
+        files = {relpath: tuple(entry) for relpath, entry in snapshot["files"].items()}
+        return Path(snapshot["torrent"]), snapshot["pieces"], files
+
+    def set_snapshot(self, root: Path, torrent_file: Path, pieces: bytes, files: FileIdentities) -> None:
+        """
+        Remember `files` as hashed into `torrent_file`; `pieces` guards against
+        the file being overwritten later. Only the `MAX_SNAPSHOTS` most recent
+        roots are kept.
+        """
+        root = str(Path(root).resolve())
+        snapshot = {
+            "torrent": str(Path(torrent_file).resolve()),
+            "pieces": pieces_digest(pieces),
+            "files": {relpath: list(entry) for relpath, entry in files.items()},
+            "time": time.time(),
+        }
+
+        def replace(entries: Dict[str, List[str]], snapshots: Dict[str, dict]) -> None:
+            snapshots[root] = snapshot
+            for old in sorted(snapshots, key=lambda r: snapshots[r].get("time", 0))[:-MAX_SNAPSHOTS]:
+                snapshots.pop(old)
+
+        self._update(replace)
+
+    def _read(self) -> Tuple[Dict[str, List[str]], Dict[str, dict]]:
+        data = read_json(self.path, {})
+        if data.get("version") != INDEX_VERSION:
+            data = {}
+        return data.get("entries", {}), data.get("snapshots", {})
+
+    def _update(self, change: Callable[[Dict[str, List[str]], Dict[str, dict]], None]) -> None:
+        """
+        Apply `change` to the index as it is on disk now and write it back
+        under a lock file, so concurrent runs never drop each other's entries.
+        """
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with locked(self.lock_path):
+                entries, snapshots = self._read()
+                change(entries, snapshots)
+                write_json(self.path, {"version": INDEX_VERSION, "entries": entries, "snapshots": snapshots})
+        except OSError as e:
+            logger.warning(f"[TorrentIndex] 无法写入种子索引{self.path}: {e}")
+            entries, snapshots = self.entries, self.snapshots
+            change(entries, snapshots)
+        self.entries, self.snapshots = entries, snapshots
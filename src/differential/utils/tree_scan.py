@@ -0,0 +1,101 @@
+import os
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from loguru import logger
+
+from differential.utils.media_name import MEDIA_EXTENSIONS
+
+
+@dataclass(frozen=True)
+class ScannedFile:
+    path: Path
+    relative: str
+    size: int
+
+    @property
+    def suffix(self) -> str:
+        return self.path.suffix.lower()
+
+
+@dataclass
+class TreeSnapshot:
+    """
+    Everything the media handlers need to know about a folder, collected in
+    one `os.scandir` walk so network shares only pay the metadata round trips
+    once.
+    """
+
+    root: Path
+    files: List[ScannedFile] = field(default_factory=list)
+    has_bdmv: bool = False
+    has_video_ts: bool = False
+
+    @property
+    def biggest_file(self) -> Optional[Path]:
+        biggest = None
+        for f in self.files:
+            if biggest is None or f.size > biggest.size:
+                biggest = f
+        return biggest.path if biggest else None
+
+    @property
+    def media_files(self) -> List[Path]:
+        return sorted(
+            (f.path for f in self.files if f.suffix in MEDIA_EXTENSIONS),
+            key=lambda path: path.as_posix().lower(),
+        )
+
+    def files_under(self, *top_folders: str) -> List[ScannedFile]:
+        """Files below any of the given top-level folders of the root, sorted by relative path."""
+        return sorted(
+            (f for f in self.files if f.relative.split("/", 1)[0] in top_folders and "/" in f.relative),
+            key=lambda f: f.relative.lower(),
+        )
+
+
+def scan_tree(root: Path) -> TreeSnapshot:
+    """
+    Walk `root` once with `os.scandir`. Symlinked folders are followed, as
+    cross-seed setups are often symlink farms; a folder already visited
+    (by device and inode) is skipped, so links back up the tree cannot loop.
+    """
+    root = Path(root)
+    snapshot = TreeSnapshot(root=root)
+    try:
+        visited = {_folder_key(os.stat(root))}
+    except OSError:
+        visited = set()
+    pending = [(root, "")]
+    while pending:
+        folder, prefix = pending.pop()
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    relative = prefix + entry.name
+                    if entry.is_dir():
+                        key = _folder_key(entry.stat())
+                        if not key[1]:
+                            # Windows leaves the inode out of cached directory entries
+                            key = _folder_key(os.stat(entry.path))
+                        if key in visited:
+                            logger.debug(f"跳过已扫描的文件夹: {entry.path}")
+                            continue
+                        visited.add(key)
+                        if entry.name.upper() == "VIDEO_TS":
+                            snapshot.has_video_ts = True
+                        pending.append((Path(entry.path), relative + "/"))
+                    elif entry.is_file():
+                        scanned = ScannedFile(Path(entry.path), relative, entry.stat().st_size)
+                        if scanned.suffix == ".bdmv":
+                            snapshot.has_bdmv = True
+                        snapshot.files.append(scanned)
+        except OSError as e:
+            logger.warning(f"无法读取文件夹{folder}: {e}")
+    snapshot.files.sort(key=lambda f: f.relative)
+    return snapshot
+
+
+def _folder_key(stat: os.stat_result) -> Tuple[int, int]:
+    return stat.st_dev, stat.st_ino
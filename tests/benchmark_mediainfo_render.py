@@ -0,0 +1,38 @@
+"""
+Compare the compact track renderer of the full MediaInfo text with the
+getattr based one it replaced.
+
+    python tests/benchmark_mediainfo_render.py --episodes 24 --repeat 5
+
+Each round renders one season pack worth of episodes; the best round is
+reported so scheduler noise stays out of the numbers.
+"""
+import sys
+import timeit
+import argparse
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from pymediainfo import MediaInfo
+
+from differential.utils.mediainfo import get_full_mediainfo
+from test_mediainfo import FULL_XML, legacy_full_mediainfo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--episodes", type=int, default=24, help="renders per round")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per renderer")
+    args = parser.parse_args()
+
+    media_info = MediaInfo(FULL_XML)
+    for name, render in (("getattr", legacy_full_mediainfo), ("compact", get_full_mediainfo)):
+        best = min(timeit.repeat(lambda: render(media_info), number=args.episodes, repeat=args.repeat))
+        print(f"{name:>8}  {best * 1000:8.2f} ms  {best / args.episodes * 1e6:8.1f} µs/episode")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import os
 import sys
+import shutil
+import time
 import tempfile
+import threading
 import unittest
 from pathlib import Path
 from unittest.mock import patch
@@ -10,6 +13,7 @@ ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "src"))
 
 from differential.utils import mediainfo_handler
+from differential.utils.cache import CACHE_ENV_VAR
 from differential.utils.mediainfo_handler import (
     BDINFO_ENV_VAR,
     BDInfoRunner,
@@ -43,6 +47,23 @@ class BDInfoRunnerTest(unittest.TestCase):
             abort=True,
         )
 
+    def test_runner_scans_only_the_given_playlist(self):
+        native = BDInfoRunner("native", "/usr/local/bin/BDInfo")
+        mono = BDInfoRunner("mono", "/opt/tools/BDInfo.exe", use_mono=True)
+
+        with patch.object(mediainfo_handler, "execute_with_output") as execute:
+            native.run(Path("/media/Some Disc"), "/tmp/report", "00800.MPLS")
+            mono.run(Path("/media/Some Disc"), "/tmp/report", "00800.MPLS")
+
+        self.assertEqual(
+            execute.call_args_list[0].args,
+            ("/usr/local/bin/BDInfo", '-m "00800.MPLS" "/media/Some Disc" "/tmp/report"'),
+        )
+        self.assertEqual(
+            execute.call_args_list[1].args,
+            ("mono", '"/opt/tools/BDInfo.exe" -m "00800.MPLS" "/media/Some Disc" "/tmp/report"'),
+        )
+
     def test_find_native_bdinfo_uses_bdinfopath(self):
         with tempfile.TemporaryDirectory() as temp_dir:
             bdinfo = Path(temp_dir).joinpath("BDInfo")
@@ -91,12 +112,136 @@ class BDInfoRunnerTest(unittest.TestCase):
         with patch.object(mediainfo_handler.platform, "system", return_value="Linux"):
             with patch.object(mediainfo_handler, "find_native_bdinfo", return_value=None):
                 with patch.object(mediainfo_handler, "_bundled_bdinfo_path", return_value=Path("/tools/BDInfo.exe")):
-                    runner = handler._select_bdinfo_runner()
+                    with patch.object(mediainfo_handler.shutil, "which", return_value="/usr/bin/mono"):
+                        runner = handler._select_bdinfo_runner()
 
         self.assertEqual(runner.name, "mono")
         self.assertEqual(runner.executable, "/tools/BDInfo.exe")
         self.assertTrue(runner.use_mono)
 
+    def test_no_runner_without_native_bdinfo_or_mono(self):
+        handler = MediaInfoHandler(Path("/media/Some Disc"), False, False, True)
+
+        with patch.object(mediainfo_handler.platform, "system", return_value="Linux"):
+            with patch.object(mediainfo_handler, "find_native_bdinfo", return_value=None):
+                with patch.object(mediainfo_handler.shutil, "which", return_value=None):
+                    self.assertIsNone(handler._select_bdinfo_runner())
+
+
+
+class FakeRunner:
+    def __init__(self, delays):
+        self.delays = delays
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.playlists = {}
+
+    def run(self, bd_path: Path, report_dir: str, playlist=None) -> None:
+        with self.lock:
+            self.playlists[bd_path.name] = playlist
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.delays[bd_path.name])
+        Path(report_dir).joinpath(f"BDINFO.{bd_path.name}.txt").write_text(
+            f"DISC INFO:\n\nDisc Title: {bd_path.name}\n\nCHAPTERS:\n"
+        )
+        with self.lock:
+            self.running -= 1
+
+
+class ParallelBDInfoScanTest(unittest.TestCase):
+    def make_discs(self, root: Path, names):
+        for name in names:
+            root.joinpath(name, "BDMV").mkdir(parents=True)
+
+    def test_discs_scan_concurrently_and_merge_in_disc_order(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as report:
+            root = Path(tmp)
+            self.make_discs(root, ["Disc1", "Disc2", "Disc3"])
+            # The first disc finishes last, its report must still come first
+            runner = FakeRunner({"Disc1": 0.2, "Disc2": 0.05, "Disc3": 0.05})
+            handler = MediaInfoHandler(root, False, False, True, bdinfo_workers=2)
+
+            with patch.object(handler, "_select_bdinfo_runner", return_value=runner):
+                handler._run_bdinfo_scan(report)
+            bdinfo = handler._collect_bdinfo_from_temp(report)
+
+            self.assertEqual(sorted(p.name for p in Path(report).iterdir()), ["000", "001", "002"])
+
+        self.assertEqual(runner.peak, 2)
+        self.assertLess(bdinfo.index("Disc1"), bdinfo.index("Disc2"))
+        self.assertLess(bdinfo.index("Disc2"), bdinfo.index("Disc3"))
+
+    def test_single_worker_scans_one_disc_at_a_time(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as report:
+            root = Path(tmp)
+            self.make_discs(root, ["A", "B"])
+            runner = FakeRunner({"A": 0.01, "B": 0.01})
+            handler = MediaInfoHandler(root, False, False, True, bdinfo_workers=1)
+
+            with patch.object(handler, "_select_bdinfo_runner", return_value=runner):
+                handler._run_bdinfo_scan(report)
+
+        self.assertEqual(runner.peak, 1)
+
+
+
+REPORT = "DISC INFO:\n\nDisc Title: Movie\n\nCHAPTERS:\n\nQUICK SUMMARY:\n\nPlaylist: 00800.MPLS\n"
+
+
+class BDInfoReportCacheTest(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        cache_env = patch.dict(os.environ, {CACHE_ENV_VAR: cache_dir.name})
+        cache_env.start()
+        self.addCleanup(cache_env.stop)
+
+    def handler(self, use_short_bdinfo: bool = False, **kwargs) -> MediaInfoHandler:
+        handler = MediaInfoHandler(Path("/media/Movie"), False, use_short_bdinfo, True, **kwargs)
+        handler.stable_cache_key = "Differential.bdinfo.v1.identity"
+        return handler
+
+    def scan(self, handler: MediaInfoHandler, playlists) -> str:
+        temp_dir = tempfile.mkdtemp(prefix=f"{handler._scan_cache_key(playlists)}.")
+        self.addCleanup(shutil.rmtree, temp_dir, True)
+        Path(temp_dir).joinpath("000").mkdir()
+        Path(temp_dir).joinpath("000", "BDINFO.txt").write_text(REPORT)
+        return temp_dir
+
+    def test_scan_moves_into_cache_and_is_found_without_globbing(self):
+        playlists = {Path("/media/Movie"): "00800.MPLS"}
+        handler = self.handler()
+        temp_dir = self.scan(handler, playlists)
+
+        self.assertIn("Disc Title: Movie", handler._collect_bdinfo_from_temp(temp_dir, handler._scan_cache_key(playlists)))
+        self.assertFalse(Path(temp_dir).exists())
+
+        with patch.object(mediainfo_handler.glob, "glob", side_effect=AssertionError("globbed temp dir")):
+            cached = self.handler(use_short_bdinfo=True)._find_cached_bdinfo(playlists)
+        self.assertEqual(cached, "QUICK SUMMARY:\n\nPlaylist: 00800.MPLS\n")
+        # Another playlist is another report
+        with patch.object(mediainfo_handler.tempfile, "gettempdir", return_value=tempfile.mkdtemp()):
+            self.assertIsNone(self.handler()._find_cached_bdinfo({Path("/media/Movie"): "00001.MPLS"}))
+
+    def test_reports_left_in_temp_dir_are_imported(self):
+        handler = self.handler()
+        temp_dir = self.scan(handler, None)
+
+        self.assertIn("Disc Title: Movie", handler._find_cached_bdinfo())
+        shutil.rmtree(temp_dir)
+        self.assertIn("Disc Title: Movie", handler._find_cached_bdinfo())
+
+    def test_reports_over_the_cap_stay_in_temp_dir(self):
+        handler = self.handler(bdinfo_cache_size=1)
+        temp_dir = self.scan(handler, None)
+        Path(temp_dir).joinpath("000", "BDINFO.txt").write_text(REPORT + "x" * 1024 * 1024)
+
+        handler._collect_bdinfo_from_temp(temp_dir, handler._scan_cache_key(None))
+
+        self.assertTrue(Path(temp_dir).exists())
+
 
 if __name__ == "__main__":
     unittest.main()
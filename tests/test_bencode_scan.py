@@ -0,0 +1,53 @@
+import sys
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+import bencodepy
+
+from differential.utils.bencode_scan import (
+    BencodeError,
+    decode_int,
+    decode_string,
+    dict_spans,
+    encode_raw_dict,
+    skip_value,
+)
+
+
+class BencodeScanTest(unittest.TestCase):
+    def test_dict_spans_point_at_raw_values(self):
+        data = bencodepy.encode(
+            {
+                b"announce": b"https://tracker.example/announce",
+                b"info": {b"files": [{b"length": 3, b"path": [b"a"]}], b"pieces": b"\x00:e" * 20},
+                b"num": -12,
+            }
+        )
+
+        spans = dict_spans(data)
+
+        self.assertEqual(decode_string(data, spans[b"announce"]), b"https://tracker.example/announce")
+        self.assertEqual(decode_int(data, spans[b"num"]), -12)
+        info = dict_spans(data, spans[b"info"][0])
+        start, end = info[b"pieces"]
+        self.assertEqual(decode_string(data, (start, end)), b"\x00:e" * 20)
+        self.assertEqual(skip_value(data, 0), len(data))
+
+    def test_encode_raw_dict_matches_bencodepy(self):
+        raw = {b"b": b"i1e", b"a": b"3:xyz"}
+
+        self.assertEqual(encode_raw_dict(raw), bencodepy.encode({b"a": b"xyz", b"b": 1}))
+
+    def test_truncated_data_raises(self):
+        with self.assertRaises(BencodeError):
+            dict_spans(b"d4:info5:abce")
+        with self.assertRaises(BencodeError):
+            dict_spans(b"d4:infoi1e")
+
+
+if __name__ == "__main__":
+    unittest.main()
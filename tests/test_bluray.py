@@ -0,0 +1,232 @@
+import sys
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from differential.utils import mediainfo_handler
+from differential.utils.bluray import main_playlist, quick_summary, read_clip_aspect_ratio, read_playlist
+from differential.utils.mediainfo_handler import MediaInfoHandler
+
+
+AVC_1080P = bytes([0x1B, (6 << 4) | 1, 0, 0, 0])
+HEVC_HDR10 = bytes([0x24, (8 << 4) | 1, (1 << 4) | 2, 0, 0])
+DTS_HD_MA_ENG = bytes([0x86, (6 << 4) | 1]) + b"eng"
+AC3_STEREO_JPN = bytes([0x81, (3 << 4) | 1]) + b"jpn"
+PG_CHI = bytes([0x90]) + b"chi" + b"\0"
+
+
+def stream(attributes: bytes, pid: int = 0x1011) -> bytes:
+    entry = bytes([1]) + struct.pack(">H", pid) + bytes(6)
+    return bytes([len(entry)]) + entry + bytes([len(attributes)]) + attributes
+
+
+def build_mpls(items, video=(AVC_1080P,), audio=(), subtitles=(), angles: int = 1) -> bytes:
+    stn_streams = b"".join(stream(s) for s in (*video, *audio, *subtitles))
+    stn_body = bytes(2) + bytes([len(video), len(audio), len(subtitles), 0, 0, 0, 0]) + bytes(5) + stn_streams
+    play_items = b""
+    for clip, in_time, out_time in items:
+        body = clip.encode() + b"M2TS" + struct.pack(">H", 0x10 if angles > 1 else 0) + bytes(1)
+        body += struct.pack(">II", in_time, out_time) + bytes(8) + bytes(4)
+        if angles > 1:
+            body += bytes([angles, 0]) + b"".join(f"{i:05d}".encode() + b"M2TS" + bytes(1) for i in range(angles - 1))
+        body += struct.pack(">H", len(stn_body)) + stn_body
+        play_items += struct.pack(">H", len(body)) + body
+    playlist = struct.pack(">IHHH", 6 + len(play_items), 0, len(items), 0) + play_items
+    app_info = struct.pack(">I", 14) + bytes(14)
+    header = b"MPLS0200" + struct.pack(">III", 58, 0, 0) + bytes(20)
+    return header + app_info + playlist
+
+
+def build_clpi(aspect_code: int = 3) -> bytes:
+    coding = bytes([0x1B, (6 << 4) | 1, aspect_code << 4, 0, 0, 0])
+    program = bytes([0, 1]) + struct.pack(">IHBB", 0, 0x100, 1, 0) + struct.pack(">H", 0x1011)
+    program += bytes([len(coding)]) + coding
+    return b"HDMV0200" + struct.pack(">IIIII", 0, 40, 0, 0, 0) + bytes(12) + struct.pack(">I", len(program)) + program
+
+
+def make_disc(root: Path, playlists: dict, clips: dict) -> Path:
+    for sub in ("PLAYLIST", "CLIPINF", "STREAM"):
+        root.joinpath("BDMV", sub).mkdir(parents=True, exist_ok=True)
+    for name, data in playlists.items():
+        root.joinpath("BDMV", "PLAYLIST", name).write_bytes(data)
+    for clip, size in clips.items():
+        root.joinpath("BDMV", "STREAM", f"{clip}.m2ts").write_bytes(b"\0" * size)
+        root.joinpath("BDMV", "CLIPINF", f"{clip}.clpi").write_bytes(build_clpi())
+    return root
+
+
+class PlaylistReaderTest(unittest.TestCase):
+    def test_reads_play_items_and_first_item_streams(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "00800.mpls"
+            path.write_bytes(
+                build_mpls(
+                    [("00001", 0, 45000 * 60), ("00002", 45000, 45000 * 31)],
+                    video=(HEVC_HDR10,),
+                    audio=(DTS_HD_MA_ENG, AC3_STEREO_JPN),
+                    subtitles=(PG_CHI,),
+                )
+            )
+            playlist = read_playlist(path)
+
+        self.assertEqual(playlist.name, "00800.MPLS")
+        self.assertEqual([item.clip for item in playlist.items], ["00001", "00002"])
+        self.assertEqual(playlist.duration, 90)
+        self.assertEqual([s.codec for s in playlist.streams_of("audio")], ["DTS-HD Master Audio", "Dolby Digital Audio"])
+        self.assertEqual([s.language_name for s in playlist.streams_of("audio")], ["English", "Japanese"])
+        self.assertEqual(playlist.streams_of("subtitle")[0].language, "chi")
+        video = playlist.streams_of("video")[0]
+        self.assertEqual((video.codec, video.video_format, video.dynamic_range, video.color_space), ("MPEG-H HEVC Video", 8, 1, 2))
+
+    def test_multi_angle_items_skip_the_angle_table(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "00001.mpls"
+            path.write_bytes(build_mpls([("00001", 0, 45000)], audio=(DTS_HD_MA_ENG,), angles=3))
+            playlist = read_playlist(path)
+
+        self.assertEqual(playlist.streams_of("audio")[0].language, "eng")
+
+    def test_clip_aspect_ratio(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "00001.clpi"
+            path.write_bytes(build_clpi(aspect_code=2))
+            self.assertEqual(read_clip_aspect_ratio(path), "4:3")
+
+
+class QuickSummaryTest(unittest.TestCase):
+    def test_main_playlist_skips_loops(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            disc = make_disc(
+                Path(tmp) / "MOVIE",
+                {
+                    "00000.mpls": build_mpls([("00009", 0, 45000 * 600)] * 20),
+                    "00001.mpls": build_mpls([("00001", 0, 45000 * 5400)]),
+                    "00002.mpls": build_mpls([("00002", 0, 45000 * 120)]),
+                    "00003.mpls": b"not a playlist",
+                },
+                {"00001": 10, "00002": 10, "00009": 10},
+            )
+            self.assertEqual(main_playlist(disc).name, "00001.MPLS")
+
+    def test_summary_block(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            disc = make_disc(
+                Path(tmp) / "MOVIE_DISC",
+                {
+                    "00800.mpls": build_mpls(
+                        [("00001", 0, 45000 * 3600), ("00002", 0, 45000 * 1800)],
+                        audio=(DTS_HD_MA_ENG, AC3_STEREO_JPN),
+                        subtitles=(PG_CHI,),
+                    )
+                },
+                {"00001": 3000, "00002": 1500},
+            )
+            disc.joinpath("AACS").mkdir()
+            disc.joinpath("BDMV", "META", "DL").mkdir(parents=True)
+            disc.joinpath("BDMV", "META", "DL", "bdmt_eng.xml").write_text(
+                "<disclib><di:discinfo><di:title><di:name>Some Movie</di:name></di:title></di:discinfo></disclib>"
+            )
+            disc_size = sum(p.stat().st_size for p in disc.rglob("*") if p.is_file())
+
+            summary = quick_summary(disc)
+
+        self.assertEqual(
+            summary,
+            "QUICK SUMMARY:\n\n"
+            "Disc Title: Some Movie\n"
+            "Disc Label: MOVIE_DISC\n"
+            f"Disc Size: {disc_size:,} bytes\n"
+            "Protection: AACS\n"
+            "Playlist: 00800.MPLS\n"
+            "Size: 4,500 bytes\n"
+            "Length: 1:30:00.000\n"
+            "Total Bitrate: 0.00 Mbps\n"
+            "Video: MPEG-4 AVC Video / 1080p / 23.976 fps / 16:9\n"
+            "Audio: English / DTS-HD Master Audio / Multi-channel / 48 kHz\n"
+            "Audio: Japanese / Dolby Digital Audio / 2.0 / 48 kHz\n"
+            "Subtitle: Chinese\n",
+        )
+
+    def test_no_playlists(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertIsNone(quick_summary(make_disc(Path(tmp), {}, {})))
+
+
+class NativeBDInfoHandlerTest(unittest.TestCase):
+    def make_set(self, root: Path):
+        for name in ("Disc2", "Disc1"):
+            make_disc(root / name, {"00001.mpls": build_mpls([("00001", 0, 45000 * 60)])}, {"00001": 10})
+
+    def test_native_short_bdinfo_reads_playlists_without_bdinfo(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.make_set(Path(tmp))
+            handler = MediaInfoHandler(Path(tmp), False, True, True, native_bdinfo=True)
+
+            with patch.object(handler, "_select_bdinfo_runner") as select:
+                bdinfo = handler._get_bdinfo()
+
+        select.assert_not_called()
+        self.assertEqual(bdinfo.count("QUICK SUMMARY:"), 2)
+        self.assertLess(bdinfo.index("Disc Label: Disc1"), bdinfo.index("Disc Label: Disc2"))
+
+    def test_summary_is_the_fallback_without_a_runner(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.make_set(Path(tmp))
+            handler = MediaInfoHandler(Path(tmp), False, False, True)
+
+            with patch.object(handler, "_find_cached_bdinfo", return_value=None), patch.object(
+                mediainfo_handler.platform, "system", return_value="Linux"
+            ), patch.object(mediainfo_handler, "find_native_bdinfo", return_value=None), patch.object(
+                mediainfo_handler.shutil, "which", return_value=None
+            ):
+                bdinfo = handler._get_bdinfo()
+
+        self.assertTrue(bdinfo.startswith("QUICK SUMMARY:"))
+
+    def test_full_bdinfo_scans_the_main_playlist_only(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as report:
+            root = Path(tmp)
+            make_disc(
+                root / "Disc1",
+                {
+                    "00001.mpls": build_mpls([("00001", 0, 45000 * 60)]),
+                    "00800.mpls": build_mpls([("00002", 0, 45000 * 5400)]),
+                },
+                {"00001": 10, "00002": 10},
+            )
+            make_disc(root / "Disc2", {}, {})
+            handler = MediaInfoHandler(root, False, False, True)
+            handler.stable_cache_key = "Differential.bdinfo.v1.identity"
+            runner = Mock()
+
+            with patch.object(handler, "_find_cached_bdinfo", return_value=None) as find_cached, patch.object(
+                handler, "_select_bdinfo_runner", return_value=runner
+            ), patch.object(mediainfo_handler.tempfile, "mkdtemp", return_value=report) as mkdtemp:
+                handler._get_bdinfo()
+
+        self.assertEqual(
+            sorted((c.args[0].name, c.args[2]) for c in runner.run.call_args_list),
+            [("Disc1", "00800.MPLS"), ("Disc2", None)],
+        )
+        self.assertEqual(find_cached.call_args.args[0], {root / "Disc1": "00800.MPLS", root / "Disc2": None})
+        self.assertEqual(mkdtemp.call_args.kwargs["prefix"], "Differential.bdinfo.v1.identity.mpls-00800-all.")
+
+    def test_short_bdinfo_runs_bdinfo_by_default(self):
+        handler = MediaInfoHandler(Path("/media/Some Disc"), False, True, True)
+
+        with patch.object(handler, "_native_quick_summary") as native, patch.object(
+            handler, "_find_cached_bdinfo", return_value="cached"
+        ):
+            self.assertEqual(handler._get_bdinfo(), "cached")
+
+        native.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -63,6 +63,41 @@ class ConfigTest(unittest.TestCase):
 
                 self.assertEqual(merged["screenshot_tonemap"], expected)
 
+    def test_torrent_targets_merge_config_and_command_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = Path(tmp) / "config.ini"
+            config.write_text(
+                textwrap.dedent(
+                    """
+                    [NexusPHP]
+                    torrent_targets = PTer=https://a.example/announce?passkey=1,
+                        CHD=https://b.example/announce.php?passkey=2
+                    """
+                ).strip(),
+                encoding="utf-8",
+            )
+
+            from_config = merge_config(
+                Namespace(config=str(config), plugin="NexusPHP", section="")
+            )
+            from_cli = merge_config(
+                Namespace(
+                    config=str(config),
+                    plugin="NexusPHP",
+                    section="",
+                    torrent_targets=["HDB=https://c.example/announce", "broken"],
+                )
+            )
+
+        self.assertEqual(
+            from_config["torrent_targets"],
+            [
+                ("PTer", "https://a.example/announce?passkey=1"),
+                ("CHD", "https://b.example/announce.php?passkey=2"),
+            ],
+        )
+        self.assertEqual(from_cli["torrent_targets"], [("HDB", "https://c.example/announce")])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,418 @@
+import sys
+import struct
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from pathlib import Path
+from unittest.mock import patch
+
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from differential.utils import bluray, mediainfo_handler
+from differential.utils.disc_image import DiscImage, ExtentReader, ImageFile, ImageFileServer
+from differential.utils.mediainfo_handler import MediaInfoHandler
+
+
+SECTOR = 2048
+PARTITION_START = 300
+
+
+def descriptor(identifier: int, size: int = SECTOR) -> bytearray:
+    data = bytearray(size)
+    struct.pack_into("<H", data, 0, identifier)
+    return data
+
+
+def short_ad(lbn: int, length: int, kind: int = 0) -> bytes:
+    return struct.pack("<II", (kind << 30) | length, lbn)
+
+
+def long_ad(lbn: int, length: int, partition: int) -> bytes:
+    return struct.pack("<IIH", length, lbn, partition) + bytes(6)
+
+
+def file_entry(size: int, descriptors: bytes, ad_type: int = 0, extended: bool = False) -> bytes:
+    entry = descriptor(266 if extended else 261)
+    struct.pack_into("<H", entry, 34, ad_type)
+    struct.pack_into("<Q", entry, 56, size)
+    base = 208 if extended else 168
+    struct.pack_into("<II", entry, base, 0, len(descriptors))
+    entry[base + 8 : base + 8 + len(descriptors)] = descriptors
+    return bytes(entry)
+
+
+def file_identifier(name: str, lbn: int, partition: int, directory: bool = False, parent: bool = False) -> bytes:
+    raw = b""
+    if not parent:
+        raw = b"\x08" + name.encode("latin-1") if name.isascii() else b"\x10" + name.encode("utf-16-be")
+    fid = descriptor(257, 38)
+    fid[18] = (0x02 if directory else 0) | (0x08 if parent else 0)
+    fid[19] = len(raw)
+    fid[20:36] = long_ad(lbn, SECTOR, partition)
+    data = bytes(fid) + raw
+    return data + bytes(-len(data) % 4)
+
+
+def as_tree(files: dict) -> dict:
+    tree = {}
+    for relative, data in files.items():
+        node = tree
+        *folders, name = relative.split("/")
+        for folder in folders:
+            node = node.setdefault(folder, {})
+        if name:
+            node[name] = data
+    return tree
+
+
+class UDFBuilder:
+    """
+    Writes a small UDF image. With `metadata` the file entries and folders
+    live on a UDF 2.50 metadata partition, split over two runs of blocks.
+    """
+
+    def __init__(self, metadata: bool = False):
+        self.metadata = metadata
+        self.reference = 1 if metadata else 0
+        self.blocks = {}
+        self.next_entry = 0 if metadata else 10
+        self.next_data = 200
+
+    def entry_block(self, lbn: int) -> int:
+        if not self.metadata:
+            return lbn
+        return 50 + lbn if lbn < 4 else 80 + lbn - 4
+
+    def add_entry(self, data: bytes = b"") -> int:
+        lbn = self.next_entry
+        self.next_entry += max(-(-len(data) // SECTOR), 1)
+        self.put_entry(lbn, data)
+        return lbn
+
+    def put_entry(self, lbn: int, data: bytes) -> None:
+        for i in range(0, len(data), SECTOR):
+            self.blocks[self.entry_block(lbn + i // SECTOR)] = data[i : i + SECTOR]
+
+    def add_data(self, data: bytes, gap: bool = False) -> list:
+        """Store `data` on the physical partition, as two extents with a hole between them when `gap`."""
+        size = len(data)
+        parts = [data[: size // 2 // SECTOR * SECTOR], data[size // 2 // SECTOR * SECTOR :]] if gap else [data]
+        extents = []
+        for part in parts:
+            extents.append((self.next_data, len(part)))
+            for i in range(0, len(part), SECTOR):
+                self.blocks[self.next_data] = part[i : i + SECTOR]
+                self.next_data += 1
+            self.next_data += 1 if gap else 0
+        return extents
+
+    def add_file(self, data: bytes) -> int:
+        if len(data) <= 64:
+            return self.add_entry(file_entry(len(data), data, ad_type=3, extended=self.metadata))
+        if len(data) > 2 * SECTOR:
+            descriptors = b"".join(long_ad(lbn, length, 0) for lbn, length in self.add_data(data, gap=True))
+            return self.add_entry(file_entry(len(data), descriptors, ad_type=1, extended=self.metadata))
+        descriptors = b"".join(short_ad(lbn, length) for lbn, length in self.add_data(data))
+        return self.add_entry(file_entry(len(data), descriptors, extended=self.metadata))
+
+    def add_folder(self, node: dict, parent: int = None) -> int:
+        entry = self.add_entry()
+        fids = [file_identifier("", entry if parent is None else parent, self.reference, directory=True, parent=True)]
+        for name, child in sorted(node.items()):
+            if isinstance(child, dict):
+                fids.append(file_identifier(name, self.add_folder(child, entry), self.reference, directory=True))
+            else:
+                fids.append(file_identifier(name, self.add_file(child), self.reference))
+        data = b"".join(fids)
+        self.put_entry(entry, file_entry(len(data), short_ad(self.add_entry(data), len(data)), extended=self.metadata))
+        return entry
+
+    def build(self, path: Path, files: dict) -> Path:
+        fsd = self.add_entry(bytes(SECTOR))
+        root = self.add_folder(as_tree(files))
+        fsd_block = descriptor(256)
+        fsd_block[400:416] = long_ad(root, SECTOR, self.reference)
+        self.put_entry(fsd, bytes(fsd_block))
+        if self.metadata:
+            blocks = self.next_entry - 4
+            self.blocks[40] = file_entry((4 + blocks) * SECTOR, short_ad(50, 4 * SECTOR) + short_ad(80, blocks * SECTOR))
+
+        image = bytearray((PARTITION_START + max(self.blocks) + 1) * SECTOR)
+        anchor = descriptor(2)
+        struct.pack_into("<II", anchor, 16, 3 * SECTOR, 32)
+        image[256 * SECTOR : 257 * SECTOR] = anchor
+        partition = descriptor(5)
+        struct.pack_into("<H", partition, 22, 0)
+        struct.pack_into("<II", partition, 188, PARTITION_START, len(image) // SECTOR - PARTITION_START)
+        image[32 * SECTOR : 33 * SECTOR] = partition
+
+        volume = descriptor(6)
+        struct.pack_into("<I", volume, 212, SECTOR)
+        volume[248:264] = long_ad(fsd, SECTOR, self.reference)
+        maps = bytes([1, 6]) + struct.pack("<HH", 1, 0)
+        if self.metadata:
+            metadata_map = bytearray(64)
+            metadata_map[0:2] = bytes([2, 64])
+            metadata_map[5:28] = b"*UDF Metadata Partition"
+            struct.pack_into("<HHI", metadata_map, 36, 1, 0, 40)
+            maps += bytes(metadata_map)
+        struct.pack_into("<II", volume, 264, len(maps), 2 if self.metadata else 1)
+        volume[440 : 440 + len(maps)] = maps
+        image[33 * SECTOR : 34 * SECTOR] = volume
+        image[34 * SECTOR : 35 * SECTOR] = descriptor(8)
+
+        for lbn, data in self.blocks.items():
+            offset = (PARTITION_START + lbn) * SECTOR
+            image[offset : offset + len(data)] = data
+        path.write_bytes(bytes(image))
+        return path
+
+
+def iso_record(name: bytes, lba: int, size: int, flags: int = 0) -> bytes:
+    record = bytearray(33 + len(name) + (len(name) + 1) % 2)
+    record[0] = len(record)
+    # Both-endian fields
+    record[2:10] = struct.pack("<I", lba) + struct.pack(">I", lba)
+    record[10:18] = struct.pack("<I", size) + struct.pack(">I", size)
+    record[25] = flags
+    record[28:32] = struct.pack("<H", 1) + struct.pack(">H", 1)
+    record[32] = len(name)
+    record[33 : 33 + len(name)] = name
+    return bytes(record)
+
+
+def build_iso9660(path: Path, files: dict, split: str = None) -> Path:
+    """A plain ISO9660 image; the file named `split` is stored as a multi-extent file."""
+    sectors = {}
+    next_sector = [20]
+
+    def allocate(data: bytes) -> int:
+        lba = next_sector[0]
+        for i in range(0, max(len(data), 1), SECTOR):
+            sectors[next_sector[0]] = data[i : i + SECTOR]
+            next_sector[0] += 1
+        return lba
+
+    def add_folder(node: dict, prefix: str = "") -> tuple:
+        lba = allocate(bytes(SECTOR))
+        records = [iso_record(b"\x00", lba, SECTOR, 0x02), iso_record(b"\x01", lba, SECTOR, 0x02)]
+        for name, child in sorted(node.items()):
+            if isinstance(child, dict):
+                child_lba, child_size = add_folder(child, f"{prefix}{name}/")
+                records.append(iso_record(name.upper().encode(), child_lba, child_size, 0x02))
+            elif f"{prefix}{name}" == split:
+                half = len(child) // 2 // SECTOR * SECTOR
+                record_name = f"{name.upper()};1".encode()
+                records.append(iso_record(record_name, allocate(child[:half]), half, 0x80))
+                records.append(iso_record(record_name, allocate(child[half:]), len(child) - half))
+            else:
+                records.append(iso_record(f"{name.upper()};1".encode(), allocate(child), len(child)))
+        sectors[lba] = b"".join(records)
+        return lba, SECTOR
+
+    root_lba, root_size = add_folder(as_tree(files))
+    image = bytearray((max(sectors) + 1) * SECTOR)
+    primary = bytearray(SECTOR)
+    primary[0:7] = b"\x01CD001\x01"
+    primary[156:190] = iso_record(b"\x00", root_lba, root_size, 0x02)
+    image[16 * SECTOR : 17 * SECTOR] = primary
+    image[17 * SECTOR : 17 * SECTOR + 7] = b"\xffCD001\x01"
+    for lba, data in sectors.items():
+        image[lba * SECTOR : lba * SECTOR + len(data)] = data
+    path.write_bytes(bytes(image))
+    return path
+
+
+def minimal_mpls(clip: str, seconds: int) -> bytes:
+    stn = struct.pack(">H", 14) + bytes(14)
+    item = clip.encode() + b"M2TS" + bytes(3) + struct.pack(">II", 0, seconds * 45000) + bytes(12) + stn
+    playlist = struct.pack(">IHHH", 6 + 2 + len(item), 0, 1, 0) + struct.pack(">H", len(item)) + item
+    return b"MPLS0200" + struct.pack(">III", 40, 0, 0) + bytes(20) + playlist
+
+
+STREAM = bytes(range(256)) * 40
+DISC_FILES = {
+    "BDMV/index.bdmv": b"INDX0200",
+    "BDMV/PLAYLIST/00800.mpls": minimal_mpls("00001", 5400),
+    "BDMV/STREAM/00001.m2ts": STREAM,
+    "BDMV/STREAM/00002.m2ts": STREAM[:3000],
+    "BDMV/META/DL/bdmt_eng.xml": b"<di:name>Some Movie</di:name>",
+    "AACS/": b"",
+    "字幕/说明.txt": "中文".encode() * 40,
+}
+
+
+class DiscImageTest(unittest.TestCase):
+    def check_disc(self, image: DiscImage, files: dict = DISC_FILES):
+        # ISO9660 names are upper case
+        self.assertEqual([name.lower() for name in image.list("BDMV/STREAM")], ["00001.m2ts", "00002.m2ts"])
+        self.assertTrue(image.has_folder("aacs"))
+        self.assertEqual(image.size("bdmv/stream/00001.M2TS"), len(STREAM))
+        for relative, data in files.items():
+            if data:
+                self.assertEqual(image.read(relative), data, relative)
+
+        tree = image.tree()
+        self.assertTrue(tree.has_bdmv)
+        self.assertEqual(tree.biggest_file.relative_to(image.path).as_posix().lower(), "bdmv/stream/00001.m2ts")
+
+    def test_udf(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            image = DiscImage(UDFBuilder().build(Path(tmp) / "Movie.iso", DISC_FILES))
+            with image:
+                self.assertEqual(image.format, "UDF")
+                self.check_disc(image)
+
+    def test_udf_metadata_partition(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            image = DiscImage(UDFBuilder(metadata=True).build(Path(tmp) / "Movie.iso", DISC_FILES))
+            with image:
+                self.assertEqual(image.format, "UDF")
+                self.check_disc(image)
+
+    def test_iso9660_fallback(self):
+        files = {k: v for k, v in DISC_FILES.items() if k.isascii()}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = build_iso9660(Path(tmp) / "Movie.iso", files, split="BDMV/STREAM/00001.m2ts")
+            with DiscImage(path) as image:
+                self.assertEqual(image.format, "ISO9660")
+                self.assertEqual(len(image.find("BDMV/STREAM/00001.m2ts").extents), 2)
+                self.check_disc(image, files)
+
+    def test_not_an_image(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "Movie.iso"
+            path.write_bytes(b"iso")
+            with self.assertRaises(ValueError):
+                DiscImage(path)
+
+
+class ExtentReaderTest(unittest.TestCase):
+    def test_reads_across_extents_and_holes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "image"
+            path.write_bytes(b"0123456789abcdef")
+            image_file = ImageFile("file", 11, ((10, 4), (None, 3), (2, 6)))
+
+            with ExtentReader(path, image_file) as reader:
+                self.assertEqual(reader.read(), b"abcd\0\0\x002345")
+                reader.seek(-5, 2)
+                self.assertEqual(reader.read(3), b"\x0023")
+                reader.seek(3)
+                self.assertEqual(reader.read(2), b"d\0")
+                reader.seek(100)
+                self.assertEqual(reader.read(), b"")
+
+
+class ImageFileServerTest(unittest.TestCase):
+    def test_serves_byte_ranges(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with DiscImage(UDFBuilder().build(Path(tmp) / "Movie.iso", DISC_FILES)) as image:
+                server = ImageFileServer(image)
+                try:
+                    url = server.url("BDMV/STREAM/00001.m2ts")
+                    with urllib.request.urlopen(url) as response:
+                        self.assertEqual(response.read(), STREAM)
+
+                    request = urllib.request.Request(url, headers={"Range": "bytes=5000-5009"})
+                    with urllib.request.urlopen(request) as response:
+                        self.assertEqual(response.status, 206)
+                        self.assertEqual(response.headers["Content-Range"], f"bytes 5000-5009/{len(STREAM)}")
+                        self.assertEqual(response.read(), STREAM[5000:5010])
+
+                    with self.assertRaises(urllib.error.HTTPError) as missing:
+                        urllib.request.urlopen(server.url("BDMV/STREAM/99999.m2ts"))
+                    self.assertEqual(missing.exception.code, 404)
+                    missing.exception.close()
+                finally:
+                    server.close()
+
+    def test_rejects_requests_without_token_and_bad_ranges(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with DiscImage(UDFBuilder().build(Path(tmp) / "Movie.iso", DISC_FILES)) as image:
+                server = ImageFileServer(image)
+                try:
+                    url = server.url("BDMV/STREAM/00001.m2ts")
+                    host, port = server.server.server_address[:2]
+                    for guess in (f"http://{host}:{port}/BDMV/STREAM/00001.m2ts", url.replace(server.token, "x" * 22)):
+                        with self.assertRaises(urllib.error.HTTPError) as denied:
+                            urllib.request.urlopen(guess)
+                        self.assertEqual(denied.exception.code, 403)
+                        denied.exception.close()
+
+                    for header in ("bytes=abc-", "bytes=-x", "bytes=10-5"):
+                        request = urllib.request.Request(url, headers={"Range": header})
+                        with self.assertRaises(urllib.error.HTTPError) as invalid:
+                            urllib.request.urlopen(request)
+                        self.assertEqual(invalid.exception.code, 416)
+                        invalid.exception.close()
+
+                    # The server keeps answering after them
+                    with urllib.request.urlopen(url) as response:
+                        self.assertEqual(response.read(), STREAM)
+                finally:
+                    server.close()
+
+
+class ImageHandlerTest(unittest.TestCase):
+    def test_iso_is_read_without_mounting(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            iso = UDFBuilder(metadata=True).build(Path(tmp) / "Movie.iso", DISC_FILES)
+            handler = MediaInfoHandler(iso, False, True, True)
+
+            def parse(path, cache_key=None, source=None):
+                self.assertEqual(source.read(), STREAM)
+                return mediainfo_handler.MediaInfo("<File></File>")
+
+            with patch.object(handler, "_mount_iso") as mount, patch.object(
+                mediainfo_handler, "parse_mediainfo", side_effect=parse
+            ):
+                main_file = handler.find_mediainfo()
+            try:
+                self.assertEqual(main_file, iso.joinpath("BDMV", "STREAM", "00001.m2ts"))
+                self.assertTrue(handler.is_bdmv)
+                self.assertIn("Playlist: 00800.MPLS", handler.bdinfo)
+                self.assertIn("Disc Title: Some Movie", handler.bdinfo)
+                self.assertIn("Protection: AACS", handler.bdinfo)
+                with urllib.request.urlopen(handler.media_input) as response:
+                    self.assertEqual(response.read(), STREAM)
+            finally:
+                handler.cleanup()
+
+        mount.assert_not_called()
+        self.assertIsNone(handler.image)
+
+    def test_full_scan_mounts_the_image(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            iso = UDFBuilder().build(Path(tmp) / "Movie.iso", DISC_FILES)
+            handler = MediaInfoHandler(iso, False, False, True)
+            self.assertTrue(handler._open_image())
+            playlists = handler._main_playlists()
+            self.assertEqual(list(playlists.values()), ["00800.MPLS"])
+
+            mount_dir = Path(tmp) / "mounted"
+            mount_dir.joinpath("BDMV").mkdir(parents=True)
+
+            def mount():
+                handler.iso_mount_dir = mount_dir
+                handler.folder = mount_dir
+
+            with patch.object(handler, "_mount_iso", side_effect=mount):
+                self.assertEqual(handler._mount_image_for_bdinfo(playlists), {mount_dir: "00800.MPLS"})
+            handler.image.close()
+
+    def test_summary_of_an_image(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with DiscImage(UDFBuilder().build(Path(tmp) / "Movie.iso", DISC_FILES)) as image:
+                summary = bluray.quick_summary(image)
+
+        self.assertIn("Disc Label: Movie\n", summary)
+        self.assertIn(f"Size: {len(STREAM):,} bytes\n", summary)
+        self.assertIn("Length: 1:30:00.000\n", summary)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import random
+import sys
+import tempfile
+import unittest
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from differential.utils import frame_score
+from differential.utils.frame_score import SCORE_HEIGHT, SCORE_WIDTH, frame_stats
+from differential.utils.screenshot_handler import ScreenshotHandler
+
+
+def flat_frame(luma: int) -> bytes:
+    return bytes([luma]) * (SCORE_WIDTH * SCORE_HEIGHT)
+
+
+def noisy_frame(seed: int = 1) -> bytes:
+    rng = random.Random(seed)
+    return bytes(rng.randrange(32, 224) for _ in range(SCORE_WIDTH * SCORE_HEIGHT))
+
+
+def blurred_frame() -> bytes:
+    # A smooth diagonal gradient: plenty of levels, almost no edges
+    return bytes(
+        32 + (x + y) * 160 // (SCORE_WIDTH + SCORE_HEIGHT) for y in range(SCORE_HEIGHT) for x in range(SCORE_WIDTH)
+    )
+
+
+class FrameStatsTest(unittest.TestCase):
+    def test_black_and_flat_frames_score_zero(self):
+        self.assertEqual(frame_stats(flat_frame(0)).score, 0.0)
+        self.assertEqual(frame_stats(flat_frame(128)).score, 0.0)
+        self.assertEqual(frame_stats(flat_frame(128)).entropy, 0.0)
+
+    def test_sharp_frame_beats_blurred_frame(self):
+        sharp, blurred = frame_stats(noisy_frame()), frame_stats(blurred_frame())
+
+        self.assertGreater(sharp.sharpness, blurred.sharpness)
+        self.assertGreater(sharp.score, blurred.score)
+        self.assertGreater(blurred.score, 0.0)
+
+    def test_plain_python_statistics(self):
+        with mock.patch.object(frame_score, "numpy", None):
+            stats = frame_stats(bytes([10, 20, 30, 40, 50, 60, 70, 80, 90]), 3, 3)
+
+        # Only the centre pixel has four neighbours: 20 + 80 + 40 + 60 - 4 * 50 = 0
+        self.assertEqual(stats.mean, 50.0)
+        self.assertEqual(stats.sharpness, 0.0)
+        self.assertAlmostEqual(stats.entropy, 3.169925, places=5)
+
+    @unittest.skipIf(frame_score.numpy is None, "NumPy is not installed")
+    def test_numpy_matches_plain_python(self):
+        frame = noisy_frame()
+        with mock.patch.object(frame_score, "numpy", None):
+            expected = frame_stats(frame)
+        actual = frame_stats(frame)
+
+        self.assertAlmostEqual(actual.mean, expected.mean, places=6)
+        self.assertAlmostEqual(actual.sharpness, expected.sharpness, places=3)
+        self.assertAlmostEqual(actual.entropy, expected.entropy, places=6)
+
+    def test_short_buffer(self):
+        with self.assertRaises(ValueError):
+            frame_stats(b"\0" * 10)
+
+
+class ContentAwareScreenshotTest(unittest.TestCase):
+    def make_handler(self, tmp):
+        return ScreenshotHandler(
+            folder=Path(tmp) / "ContentAwareCase",
+            screenshot_count=2,
+            optimize_screenshot=False,
+            screenshot_tonemap="never",
+            screenshot_keyframes=False,
+            screenshot_content_aware=True,
+        )
+
+    def test_candidate_command_pipes_small_gray_frames(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            args = ScreenshotHandler._build_candidate_ffmpeg_args(Path(tmp) / "movie.mkv", [1000, 2000])
+
+        movie = (Path(tmp) / "movie.mkv").absolute()
+        self.assertEqual(
+            args,
+            f'-v error -ss 1000ms -skip_frame nokey -i "{movie}" -ss 2000ms -skip_frame nokey -i "{movie}" '
+            f'-filter_complex "[0:v:0]trim=end_frame=1,scale=160:90,setsar=1,format=gray[c0];'
+            f'[1:v:0]trim=end_frame=1,scale=160:90,setsar=1,format=gray[c1];[c0][c1]concat=n=2:v=1:a=0[out]" '
+            f'-map "[out]" -f rawvideo -pix_fmt gray -',
+        )
+
+    def test_full_resolution_only_for_the_best_candidate(self):
+        def execute_bytes(binary_name, args, timeout=None):
+            seeks = [int(s.split("ms")[0]) for s in args.split("-ss ")[1:]]
+            # The first slot: sharp, black, blurred; the second: all black
+            if seeks[0] == 15000:
+                return noisy_frame() + flat_frame(0) + blurred_frame()
+            return flat_frame(0) * len(seeks)
+
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as out:
+            handler = self.make_handler(tmp)
+            with mock.patch(
+                "differential.utils.screenshot_handler.execute_bytes", side_effect=execute_bytes
+            ) as candidates, mock.patch("differential.utils.screenshot_handler.execute") as execute, mock.patch(
+                "differential.utils.screenshot_handler.tempfile.mkdtemp", return_value=out
+            ):
+                handler._generate_screenshots(Path(tmp) / "movie.mkv", "1920x1080", Decimal("60000"))
+
+        self.assertEqual(candidates.call_count, 2)
+        self.assertTrue(all(c.args[1].count(" -i ") == 3 for c in candidates.call_args_list))
+        seeks = sorted(int(c.args[1].split(" ")[2].split("ms")[0]) for c in execute.call_args_list)
+        # Candidates are 5s apart; the all black slot keeps its even spacing
+        self.assertEqual(seeks, [15000, 40000])
+
+    def test_undecodable_candidates_keep_the_timestamp(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as out:
+            handler = self.make_handler(tmp)
+            with mock.patch(
+                "differential.utils.screenshot_handler.execute_bytes", return_value=b""
+            ), mock.patch("differential.utils.screenshot_handler.execute") as execute, mock.patch(
+                "differential.utils.screenshot_handler.tempfile.mkdtemp", return_value=out
+            ):
+                handler._generate_screenshots(Path(tmp) / "movie.mkv", "1920x1080", Decimal("60000"))
+
+        seeks = sorted(int(c.args[1].split(" ")[2].split("ms")[0]) for c in execute.call_args_list)
+        self.assertEqual(seeks, [20000, 40000])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import subprocess
 import sys
 import tempfile
+import threading
 import unittest
 from pathlib import Path
 from types import SimpleNamespace
@@ -113,7 +114,7 @@ class MediaInfoIsoMountTest(unittest.TestCase):
             with mock.patch.object(handler, "_mount_iso", side_effect=fake_mount) as mount_iso, mock.patch(
                 "differential.utils.mediainfo_handler.platform.system", return_value="Linux"
             ), mock.patch(
-                "differential.utils.mediainfo_handler.MediaInfo.parse",
+                "differential.utils.mediainfo_handler.parse_mediainfo",
                 return_value=SimpleNamespace(to_data=lambda: {}),
             ):
                 main_file = handler.find_mediainfo()
@@ -266,15 +267,11 @@ class MediaInfoIsoMountTest(unittest.TestCase):
         self.assertIn("DISC INFO", cached)
 
     def test_short_bdinfo_extracts_quick_summary_at_eof(self):
-        with tempfile.TemporaryDirectory() as tmp:
-            report = Path(tmp) / "BDINFO.txt"
-            report.write_text(
-                "DISC INFO:\n\nName: Test\n\nQUICK SUMMARY:\n\nDisc Title: Test\nPlaylist: 00001.MPLS\n",
-                encoding="utf-8",
-            )
-            handler = MediaInfoHandler(Path("Movie.iso"), False, True, True)
+        handler = MediaInfoHandler(Path("Movie.iso"), False, True, True)
 
-            bdinfo = handler._extract_bdinfo_content([report])
+        bdinfo = handler._extract_bdinfo_text(
+            ["DISC INFO:\n\nName: Test\n\nQUICK SUMMARY:\n\nDisc Title: Test\nPlaylist: 00001.MPLS\n"]
+        )
 
         self.assertIn("QUICK SUMMARY", bdinfo)
         self.assertIn("Playlist: 00001.MPLS", bdinfo)
@@ -323,6 +320,8 @@ class BasePluginIsoWorkflowTest(unittest.TestCase):
                     resolution="1080p",
                     duration=1000,
                     tracks=[],
+                    media_input=str(mounted_stream),
+                    main_file_cache_key="identity:BDMV/STREAM/00001.m2ts",
                     media_info="media info",
                     cleanup=mock.Mock(),
                 ),
@@ -340,10 +339,123 @@ class BasePluginIsoWorkflowTest(unittest.TestCase):
             "1080p",
             1000,
             [],
+            media_input=str(mounted_stream),
+            cache_key="identity:BDMV/STREAM/00001.m2ts",
         )
         generate_nfo.assert_called_once_with(iso, "media info")
         self.assertEqual(make_torrent.call_args.args[0], iso)
 
+    def test_prepare_hashes_torrent_while_other_steps_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp) / "Movie.2024"
+            folder.mkdir()
+            main_file = folder / "movie.mkv"
+            main_file.write_bytes(b"video")
+            screenshots_started = threading.Event()
+            order = []
+
+            def hash_until_screenshots(*args, **kwargs):
+                order.append(("make_torrent", screenshots_started.wait(5)))
+
+            plugin = SimpleNamespace(
+                folder=folder,
+                announce_url="https://tracker.example/announce",
+                reuse_torrent=True,
+                from_torrent=None,
+                generate_nfo=True,
+                make_torrent=True,
+                mediainfo_handler=SimpleNamespace(
+                    find_mediainfo=mock.Mock(return_value=main_file),
+                    resolution="1080p",
+                    duration=1000,
+                    tracks=[],
+                    media_input=str(main_file),
+                    main_file_cache_key=None,
+                    media_info="media info",
+                ),
+                ptgen_handler=SimpleNamespace(fetch_ptgen_info=mock.Mock(return_value=(None, None, None))),
+                screenshot_handler=SimpleNamespace(
+                    collect_screenshots=mock.Mock(side_effect=lambda *args, **kwargs: screenshots_started.set())
+                ),
+            )
+
+            with mock.patch(
+                "differential.base_plugin.generate_nfo", side_effect=lambda *args: order.append(("nfo", None))
+            ), mock.patch("differential.base_plugin.make_torrent", side_effect=hash_until_screenshots):
+                Base._prepare(plugin)
+
+        self.assertEqual(order, [("nfo", None), ("make_torrent", True)])
+
+    def test_prepare_reports_background_torrent_failure(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            movie = Path(tmp) / "Movie.2024.mkv"
+            movie.write_bytes(b"video")
+            plugin = SimpleNamespace(
+                folder=movie,
+                announce_url="",
+                reuse_torrent=False,
+                from_torrent=None,
+                generate_nfo=False,
+                make_torrent=True,
+                mediainfo_handler=SimpleNamespace(
+                    find_mediainfo=mock.Mock(return_value=movie),
+                    resolution="1080p",
+                    duration=1000,
+                    tracks=[],
+                    media_input=str(movie),
+                    main_file_cache_key=None,
+                ),
+                ptgen_handler=SimpleNamespace(fetch_ptgen_info=mock.Mock(return_value=(None, None, None))),
+                screenshot_handler=SimpleNamespace(collect_screenshots=mock.Mock()),
+            )
+
+            with mock.patch("differential.base_plugin.make_torrent", side_effect=OSError("disk gone")):
+                with self.assertRaisesRegex(OSError, "disk gone"):
+                    Base._prepare(plugin)
+
+        plugin.screenshot_handler.collect_screenshots.assert_called_once()
+
+    def test_prepare_stops_background_torrent_on_interrupt(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            movie = Path(tmp) / "Movie.2024.mkv"
+            movie.write_bytes(b"video")
+            hashing = threading.Event()
+            stopped = []
+
+            def hash_until_stopped(*args, stop, **kwargs):
+                hashing.set()
+                stopped.append(stop.wait(5))
+
+            def interrupt(*args, **kwargs):
+                hashing.wait(5)
+                raise KeyboardInterrupt
+
+            plugin = SimpleNamespace(
+                folder=movie,
+                announce_url="",
+                reuse_torrent=False,
+                from_torrent=None,
+                generate_nfo=False,
+                make_torrent=True,
+                mediainfo_handler=SimpleNamespace(
+                    find_mediainfo=mock.Mock(return_value=movie),
+                    resolution="1080p",
+                    duration=1000,
+                    tracks=[],
+                    media_input=str(movie),
+                    main_file_cache_key=None,
+                ),
+                ptgen_handler=SimpleNamespace(fetch_ptgen_info=mock.Mock(return_value=(None, None, None))),
+                screenshot_handler=SimpleNamespace(collect_screenshots=mock.Mock(side_effect=interrupt)),
+            )
+
+            with mock.patch("differential.base_plugin.make_torrent", side_effect=hash_until_stopped) as make_torrent:
+                with self.assertRaises(KeyboardInterrupt):
+                    Base._prepare(plugin)
+                stop = make_torrent.call_args.kwargs["stop"]
+
+        self.assertTrue(stop.is_set())
+
     def test_prepare_searches_media_when_url_is_omitted(self):
         with tempfile.TemporaryDirectory() as tmp:
             folder = Path(tmp) / "[两心不疑].No.Doubt.in.Us.2026.S01.Complete"
@@ -372,6 +484,8 @@ class BasePluginIsoWorkflowTest(unittest.TestCase):
                     resolution="1080p",
                     duration=1000,
                     tracks=[],
+                    media_input=str(main_file),
+                    main_file_cache_key=None,
                 ),
                 ptgen_handler=ptgen_handler,
                 screenshot_handler=SimpleNamespace(collect_screenshots=mock.Mock()),
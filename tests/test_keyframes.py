@@ -0,0 +1,169 @@
+import os
+import sys
+import tempfile
+import unittest
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from differential.utils import keyframes
+from differential.utils.cache import CACHE_ENV_VAR
+from differential.utils.keyframes import keyframe_index, probe_keyframes, read_matroska_cues, snap_timestamps
+from differential.utils.screenshot_handler import ScreenshotHandler
+
+
+def element(element_id: int, payload: bytes, unknown_size: bool = False) -> bytes:
+    size = b"\x01\xff\xff\xff\xff\xff\xff\xff" if unknown_size else b"\x01" + len(payload).to_bytes(7, "big")
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big") + size + payload
+
+
+def uint(element_id: int, value: int) -> bytes:
+    return element(element_id, value.to_bytes(max((value.bit_length() + 7) // 8, 1), "big"))
+
+
+def cue_point(time: int, track: int) -> bytes:
+    return element(keyframes.CUE_POINT, uint(keyframes.CUE_TIME, time) + element(
+        keyframes.CUE_TRACK_POSITIONS, uint(keyframes.CUE_TRACK, track)
+    ))
+
+
+def build_mkv(path: Path, cues_after_clusters: bool = True, scale: int = 1000000) -> Path:
+    info = element(keyframes.INFO, uint(keyframes.TIMESTAMP_SCALE, scale))
+    tracks = element(
+        keyframes.TRACKS,
+        element(keyframes.TRACK_ENTRY, uint(keyframes.TRACK_NUMBER, 1) + uint(keyframes.TRACK_TYPE, 1))
+        + element(keyframes.TRACK_ENTRY, uint(keyframes.TRACK_NUMBER, 2) + uint(keyframes.TRACK_TYPE, 2)),
+    )
+    cues = element(
+        keyframes.CUES,
+        cue_point(0, 1) + cue_point(1000, 2) + cue_point(2000, 1) + cue_point(4000, 1),
+    )
+    cluster = element(keyframes.CLUSTER, b"\0" * 64)
+
+    def seek_head(cues_position: int) -> bytes:
+        seek = uint(keyframes.SEEK_ID, keyframes.CUES) + uint(keyframes.SEEK_POSITION, cues_position)
+        return element(keyframes.SEEK_HEAD, element(keyframes.SEEK, seek))
+
+    if cues_after_clusters:
+        head = len(seek_head(0)) + len(info) + len(tracks)
+        body = seek_head(head + len(cluster)) + info + tracks + cluster + cues
+    else:
+        body = info + tracks + cues + cluster
+    ebml = element(keyframes.EBML_HEADER, uint(0x4282, 0))
+    path.write_bytes(ebml + element(keyframes.SEGMENT, body, unknown_size=True))
+    return path
+
+
+class MatroskaCuesTest(unittest.TestCase):
+    def test_cues_found_through_the_seek_head(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(read_matroska_cues(build_mkv(Path(tmp) / "movie.mkv")), [0.0, 2.0, 4.0])
+
+    def test_cues_before_the_first_cluster(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = build_mkv(Path(tmp) / "movie.mkv", cues_after_clusters=False, scale=500000)
+            self.assertEqual(read_matroska_cues(path), [0.0, 1.0, 2.0])
+
+    def test_not_matroska(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "movie.mkv"
+            path.write_bytes(b"\x00\x00\x01\xba" + bytes(64))
+            with self.assertRaises(ValueError):
+                read_matroska_cues(path)
+
+
+class ProbeKeyframesTest(unittest.TestCase):
+    def test_packet_flags_relative_to_start_time(self):
+        output = (
+            "packet,600.000000,K__\n"
+            "packet,600.041708,___\n"
+            "packet,N/A,K__\n"
+            "packet,602.002000,K_\n"
+            "format,600.000000\n"
+        )
+        with mock.patch.object(keyframes, "execute", return_value=output) as execute:
+            self.assertEqual(probe_keyframes(Path("/media/movie.m2ts"), timeout=30), [0.0, 2.002])
+
+        self.assertEqual(execute.call_args.kwargs["timeout"], 30)
+        self.assertIn("packet=pts_time,flags", execute.call_args.args[1])
+        self.assertNotIn("-read_intervals", execute.call_args.args[1])
+
+    def test_windows_are_read_from_the_start_time(self):
+        output = "packet,610.010000,K__\npacket,650.000000,K__\nformat,600.000000\n"
+        with mock.patch.object(keyframes, "execute", side_effect=["600.000000\n", output]) as execute:
+            found = probe_keyframes(Path("/media/movie.m2ts"), windows=[(-5.0, 15.0), (40.0, 60.0)])
+
+        self.assertEqual(found, [10.01, 50.0])
+        self.assertIn("-read_intervals 600.000%615.000,640.000%660.000 ", execute.call_args.args[1])
+
+
+class SnapTimestampsTest(unittest.TestCase):
+    def test_nearest_unused_keyframe(self):
+        self.assertEqual(
+            snap_timestamps([1000, 2000, 3000], [0.5, 1.1, 1.2, 2.9, 3.0]),
+            [Decimal("1100"), Decimal("1200"), Decimal("3000")],
+        )
+
+    def test_targets_kept_without_keyframes(self):
+        self.assertEqual(snap_timestamps([1000, 2000], [1.0]), [Decimal("1000"), 2000])
+
+    def test_targets_kept_without_keyframes_in_reach(self):
+        self.assertEqual(snap_timestamps([1000, 60000], [1.5], max_distance_ms=10000), [Decimal("1500"), 60000])
+
+
+class KeyframeIndexTest(unittest.TestCase):
+    def test_index_is_cached_under_the_media_identity(self):
+        with tempfile.TemporaryDirectory() as cache, mock.patch.dict(os.environ, {CACHE_ENV_VAR: cache}):
+            with mock.patch.object(keyframes, "probe_keyframes", return_value=[0.0, 2.5]) as probe:
+                first = keyframe_index(Path("/media/movie.m2ts"), cache_key="identity:movie.m2ts")
+                second = keyframe_index(Path("/media/renamed.m2ts"), cache_key="identity:movie.m2ts")
+
+        probe.assert_called_once()
+        self.assertEqual(first, second)
+
+    def test_failed_probe_is_cached(self):
+        with tempfile.TemporaryDirectory() as cache, mock.patch.dict(os.environ, {CACHE_ENV_VAR: cache}):
+            with mock.patch.object(keyframes, "probe_keyframes", return_value=[]) as probe:
+                self.assertEqual(keyframe_index(Path("/media/movie.m2ts"), cache_key="identity:movie.m2ts"), [])
+                self.assertEqual(keyframe_index(Path("/media/movie.m2ts"), cache_key="identity:movie.m2ts"), [])
+
+        probe.assert_called_once()
+
+    def test_matroska_skips_ffprobe(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = build_mkv(Path(tmp) / "movie.mkv")
+            with mock.patch.object(keyframes, "probe_keyframes") as probe:
+                self.assertEqual(keyframe_index(path), [0.0, 2.0, 4.0])
+
+        probe.assert_not_called()
+
+    def test_screenshots_seek_to_keyframes(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as out:
+            handler = ScreenshotHandler(
+                folder=Path(tmp) / "KeyframeScreenshotCase",
+                screenshot_count=2,
+                optimize_screenshot=False,
+                screenshot_tonemap="never",
+            )
+
+            with mock.patch(
+                "differential.utils.screenshot_handler.keyframe_index", return_value=[0.0, 9.8, 20.5, 30.0]
+            ) as index, mock.patch("differential.utils.screenshot_handler.execute") as execute, mock.patch(
+                "differential.utils.screenshot_handler.tempfile.mkdtemp", return_value=out
+            ):
+                handler._generate_screenshots(
+                    Path(tmp) / "movie.mkv", "1920x1080", Decimal("30000"), cache_key="identity:movie.mkv"
+                )
+
+        self.assertEqual(index.call_args.args[2], "identity:movie.mkv")
+        self.assertEqual(index.call_args.kwargs["windows"], [(0.0, 20.0), (10.0, 30.0)])
+        seeks = sorted(c.args[1].split(" ")[2] for c in execute.call_args_list)
+        self.assertEqual(seeks, ["20500ms", "9800ms"])
+
+
+if __name__ == "__main__":
+    unittest.main()
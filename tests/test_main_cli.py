@@ -1,6 +1,7 @@
 import tempfile
 import unittest
 
+from differential.commands import PARSER
 from differential.main import _redact_config
 from differential.plugins.nexusphp import NexusPHP
 
@@ -40,6 +41,15 @@ class MainCliTest(unittest.TestCase):
         self.assertEqual(redacted["lsky_token"], "")
         self.assertEqual(config["ptpimg_api_key"], "secret-api-key")
 
+    def test_verify_command_parses_sample_and_all(self):
+        args = PARSER.parse_args(["verify", "a.torrent", "/media/Movie", "--sample", "2", "--all"])
+
+        self.assertEqual(args.command, "verify")
+        self.assertEqual(args.torrent, "a.torrent")
+        self.assertEqual(args.path, "/media/Movie")
+        self.assertEqual(args.sample, 2)
+        self.assertFalse(args.stop_on_first)
+
 
 if __name__ == "__main__":
     unittest.main()
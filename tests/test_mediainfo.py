@@ -0,0 +1,351 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from pymediainfo import MediaInfo
+
+from differential.utils import binary, mediainfo
+from differential.utils.cache import CACHE_ENV_VAR, BlobCache
+from differential.utils.mediainfo import (
+    TRACK_FORMAT,
+    get_duration,
+    get_full_mediainfo,
+    get_resolution,
+    get_track_attr,
+    mediainfo_differences,
+    parse_mediainfo,
+    parse_mediainfos,
+)
+from differential.utils.mediainfo_handler import MediaInfoHandler
+
+
+XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Mediainfo version="24.12"><File>'
+    '<track type="General"><Complete_name>movie.mkv</Complete_name><Format>Matroska</Format></track>'
+    '<track type="Video"><Format>AVC</Format><Width>1920</Width><Height>1080</Height></track>'
+    "</File></Mediainfo>"
+)
+
+
+class ParseMediaInfoCacheTest(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        cache_env = mock.patch.dict(os.environ, {CACHE_ENV_VAR: cache_dir.name})
+        cache_env.start()
+        self.addCleanup(cache_env.stop)
+
+    def test_second_parse_is_rehydrated_from_cache(self):
+        with mock.patch.object(MediaInfo, "parse", return_value=XML) as parse:
+            first = parse_mediainfo(Path("movie.mkv"), "identity:movie.mkv")
+            second = parse_mediainfo(Path("renamed.mkv"), "identity:movie.mkv")
+
+        parse.assert_called_once()
+        self.assertEqual(second.to_data(), first.to_data())
+        self.assertEqual(second.video_tracks[0].format, "AVC")
+
+    def test_library_version_is_part_of_the_key(self):
+        with mock.patch.object(MediaInfo, "parse", return_value=XML) as parse:
+            with mock.patch.object(mediainfo, "mediainfo_library_version", return_value=("24.12", (24, 12))):
+                parse_mediainfo(Path("movie.mkv"), "identity:movie.mkv")
+            with mock.patch.object(mediainfo, "mediainfo_library_version", return_value=("25.03", (25, 3))):
+                parse_mediainfo(Path("movie.mkv"), "identity:movie.mkv")
+
+        self.assertEqual(parse.call_count, 2)
+
+    def test_real_library_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "notes.txt"
+            path.write_text("not really media")
+            expected = MediaInfo.parse(path).to_data()
+
+            parse_mediainfo(path, "identity:notes.txt")
+            with mock.patch.object(MediaInfo, "parse", side_effect=AssertionError("parsed again")):
+                cached = parse_mediainfo(path, "identity:notes.txt")
+
+        self.assertEqual(cached.to_data(), expected)
+
+
+FULL_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Mediainfo version="24.12"><File>'
+    '<track type="General"><Unique_ID>123456789</Unique_ID><Unique_ID>123456789 (0x75BCD15)</Unique_ID>'
+    "<Complete_name>Show.S01E01.mkv</Complete_name><Format>Matroska</Format><Format_version>Version 4</Format_version>"
+    "<File_size>1073741824</File_size><File_size>1.00 GiB</File_size>"
+    "<Duration>1440000</Duration><Duration>24 min 0 s</Duration>"
+    "<Overall_bit_rate>5965232</Overall_bit_rate><Overall_bit_rate>5 965 kb/s</Overall_bit_rate>"
+    "<Writing_application>mkvmerge v80.0</Writing_application><Writing_library>libebml v1.4.4</Writing_library>"
+    "</track>"
+    '<track type="Video"><ID>1</ID><Format>HEVC</Format><Format_Info>High Efficiency Video Coding</Format_Info>'
+    "<Format_profile>Main 10@L5.1@High</Format_profile><Codec_ID>V_MPEGH/ISO/HEVC</Codec_ID>"
+    "<Width>3840</Width><Width>3 840 pixels</Width><Height>2160</Height><Height>2 160 pixels</Height>"
+    "<Display_aspect_ratio>1.778</Display_aspect_ratio><Display_aspect_ratio>16:9</Display_aspect_ratio>"
+    "<Frame_rate>23.976</Frame_rate><Frame_rate>23.976 (24000/1001) FPS</Frame_rate>"
+    "<Bit_depth>10</Bit_depth><Bit_depth>10 bits</Bit_depth>"
+    "<Bits__Pixel_Frame_>0.120</Bits__Pixel_Frame_><Default>Yes</Default><Forced>No</Forced>"
+    "<Transfer_characteristics>PQ</Transfer_characteristics></track>"
+    '<track type="Audio"><ID>2</ID><Format>E-AC-3</Format><Format_Info>Enhanced AC-3</Format_Info>'
+    "<Commercial_name>Dolby Digital Plus</Commercial_name><Channel_s_>6</Channel_s_><Channel_s_>6 channels</Channel_s_>"
+    "<Language>en</Language><Language>English</Language><Title>Main</Title></track>"
+    '<track type="Audio"><ID>3</ID><Format>AAC</Format><Channel_s_>2</Channel_s_><Language>ja</Language></track>'
+    '<track type="Text"><ID>4</ID><Format>UTF-8</Format><Codec_ID>S_TEXT/UTF8</Codec_ID>'
+    "<Codec_ID_Info>UTF-8 Plain Text</Codec_ID_Info><Count_of_elements>312</Count_of_elements></track>"
+    '<track type="Menu"><_00_00_00_000>en:Opening</_00_00_00_000><_00_01_30_000>en:Part A</_00_01_30_000>'
+    "<_00_22_30_000>en:Ending</_00_22_30_000></track>"
+    "</File></Mediainfo>"
+)
+
+
+def legacy_track_attr(track, name):
+    alternative_name = {
+        "ID": "track_id",
+        "Format/Info": "format_info",
+        "Codec ID/Info": "codec_id_info",
+        "Channel(s)": "channel_s",
+        "Bits/(Pixel*Frame)": "bits__pixel_frame",
+    }.get(name)
+    attr = None
+    if alternative_name:
+        attr = getattr(track, alternative_name)
+    if not attr:
+        attrs = getattr(track, "other_" + name.replace(" ", "_").lower())
+        if attrs and len(attrs):
+            attr = attrs[0]
+    if not attr:
+        attr = getattr(track, name.replace(" ", "_").lower())
+    return "{}: {}".format(name, attr) if attr else None
+
+
+def legacy_full_mediainfo(media_info):
+    """The getattr based renderer the compact track model replaced."""
+    text = ""
+    for track_name, names in TRACK_FORMAT.items():
+        for idx, track in enumerate(getattr(media_info, "{}_tracks".format(track_name))):
+            if len(getattr(media_info, "{}_tracks".format(track_name))) > 1:
+                text += "{} #{}\n".format(track_name.capitalize(), idx + 1)
+            else:
+                text += "{}\n".format(track_name.capitalize())
+            text += "\n".join(filter(lambda a: a is not None, [legacy_track_attr(track, name) for name in names]))
+            text += "\n\n"
+    for track in media_info.menu_tracks:
+        text += "Menu\n"
+        for name in dir(track):
+            if name[:2].isdigit():
+                text += "{} : {}\n".format(name[:-3].replace("_", ":") + "." + name[-3:], getattr(track, name))
+        text += "\n"
+    return text
+
+
+class FullMediaInfoTest(unittest.TestCase):
+    def test_output_matches_getattr_renderer(self):
+        media_info = MediaInfo(FULL_XML)
+        text = get_full_mediainfo(media_info)
+
+        self.assertEqual(text, legacy_full_mediainfo(media_info))
+        self.assertIn("Audio #2\nID: 3\n", text)
+        self.assertIn("Width: 3 840 pixels\n", text)
+        # The chapter labels keep the renderer's long-standing "00:01:30:.000" shape
+        self.assertIn("Menu\n00:00:00:.000 : en:Opening\n00:01:30:.000 : en:Part A\n", text)
+
+    def test_tracks_without_menu_or_fields(self):
+        media_info = MediaInfo(XML)
+        self.assertEqual(get_full_mediainfo(media_info), legacy_full_mediainfo(media_info))
+
+        empty = MediaInfo('<?xml version="1.0" encoding="UTF-8"?><Mediainfo><File><track type="General"></track></File></Mediainfo>')
+        self.assertEqual(get_full_mediainfo(empty), "General\n\n\n")
+
+    def test_track_attr_lookup_order(self):
+        track = MediaInfo(FULL_XML).video_tracks[0]
+
+        self.assertEqual(get_track_attr(track, "ID"), "ID: 1")
+        self.assertEqual(get_track_attr(track, "Width", attr_only=True), "3 840 pixels")
+        self.assertEqual(get_track_attr(track, "Width", attr_only=True, use_other=False), 3840)
+        self.assertIsNone(get_track_attr(track, "Encoding settings"))
+
+
+def episode(bit_depth: str = "10", duration: str = "1440000", extra_audio: bool = False) -> MediaInfo:
+    audio = '<track type="Audio"><Format>AAC</Format><Language>ja</Language></track>' if extra_audio else ""
+    return MediaInfo(
+        '<?xml version="1.0" encoding="UTF-8"?><Mediainfo><File>'
+        f'<track type="General"><Format>Matroska</Format><Duration>{duration}</Duration></track>'
+        f'<track type="Video"><Format>HEVC</Format><Bit_depth>{bit_depth}</Bit_depth></track>'
+        '<track type="Audio"><Format>FLAC</Format><Language>ja</Language></track>'
+        f"{audio}</File></Mediainfo>"
+    )
+
+
+class EpisodeMediaInfoTest(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        cache_env = mock.patch.dict(os.environ, {CACHE_ENV_VAR: cache_dir.name})
+        cache_env.start()
+        self.addCleanup(cache_env.stop)
+
+    def test_differences_ignore_per_episode_fields(self):
+        differences = mediainfo_differences(
+            {
+                "E01.mkv": episode(duration="1440000"),
+                "E02.mkv": episode(bit_depth="8", duration="1380000"),
+                "E03.mkv": episode(extra_audio=True),
+            }
+        )
+
+        self.assertEqual(
+            differences,
+            {
+                "Video #1 / Bit depth": {"10": ["E01.mkv", "E03.mkv"], "8": ["E02.mkv"]},
+                "Audio #2 / Format": {"-": ["E01.mkv", "E02.mkv"], "AAC": ["E03.mkv"]},
+                "Audio #2 / Language": {"-": ["E01.mkv", "E02.mkv"], "ja": ["E03.mkv"]},
+            },
+        )
+        self.assertEqual(mediainfo_differences({"E01.mkv": episode(), "E02.mkv": episode(duration="1")}), {})
+
+    def test_process_pool_keeps_file_order(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = []
+            for i in range(4):
+                path = Path(tmp) / f"E{i:02d}.txt"
+                path.write_text("x" * (i + 1))
+                files.append(path)
+
+            reports = parse_mediainfos(files, workers=2)
+
+        self.assertEqual([r.general_tracks[0].file_name for r in reports], ["E00", "E01", "E02", "E03"])
+
+    def test_pool_reports_are_cached_by_the_parent(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = []
+            for i in range(4):
+                path = Path(tmp) / f"E{i:02d}.txt"
+                path.write_text("x" * (i + 1))
+                files.append(path)
+
+            first = parse_mediainfos(files, workers=2)
+            with mock.patch.object(mediainfo, "_parse_xml", side_effect=AssertionError("parsed again")):
+                second = parse_mediainfos(files, workers=2)
+
+        self.assertEqual(len(BlobCache(mediainfo.MEDIAINFO_CACHE_NAME, 1).entries), 4)
+        self.assertEqual([r.to_data() for r in second], [r.to_data() for r in first])
+
+    def test_handler_probes_every_episode(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp) / "Show.S01"
+            folder.mkdir()
+            for name, size in (("E01.mkv", 3), ("E02.mkv", 5), ("E03.mkv", 4), ("notes.txt", 1)):
+                (folder / name).write_bytes(b"x" * size)
+            handler = MediaInfoHandler(folder, False, False, False, probe_episodes=True)
+
+            with mock.patch(
+                "differential.utils.mediainfo_handler.parse_mediainfo", return_value=episode()
+            ), mock.patch(
+                "differential.utils.mediainfo_handler.parse_mediainfos",
+                return_value=[episode(), episode(bit_depth="8")],
+            ) as parse_all:
+                handler.find_mediainfo()
+
+        self.assertEqual(parse_all.call_args.args[0], [folder / "E01.mkv", folder / "E03.mkv"])
+        self.assertEqual(list(handler.episode_mediainfos), [folder / "E01.mkv", folder / "E02.mkv", folder / "E03.mkv"])
+        self.assertEqual(len(handler.media_infos), 3)
+        self.assertIn("Video #1 / Bit depth:\n  10: E01.mkv, E02.mkv\n  8: E03.mkv", handler.episode_differences)
+
+    def test_movie_with_sample_and_extras_is_not_probed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp) / "Movie.2024"
+            (folder / "Extras").mkdir(parents=True)
+            for name, size in (
+                ("Movie.2024.1080p.mkv", 100),
+                ("Movie.2024.1080p.sample.mkv", 5),
+                ("Extras/Making.Of.mkv", 40),
+            ):
+                (folder / name).write_bytes(b"x" * size)
+            season = Path(tmp) / "Show.S01"
+            season.mkdir()
+            for name, size in (("Show.S01E01.mkv", 90), ("Show.S01E02.mkv", 100), ("Show.S01E01.sample.mkv", 5)):
+                (season / name).write_bytes(b"x" * size)
+
+            with mock.patch(
+                "differential.utils.mediainfo_handler.parse_mediainfo", return_value=episode()
+            ), mock.patch(
+                "differential.utils.mediainfo_handler.parse_mediainfos", return_value=[episode()]
+            ) as parse_all:
+                MediaInfoHandler(folder, False, False, False, probe_episodes=True).find_mediainfo()
+                parse_all.assert_not_called()
+
+                # Off unless asked for, e.g. for renaming
+                MediaInfoHandler(season, False, False, False).find_mediainfo()
+                parse_all.assert_not_called()
+
+                handler = MediaInfoHandler(season, False, False, False, probe_episodes=True)
+                handler.find_mediainfo()
+
+        self.assertEqual(parse_all.call_args.args[0], [season / "Show.S01E01.mkv"])
+        self.assertEqual(list(handler.episode_mediainfos), [season / "Show.S01E01.mkv", season / "Show.S01E02.mkv"])
+
+
+PROBE = {
+    "streams": [
+        {"codec_type": "audio"},
+        {"codec_type": "video", "width": 1440, "height": 1080, "sample_aspect_ratio": "4:3"},
+    ],
+    "format": {"duration": "5400.250000"},
+}
+
+
+class ResolutionTest(unittest.TestCase):
+    def setUp(self):
+        binary._ffprobe_json.cache_clear()
+        self.addCleanup(binary._ffprobe_json.cache_clear)
+
+    def media_info(self, video: str) -> MediaInfo:
+        return MediaInfo(
+            '<?xml version="1.0" encoding="UTF-8"?><Mediainfo><File>'
+            f'<track type="General"></track><track type="Video">{video}</track>'
+            "</File></Mediainfo>"
+        )
+
+    def test_resolution_and_duration_come_from_tracks(self):
+        info = self.media_info(
+            "<Width>1920</Width><Height>1080</Height><Pixel_aspect_ratio>1.000</Pixel_aspect_ratio>"
+            "<Duration>5400250</Duration>"
+        )
+        with mock.patch.object(mediainfo, "ffprobe_json", side_effect=AssertionError("ffprobe spawned")):
+            self.assertEqual(get_resolution(Path("movie.mkv"), info), "1920x1080")
+            self.assertEqual(get_duration(Path("movie.mkv"), info), 5400250)
+
+    def test_anamorphic_resolution_uses_pixel_aspect_ratio(self):
+        info = self.media_info("<Width>720</Width><Height>576</Height><Pixel_aspect_ratio>1.422</Pixel_aspect_ratio>")
+        with mock.patch.object(mediainfo, "ffprobe_json", side_effect=AssertionError("ffprobe spawned")):
+            self.assertEqual(get_resolution(Path("movie.mkv"), info), "1024x576")
+
+    def test_missing_fields_fall_back_to_one_shared_probe(self):
+        info = self.media_info("<Format>AVC</Format>")
+        with tempfile.TemporaryDirectory() as tmp:
+            movie = Path(tmp) / "movie.mkv"
+            movie.write_bytes(b"video")
+            with mock.patch.object(binary, "find_binary", return_value="ffprobe"), mock.patch.object(
+                binary.subprocess,
+                "run",
+                return_value=mock.Mock(returncode=0, stdout=json.dumps(PROBE).encode(), stderr=b""),
+            ) as run:
+                resolution = get_resolution(movie, info)
+                duration = get_duration(movie, info)
+                get_resolution(movie, info)
+
+        run.assert_called_once()
+        self.assertIn("-print_format json", run.call_args.args[0])
+        self.assertEqual(resolution, "1920x1080")
+        self.assertEqual(duration, 5400250)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,27 @@
+import io
+import re
 import sys
+import time
+import shutil
 import tempfile
+import threading
 import unittest
+import subprocess
 from decimal import Decimal
 from pathlib import Path
 from types import SimpleNamespace
 from unittest import mock
 
+from PIL import Image
+
 
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT / "src"))
 
+from differential.constants import ImageHosting
+from differential.utils.image import ImageBuffer, ImageUploaded, image_file
 from differential.utils.screenshot_handler import ScreenshotHandler
+from differential.version import version
 
 
 class ScreenshotHandlerTest(unittest.TestCase):
@@ -33,6 +44,30 @@ class ScreenshotHandlerTest(unittest.TestCase):
         self.assertNotIn('-vf "', args)
         self.assertIn("-vframes 1", args)
 
+    def test_auto_tonemap_falls_back_to_probe_without_video_track(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = ScreenshotHandler(
+                folder=Path(tmp) / "ProbeTonemapCase",
+                screenshot_count=1,
+                optimize_screenshot=False,
+            )
+
+            with mock.patch(
+                "differential.utils.screenshot_handler.probe_video_stream",
+                return_value={"codec_type": "video", "color_transfer": "arib-std-b67", "color_primaries": "bt2020"},
+            ) as probe:
+                args = handler._build_ffmpeg_args(
+                    Path(tmp) / "movie.mkv",
+                    Path(tmp) / "out.png",
+                    "1920x1080",
+                    62000,
+                    [SimpleNamespace(track_type="General")],
+                )
+
+        probe.assert_called_once()
+        self.assertIn("arib-std-b67", args)
+        self.assertIn(ScreenshotHandler.HLG_TONEMAP, args)
+
     def test_auto_tonemap_screenshot_command_uses_filter_chain_for_hdr(self):
         with tempfile.TemporaryDirectory() as tmp:
             handler = ScreenshotHandler(
@@ -194,6 +229,7 @@ class ScreenshotHandlerTest(unittest.TestCase):
                 folder=Path(tmp) / "GenerateTonemapScreenshotCase",
                 screenshot_count=1,
                 optimize_screenshot=False,
+                screenshot_keyframes=False,
             )
             tracks = [SimpleNamespace(track_type="Video", transfer_characteristics="HLG")]
 
@@ -218,5 +254,266 @@ class ScreenshotHandlerTest(unittest.TestCase):
         self.assertIn("scale=3840:2160", args)
 
 
+class ParallelScreenshotTest(unittest.TestCase):
+    def make_handler(self, tmp, **kwargs):
+        return ScreenshotHandler(folder=Path(tmp) / "ParallelScreenshotCase", screenshot_keyframes=False, **kwargs)
+
+    def fake_ffmpeg(self, delay=0.05):
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def execute(binary_name, args, timeout=None):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(delay)
+            output = Path(args.rsplit('"', 2)[1])
+            Image.new("RGB", (8, 8)).save(output, format="PNG")
+            with lock:
+                state["running"] -= 1
+            return ""
+
+        return execute, state
+
+    def test_ffmpeg_runs_are_bounded_and_names_deterministic(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as out:
+            handler = self.make_handler(tmp, screenshot_count=6, screenshot_workers=3, optimize_screenshot=False)
+            execute, state = self.fake_ffmpeg()
+
+            with mock.patch("differential.utils.screenshot_handler.execute", side_effect=execute) as run, mock.patch(
+                "differential.utils.screenshot_handler.tempfile.mkdtemp", return_value=out
+            ):
+                tmp_dir = handler._generate_screenshots(Path(tmp) / "movie.mkv", "1920x1080", Decimal("70000"))
+
+            names = sorted(p.name for p in Path(tmp_dir).glob("*.png"))
+            timestamps = sorted(int(c.args[1].split("-ss ", 1)[1].split("ms", 1)[0]) for c in run.call_args_list)
+
+        self.assertEqual(names, [f"movie.thumb_{i:02d}.png" for i in range(1, 7)])
+        self.assertEqual(timestamps, [10000, 20000, 30000, 40000, 50000, 60000])
+        self.assertEqual(state["peak"], 3)
+        self.assertTrue(all(c.kwargs["timeout"] == 300 for c in run.call_args_list))
+
+    def test_screenshots_are_optimized_off_the_ffmpeg_pool(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as out:
+            handler = self.make_handler(tmp, screenshot_count=2, screenshot_workers=1)
+            execute, _ = self.fake_ffmpeg(delay=0)
+            threads = []
+
+            def optimize(path):
+                threads.append(threading.current_thread().name)
+
+            with mock.patch("differential.utils.screenshot_handler.execute", side_effect=execute), mock.patch(
+                "differential.utils.screenshot_handler.tempfile.mkdtemp", return_value=out
+            ), mock.patch.object(handler, "_optimize_screenshot", side_effect=optimize):
+                handler._generate_screenshots(Path(tmp) / "movie.mkv", "1920x1080", Decimal("70000"))
+
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(all(name.startswith("optimize") for name in threads))
+
+    def test_optimize_replaces_screenshot_in_place(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "movie.thumb_01.png"
+            Image.new("RGB", (64, 64), "white").save(path, format="PNG", compress_level=0)
+            size = path.stat().st_size
+
+            ScreenshotHandler._optimize_screenshot(path)
+
+            self.assertLess(path.stat().st_size, size)
+            self.assertEqual([p.name for p in Path(tmp).iterdir()], [path.name])
+
+    def test_timed_out_screenshot_is_skipped(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as out:
+            handler = self.make_handler(tmp, screenshot_count=2, screenshot_timeout=5, optimize_screenshot=False)
+            execute, _ = self.fake_ffmpeg(delay=0)
+
+            def run(binary_name, args, timeout=None):
+                if "thumb_01" in args:
+                    Path(args.rsplit('"', 2)[1]).write_bytes(b"partial")
+                    raise subprocess.TimeoutExpired("ffmpeg", timeout)
+                return execute(binary_name, args, timeout)
+
+            with mock.patch("differential.utils.screenshot_handler.execute", side_effect=run), mock.patch(
+                "differential.utils.screenshot_handler.tempfile.mkdtemp", return_value=out
+            ):
+                tmp_dir = handler._generate_screenshots(Path(tmp) / "movie.mkv", "1920x1080", Decimal("70000"))
+            names = [p.name for p in Path(tmp_dir).glob("*.png")]
+
+        self.assertEqual(names, ["movie.thumb_02.png"])
+
+    def test_complete_earlier_run_is_reused(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = self.make_handler(tmp, screenshot_count=2)
+            earlier = Path(tempfile.mkdtemp(prefix=f"Differential.screenshots.{version}.", suffix=f".{handler.folder.name}"))
+            try:
+                for i in (1, 2):
+                    earlier.joinpath(f"movie.thumb_{i:02d}.png").write_bytes(b"png")
+
+                with mock.patch("differential.utils.screenshot_handler.execute") as run:
+                    tmp_dir = handler._generate_screenshots(Path(tmp) / "movie.mkv", "1920x1080", Decimal("70000"))
+            finally:
+                shutil.rmtree(earlier)
+
+        run.assert_not_called()
+        self.assertEqual(Path(tmp_dir), earlier.absolute())
+
+
+class SinglePassScreenshotTest(unittest.TestCase):
+    def test_multi_frame_command_seeks_every_input(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = ScreenshotHandler(folder=Path(tmp) / "SinglePassCase", screenshot_tonemap="never")
+            jobs = [(Path(tmp) / "a.png", 1000), (Path(tmp) / "b.png", 2000)]
+
+            args = handler._build_multi_frame_ffmpeg_args(Path(tmp) / "movie.m2ts", jobs, "1920x1080")
+
+        movie = (Path(tmp) / "movie.m2ts").absolute()
+        self.assertEqual(
+            args,
+            f'-y -ss 1000ms -skip_frame nokey -i "{movie}" -ss 2000ms -skip_frame nokey -i "{movie}" '
+            f'-filter_complex "[0:v:0]trim=end_frame=1[f0];[1:v:0]trim=end_frame=1[f1];[f0][f1]concat=n=2:v=1:a=0,'
+            f'scale=1920:1080,split=2[a0][a1];[a0]trim=start_frame=0:end_frame=1[o0];'
+            f'[a1]trim=start_frame=1:end_frame=2[o1]" '
+            f'-map "[o0]" -vsync 0 -vframes 1 -c:v png "{jobs[0][0]}" '
+            f'-map "[o1]" -vsync 0 -vframes 1 -c:v png "{jobs[1][0]}"',
+        )
+
+    def test_multi_frame_command_sets_up_one_tonemap(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = ScreenshotHandler(folder=Path(tmp) / "SinglePassCase", screenshot_tonemap="always")
+            jobs = [(Path(tmp) / f"{i}.png", i * 1000) for i in range(1, 4)]
+
+            with mock.patch.object(handler, "_tonemap_filter", return_value="tonemapx"):
+                args = handler._build_multi_frame_ffmpeg_args(Path(tmp) / "movie.m2ts", jobs, "1920x1080")
+
+        self.assertEqual(args.count("tonemapx"), 1)
+        self.assertEqual(args.count(" -i "), 3)
+
+    def test_one_ffmpeg_run_and_fallback_for_missing_frames(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as out:
+            handler = ScreenshotHandler(
+                folder=Path(tmp) / "SinglePassCase",
+                screenshot_count=3,
+                optimize_screenshot=False,
+                screenshot_single_pass=True,
+                screenshot_tonemap="never",
+                screenshot_keyframes=False,
+            )
+
+            def execute(binary_name, args, timeout=None):
+                outputs = [p for p in re.findall(r'"([^"]+\.png)"', args)]
+                # The single run misses its last frame
+                for output in outputs[:2] if len(outputs) > 1 else outputs:
+                    Path(output).write_bytes(b"png")
+                return ""
+
+            with mock.patch("differential.utils.screenshot_handler.execute", side_effect=execute) as run, mock.patch(
+                "differential.utils.screenshot_handler.tempfile.mkdtemp", return_value=out
+            ):
+                tmp_dir = handler._generate_screenshots(Path(tmp) / "movie.m2ts", "1920x1080", Decimal("4000"))
+            names = sorted(p.name for p in Path(tmp_dir).glob("*.png"))
+
+        self.assertEqual(run.call_count, 2)
+        self.assertEqual(run.call_args_list[0].args[1].count(" -i "), 3)
+        self.assertEqual(run.call_args_list[0].kwargs["timeout"], 900)
+        self.assertIn("movie.thumb_03.png", run.call_args_list[1].args[1])
+        self.assertEqual(names, ["movie.thumb_01.png", "movie.thumb_02.png", "movie.thumb_03.png"])
+
+
+def png_bytes(color=(0, 0, 0), size=(8, 8)) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, format="PNG")
+    return output.getvalue()
+
+
+class InMemoryScreenshotTest(unittest.TestCase):
+    def make_handler(self, tmp, **kwargs):
+        return ScreenshotHandler(
+            folder=Path(tmp) / "InMemoryScreenshotCase",
+            screenshot_count=3,
+            screenshot_tonemap="never",
+            screenshot_keyframes=False,
+            screenshot_in_memory=True,
+            **kwargs,
+        )
+
+    def test_pipe_command_concatenates_first_frames(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = self.make_handler(tmp)
+            args = handler._build_pipe_ffmpeg_args(Path(tmp) / "movie.mkv", [1000, 2000], "1920x1080")
+
+        movie = (Path(tmp) / "movie.mkv").absolute()
+        self.assertEqual(
+            args,
+            f'-v error -ss 1000ms -skip_frame nokey -i "{movie}" -ss 2000ms -skip_frame nokey -i "{movie}" '
+            f'-filter_complex "[0:v:0]trim=end_frame=1[f0];[1:v:0]trim=end_frame=1[f1];'
+            f'[f0][f1]concat=n=2:v=1:a=0,scale=1920:1080[out]" '
+            f'-map "[out]" -vsync 0 -f image2pipe -c:v png -',
+        )
+
+    def test_split_png_stream(self):
+        first, second = png_bytes((255, 0, 0)), png_bytes((0, 255, 0), (4, 4))
+
+        self.assertEqual(ScreenshotHandler._split_pngs(first + second), [first, second])
+        self.assertEqual(ScreenshotHandler._split_pngs(first + second[:-5]), [first])
+        self.assertEqual(ScreenshotHandler._split_pngs(b""), [])
+
+    def test_screenshots_uploaded_from_memory_and_kept_once(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as out:
+            handler = self.make_handler(tmp)
+            uploads = []
+
+            def upload(images, api_key):
+                uploads.extend(images)
+                return [image.name for image in images]
+
+            with mock.patch(
+                "differential.utils.screenshot_handler.execute_bytes", return_value=png_bytes()
+            ) as run, mock.patch("differential.utils.screenshot_handler.execute") as execute, mock.patch(
+                "differential.utils.screenshot_handler.ptpimg_upload", side_effect=upload
+            ), mock.patch("differential.utils.screenshot_handler.tempfile.mkdtemp", return_value=out), mock.patch.object(
+                ScreenshotHandler, "_optimize_screenshot"
+            ) as optimize_file:
+                handler.collect_screenshots(Path(tmp) / "movie.mkv", "1920x1080", Decimal("4000"))
+
+            kept = sorted(p.name for p in Path(out).iterdir())
+            on_disk = [(Path(out) / image.name).read_bytes() for image in uploads]
+
+        execute.assert_not_called()
+        optimize_file.assert_not_called()
+        self.assertEqual(run.call_count, 3)
+        self.assertTrue(all("image2pipe" in c.args[1] for c in run.call_args_list))
+        self.assertEqual(kept, ["movie.thumb_01.png", "movie.thumb_02.png", "movie.thumb_03.png"])
+        self.assertEqual(handler.screenshots, kept)
+        self.assertTrue(all(isinstance(image, ImageBuffer) for image in uploads))
+        self.assertEqual(on_disk, [image.data for image in uploads])
+        self.assertEqual(image_file(uploads[0])[0], "movie.thumb_01.png")
+        self.assertEqual(image_file(uploads[0])[1].read(), uploads[0].data)
+
+    def test_single_pass_falls_back_when_a_frame_is_missing(self):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as out:
+            handler = self.make_handler(tmp, screenshot_single_pass=True, optimize_screenshot=False)
+
+            def execute_bytes(binary_name, args, timeout=None):
+                return png_bytes() * min(args.count(" -i "), 2)
+
+            with mock.patch(
+                "differential.utils.screenshot_handler.execute_bytes", side_effect=execute_bytes
+            ) as run, mock.patch("differential.utils.screenshot_handler.tempfile.mkdtemp", return_value=out):
+                images = handler._pipe_screenshots(Path(tmp) / "movie.mkv", "1920x1080", Decimal("4000"))
+
+        self.assertEqual(run.call_count, 4)
+        self.assertEqual(run.call_args_list[0].kwargs["timeout"], 900)
+        self.assertEqual([image.name for image in images], [f"movie.thumb_{i:02d}.png" for i in range(1, 4)])
+
+    def test_uploaded_record_keeps_the_file_path(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            image = ImageBuffer(Path(tmp) / "movie.thumb_01.png", png_bytes())
+            ImageUploaded(hosting=ImageHosting.PTPIMG, image=image, url="https://ptpimg.me/abc.png")
+
+            cached = ImageUploaded.from_pickle(image, ImageHosting.PTPIMG)
+
+        self.assertEqual(cached.image, Path(tmp) / "movie.thumb_01.png")
+        self.assertEqual(cached.url, "https://ptpimg.me/abc.png")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,662 @@
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+import bencodepy
+from torf import Torrent
+
+from differential.utils import torrent as torrent_utils
+from differential.utils.cache import CACHE_ENV_VAR, BlobCache
+from differential.utils.io_mode import set_io_mode
+from differential.utils.media_identity import sampled_file_hash
+from differential.utils.torrent_index import TorrentIndex
+from differential.utils import piece_hasher
+from differential.utils.piece_hasher import carried_pieces, hash_files_v2, hash_pieces, sample_pieces, verify_pieces
+from differential.utils.torrent import make_torrent, remake_torrent, torrent_files, verify_torrent
+from differential.version import version
+
+
+PIECE_SIZE = 16 * 1024
+
+
+class CacheDirTestCase(unittest.TestCase):
+    """Give every test its own index and piece cache."""
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        cache_env = mock.patch.dict(os.environ, {CACHE_ENV_VAR: cache_dir.name})
+        cache_env.start()
+        self.addCleanup(cache_env.stop)
+
+
+def write_payload(root: Path) -> Path:
+    folder = root / "Some.Show.S01"
+    (folder / "Subs").mkdir(parents=True)
+    (folder / "Some.Show.S01E01.mkv").write_bytes(bytes(range(256)) * 300)
+    (folder / "Some.Show.S01E02.mkv").write_bytes(b"episode two" * 7000)
+    (folder / "Subs" / "Some.Show.S01E01.ass").write_bytes(b"subtitle" * 123)
+    return folder
+
+
+def torf_reference(path: Path, tracker: str) -> bytes:
+    t = Torrent(path=path, trackers=[tracker],
+                created_by=f"Differential {version}",
+                comment=f"Generate by Differential {version} made by XGCM")
+    t.private = True
+    t.piece_size = PIECE_SIZE
+    t.generate(threads=1)
+    return t.dump()
+
+
+class PieceHasherTest(CacheDirTestCase):
+    def test_pool_and_inline_hashes_match_torf(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            t = Torrent(path=folder)
+            t.piece_size = PIECE_SIZE
+            t.generate(threads=1)
+
+            with mock.patch("differential.utils.piece_hasher.TASK_SIZE", PIECE_SIZE * 3):
+                inline = hash_pieces(torrent_files(t), PIECE_SIZE, workers=1)
+                pooled = hash_pieces(torrent_files(t), PIECE_SIZE, workers=2)
+
+        self.assertEqual(inline, t.metainfo["info"]["pieces"])
+        self.assertEqual(pooled, t.metainfo["info"]["pieces"])
+
+    @unittest.skipUnless(hasattr(os, "posix_fadvise"), "posix_fadvise is not available")
+    def test_stream_io_mode_drops_pages_and_keeps_hashes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            t = Torrent(path=folder)
+            buffered = hash_pieces(torrent_files(t), PIECE_SIZE, workers=1)
+            identity = sampled_file_hash(folder / "Some.Show.S01E01.mkv")
+
+            set_io_mode("stream")
+            self.addCleanup(set_io_mode, "buffered")
+            with mock.patch("os.posix_fadvise", wraps=os.posix_fadvise) as fadvise:
+                streamed = hash_pieces(torrent_files(t), PIECE_SIZE, workers=1)
+                self.assertEqual(sampled_file_hash(folder / "Some.Show.S01E01.mkv"), identity)
+
+        self.assertEqual(streamed, buffered)
+        advice = [call.args[3] for call in fadvise.call_args_list]
+        self.assertIn(os.POSIX_FADV_SEQUENTIAL, advice)
+        self.assertIn(os.POSIX_FADV_DONTNEED, advice)
+
+    def test_stop_event_ends_hashing_between_tasks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            t = Torrent(path=folder)
+            t.piece_size = PIECE_SIZE
+            stop = threading.Event()
+            stop.set()
+
+            for workers in (1, 2):
+                with self.subTest(workers=workers), self.assertRaises(piece_hasher.HashingStopped):
+                    hash_pieces(torrent_files(t), PIECE_SIZE, workers=workers, stop=stop)
+
+    def test_progress_reports_all_pieces_and_speed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            t = Torrent(path=folder)
+            callback = mock.Mock()
+
+            hash_pieces(torrent_files(t), PIECE_SIZE, workers=1, callback=callback)
+
+        pieces_done, pieces_total, bytes_per_second = callback.call_args.args
+        self.assertEqual(pieces_done, pieces_total)
+        self.assertGreaterEqual(bytes_per_second, 0)
+
+
+def corrupt(path: Path, offset: int) -> None:
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+
+class VerifyTest(CacheDirTestCase):
+    def make_base(self, folder: Path) -> Path:
+        with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+            torrent_utils, "make_torrent_progress"
+        ):
+            made, = make_torrent(folder, "https://old.example/announce", "Old", reuse_torrent=False, workers=1)
+        return made
+
+    def test_verify_pieces_reports_first_or_all_mismatches(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            t = Torrent(path=folder)
+            expected = hash_pieces(torrent_files(t), PIECE_SIZE, workers=1)
+            corrupt(folder / "Some.Show.S01E01.mkv", PIECE_SIZE * 2 + 5)
+            corrupt(folder / "Some.Show.S01E02.mkv", PIECE_SIZE)
+
+            with mock.patch("differential.utils.piece_hasher.TASK_SIZE", PIECE_SIZE * 2):
+                first = verify_pieces(torrent_files(t), PIECE_SIZE, expected, workers=2)
+                every = verify_pieces(torrent_files(t), PIECE_SIZE, expected, workers=2, stop_on_first=False)
+
+        self.assertEqual(first, [2])
+        self.assertEqual(every[0], 2)
+        self.assertEqual(len(every), 2)
+
+    def test_sample_pieces_keeps_ends(self):
+        picked = sample_pieces(1000, 0.02, seed=1)
+
+        self.assertEqual(len(set(picked)), len(picked))
+        self.assertIn(0, picked)
+        self.assertIn(999, picked)
+        self.assertLessEqual(len(picked), 22)
+
+    def test_verify_torrent_accepts_intact_and_rejects_changed_data(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            base = self.make_base(folder)
+
+            self.assertTrue(verify_torrent(base, folder, workers=1))
+            self.assertTrue(verify_torrent(base, folder, workers=1, sample_ratio=0.02))
+
+            corrupt(folder / "Subs" / "Some.Show.S01E01.ass", 0)
+            self.assertFalse(verify_torrent(base, folder, workers=1))
+
+            (folder / "Subs" / "Some.Show.S01E01.ass").write_bytes(b"short")
+            self.assertFalse(verify_torrent(base, folder, workers=1))
+
+    def test_make_torrent_rehashes_when_base_fails_verification(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            base = self.make_base(folder)
+            corrupt(folder / "Some.Show.S01E01.mkv", 0)
+
+            with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+                torrent_utils, "make_torrent_progress"
+            ), mock.patch.object(torrent_utils, "hash_pieces", wraps=torrent_utils.hash_pieces) as hasher:
+                made, = make_torrent(folder, "https://new.example/announce", "New", from_torrent=base, workers=1, verify=True)
+
+            self.assertNotEqual(Torrent.read(made).hashes[0], Torrent.read(base).hashes[0])
+
+        hasher.assert_called_once()
+
+
+class MakeTorrentTest(CacheDirTestCase):
+    def test_make_torrent_is_byte_identical_to_torf(self):
+        tracker = "https://tracker.example/announce"
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            expected = torf_reference(folder, tracker)
+
+            with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE):
+                make_torrent(folder, tracker, "Site", reuse_torrent=False, workers=2)
+
+            made = (Path(tmp) / "[Site].Some.Show.S01.torrent").read_bytes()
+
+        self.assertEqual(made, expected)
+
+    def test_make_torrent_single_file(self):
+        tracker = "https://tracker.example/announce"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "Movie.2024.mkv"
+            path.write_bytes(b"movie" * 20000)
+            expected = torf_reference(path, tracker)
+
+            with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+                torrent_utils, "make_torrent_progress"
+            ):
+                make_torrent(path, tracker, reuse_torrent=False, workers=1)
+
+            made = (Path(tmp) / "Movie.2024.torrent").read_bytes()
+
+        self.assertEqual(made, expected)
+
+    def test_make_torrent_hashes_once_for_many_targets(self):
+        targets = [
+            ("SiteA", "https://a.example/announce"),
+            ("SiteB", "https://b.example/announce"),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+
+            with mock.patch.object(
+                torrent_utils, "hash_pieces", wraps=torrent_utils.hash_pieces
+            ) as hasher, mock.patch.object(torrent_utils, "make_torrent_progress"):
+                made = make_torrent(folder, "", reuse_torrent=False, workers=1, targets=targets)
+
+            torrents = [Torrent.read(p) for p in made]
+
+        hasher.assert_called_once()
+        self.assertEqual([p.name for p in made], ["[SiteA].Some.Show.S01.torrent", "[SiteB].Some.Show.S01.torrent"])
+        self.assertEqual([t.metainfo["announce"] for t in torrents], [url for _, url in targets])
+        self.assertEqual([t.source for t in torrents], ["SiteA", "SiteB"])
+        self.assertNotEqual(torrents[0].infohash, torrents[1].infohash)
+        info_a, info_b = (dict(t.metainfo["info"]) for t in torrents)
+        info_a.pop("source")
+        info_b.pop("source")
+        self.assertEqual(info_a, info_b)
+        self.assertTrue(all(t.private for t in torrents))
+
+    def test_reused_torrent_is_remade_for_every_target(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            with mock.patch.object(torrent_utils, "make_torrent_progress"):
+                make_torrent(folder, "https://old.example/announce", "Old", reuse_torrent=False, workers=1)
+
+            with mock.patch.object(torrent_utils, "hash_pieces") as hasher:
+                made = make_torrent(
+                    folder,
+                    "",
+                    targets=[("SiteA", "https://a.example/announce"), ("SiteB", "https://b.example/announce")],
+                )
+            torrents = [Torrent.read(p) for p in made]
+
+        hasher.assert_not_called()
+        self.assertEqual([t.source for t in torrents], ["SiteA", "SiteB"])
+        self.assertEqual(torrents[0].hashes, torrents[1].hashes)
+
+    def test_reuse_uses_index_without_scanning_parent(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            elsewhere = Path(tmp) / "elsewhere"
+            elsewhere.mkdir()
+            with mock.patch.object(torrent_utils, "make_torrent_progress"):
+                original, = make_torrent(folder, "https://old.example/announce", "Old", reuse_torrent=False, workers=1)
+            moved = elsewhere / original.name
+            original.rename(moved)
+            TorrentIndex().add_torrent_file(moved)
+
+            with mock.patch.object(torrent_utils, "hash_pieces") as hasher, mock.patch.object(
+                Path, "glob", side_effect=AssertionError("parent folder scanned")
+            ):
+                made, = make_torrent(folder, "https://new.example/announce", "New")
+
+            self.assertEqual(Torrent.read(made).infohash, Torrent.read(moved).infohash)
+
+        hasher.assert_not_called()
+
+    def test_reuse_ignores_same_name_torrent_with_other_layout(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            with mock.patch.object(torrent_utils, "make_torrent_progress"):
+                make_torrent(folder, "https://old.example/announce", "Old", reuse_torrent=False, workers=1)
+            (folder / "Some.Show.S01E03.mkv").write_bytes(b"episode three")
+
+            with mock.patch.object(torrent_utils, "make_torrent_progress"), mock.patch.object(
+                torrent_utils, "hash_pieces", wraps=torrent_utils.hash_pieces
+            ) as hasher:
+                made, = make_torrent(folder, "https://new.example/announce", "New", workers=1)
+            files = Torrent.read(made).files
+
+        hasher.assert_called_once()
+        self.assertEqual(len(files), 4)
+
+
+    def test_unusable_cache_dir_still_makes_and_reuses_torrents(self):
+        tracker = "https://tracker.example/announce"
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            expected = torf_reference(folder, tracker)
+            # A file where the cache folder should be: every mkdir below it fails
+            blocked = Path(tmp) / "not-a-folder"
+            blocked.write_bytes(b"")
+
+            with mock.patch.dict(os.environ, {CACHE_ENV_VAR: str(blocked / "cache")}), mock.patch.object(
+                Torrent, "calculate_piece_size", return_value=PIECE_SIZE
+            ), mock.patch.object(torrent_utils, "make_torrent_progress"):
+                made, = make_torrent(folder, tracker, "Site", reuse_torrent=False, workers=1)
+                self.assertEqual(made.read_bytes(), expected)
+
+                with mock.patch.object(torrent_utils, "hash_pieces") as hasher:
+                    remade, = make_torrent(folder, "https://new.example/announce", "New")
+
+            self.assertEqual(Torrent.read(remade).hashes, Torrent.read(made).hashes)
+
+        hasher.assert_not_called()
+
+
+class IncrementalHashTest(CacheDirTestCase):
+    tracker = "https://tracker.example/announce"
+
+    def make(self, folder: Path, reuse_torrent: bool = True):
+        with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+            torrent_utils, "make_torrent_progress"
+        ), mock.patch.object(piece_hasher, "hash_ranges", wraps=piece_hasher.hash_ranges) as ranges:
+            made, = make_torrent(folder, self.tracker, "Site", reuse_torrent=reuse_torrent, workers=1)
+        return made, ranges.call_args.args[2]
+
+    def test_changed_subtitle_only_rehashes_its_pieces(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            self.make(folder, reuse_torrent=False)
+            (folder / "Subs" / "Some.Show.S01E01.ass").write_bytes(b"fixed subtitle" * 100)
+
+            made, hashed = self.make(folder)
+            expected = torf_reference(folder, self.tracker)
+
+            self.assertEqual(made.read_bytes(), expected)
+
+        self.assertEqual(hashed, [(9, 1)])
+
+    def test_same_size_edit_rehashes_pieces_of_that_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            self.make(folder, reuse_torrent=False)
+            corrupt(folder / "Some.Show.S01E02.mkv", 100)
+            (folder / "Subs" / "Some.Show.S01E01.ass").write_bytes(b"fixed subtitle" * 100)
+
+            made, hashed = self.make(folder)
+            expected = torf_reference(folder, self.tracker)
+
+            self.assertEqual(made.read_bytes(), expected)
+
+        self.assertEqual(hashed, [(4, 6)])
+
+    def test_same_size_edit_outside_the_sample_is_rehashed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp) / "Some.Movie"
+            folder.mkdir()
+            # Files up to three samples long only have their first MiB sampled
+            movie = folder / "Some.Movie.mkv"
+            movie.write_bytes(bytes(range(256)) * 8192)
+            (folder / "Some.Movie.nfo").write_bytes(b"nfo" * 100)
+            self.make(folder, reuse_torrent=False)
+            stat = movie.stat()
+            corrupt(movie, 1536 * 1024)
+            os.utime(movie, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+            made, hashed = self.make(folder, reuse_torrent=False)
+            expected = torf_reference(folder, self.tracker)
+
+            self.assertEqual(made.read_bytes(), expected)
+
+        self.assertEqual(hashed, [(0, 128)])
+
+    def test_every_piece_carried_without_piece_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            self.make(folder, reuse_torrent=False)
+            shutil.rmtree(BlobCache(torrent_utils.PIECE_CACHE_NAME, 1).root)
+
+            # The real progress callback, which gets no pieces to report
+            with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+                piece_hasher, "hash_ranges", wraps=piece_hasher.hash_ranges
+            ) as ranges:
+                made, = make_torrent(folder, self.tracker, "Site", reuse_torrent=False, workers=1)
+            expected = torf_reference(folder, self.tracker)
+
+            self.assertEqual(made.read_bytes(), expected)
+
+        ranges.assert_not_called()
+
+    def test_carried_pieces_follow_files_shifted_by_whole_pieces(self):
+        old_files = [("b.mkv", PIECE_SIZE * 3), ("c.ass", 10)]
+        new_files = [("a.nfo", PIECE_SIZE * 2), ("b.mkv", PIECE_SIZE * 3), ("c.ass", 12)]
+        old_pieces = b"".join(bytes([i]) * 20 for i in range(4))
+
+        known = carried_pieces(old_files, old_pieces, new_files, PIECE_SIZE, {"b.mkv"})
+
+        self.assertEqual(known, {2: old_pieces[:20], 3: old_pieces[20:40], 4: old_pieces[40:60]})
+
+
+def reference_merkle(data: bytes, piece_size: int):
+    """Straight BEP 52 definition: zero leaves up to a power of two, piece layer read off the full tree."""
+    leaves = [hashlib.sha256(data[i:i + 16384]).digest() for i in range(0, len(data), 16384)]
+    width = 1
+    while width < len(leaves):
+        width *= 2
+    layer = leaves + [bytes(32)] * (width - len(leaves))
+    piece_layer = None
+    nodes_per_piece = piece_size // 16384
+    while True:
+        if nodes_per_piece == 1 and len(data) > piece_size:
+            piece_layer = b"".join(layer[:(len(data) + piece_size - 1) // piece_size])
+        if len(layer) == 1:
+            return layer[0], piece_layer or b""
+        layer = [hashlib.sha256(layer[i] + layer[i + 1]).digest() for i in range(0, len(layer), 2)]
+        nodes_per_piece //= 2
+
+
+class V2TorrentTest(CacheDirTestCase):
+    def test_merkle_roots_and_piece_layers_match_bep52(self):
+        sizes = [5 * 16384 + 7, 2 * PIECE_SIZE, 16384 * 3, 100, 0]
+        with tempfile.TemporaryDirectory() as tmp:
+            files = []
+            for i, size in enumerate(sizes):
+                path = Path(tmp) / f"{i}.bin"
+                path.write_bytes(os.urandom(size))
+                files.append((str(path), size))
+
+            with mock.patch("differential.utils.piece_hasher.TASK_SIZE", PIECE_SIZE * 2 * 2):
+                inline = hash_files_v2(files, PIECE_SIZE * 2, workers=1, v1=True)
+                pooled = hash_files_v2(files, PIECE_SIZE * 2, workers=2, v1=True)
+            data = [Path(path).read_bytes() for path, _ in files]
+
+        self.assertEqual(inline, pooled)
+        for blob, (root, layer, v1_pieces) in zip(data[:-1], inline[:-1]):
+            self.assertEqual((root, layer), reference_merkle(blob, PIECE_SIZE * 2))
+        self.assertEqual(inline[-1], (None, b"", b""))
+        padded = data[0] + bytes(-len(data[0]) % (PIECE_SIZE * 2))
+        self.assertEqual(
+            inline[0][2],
+            b"".join(hashlib.sha1(padded[i:i + PIECE_SIZE * 2]).digest() for i in range(0, len(padded), PIECE_SIZE * 2)),
+        )
+
+    def test_hybrid_torrent_has_padded_v1_layout_and_file_tree(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+                torrent_utils, "make_torrent_progress"
+            ):
+                made, = make_torrent(
+                    folder, "https://tracker.example/announce", "Site", workers=2, torrent_version="hybrid"
+                )
+            metainfo = bencodepy.decode(made.read_bytes())
+            names = ["Some.Show.S01E01.mkv", "Some.Show.S01E02.mkv", "Subs/Some.Show.S01E01.ass"]
+            data = [(folder / name).read_bytes() for name in names]
+
+        info = metainfo[b"info"]
+        self.assertEqual(info[b"meta version"], 2)
+        self.assertEqual(info[b"private"], 1)
+        self.assertEqual(
+            [(b"/".join(f[b"path"]), f[b"length"]) for f in info[b"files"]],
+            [
+                (b"Some.Show.S01E01.mkv", len(data[0])),
+                (f".pad/{-len(data[0]) % PIECE_SIZE}".encode(), -len(data[0]) % PIECE_SIZE),
+                (b"Some.Show.S01E02.mkv", len(data[1])),
+                (f".pad/{-len(data[1]) % PIECE_SIZE}".encode(), -len(data[1]) % PIECE_SIZE),
+                (b"Subs/Some.Show.S01E01.ass", len(data[2])),
+            ],
+        )
+        stream = data[0] + bytes(-len(data[0]) % PIECE_SIZE) + data[1] + bytes(-len(data[1]) % PIECE_SIZE) + data[2]
+        self.assertEqual(
+            info[b"pieces"],
+            b"".join(hashlib.sha1(stream[i:i + PIECE_SIZE]).digest() for i in range(0, len(stream), PIECE_SIZE)),
+        )
+        episode = info[b"file tree"][b"Some.Show.S01E01.mkv"][b""]
+        subtitle = info[b"file tree"][b"Subs"][b"Some.Show.S01E01.ass"][b""]
+        self.assertEqual(
+            (episode[b"pieces root"], metainfo[b"piece layers"][episode[b"pieces root"]]),
+            reference_merkle(data[0], PIECE_SIZE),
+        )
+        self.assertEqual(subtitle[b"pieces root"], reference_merkle(data[2], PIECE_SIZE)[0])
+        self.assertNotIn(subtitle[b"pieces root"], metainfo[b"piece layers"])
+
+    def test_v2_single_file_and_remake_keeps_hashes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "Movie.2024.mkv"
+            path.write_bytes(b"movie" * 20000)
+            with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+                torrent_utils, "make_torrent_progress"
+            ):
+                made, = make_torrent(path, "https://old.example/announce", workers=1, torrent_version="v2")
+            original = bencodepy.decode(made.read_bytes())
+
+            remade = bencodepy.decode(remake_torrent(path, "https://new.example/announce", made))
+
+        info = original[b"info"]
+        self.assertNotIn(b"pieces", info)
+        self.assertEqual(info[b"file tree"][b"Movie.2024.mkv"][b""][b"length"], 100000)
+        self.assertEqual(remade[b"info"], info)
+        self.assertEqual(remade[b"piece layers"], original[b"piece layers"])
+        self.assertEqual(remade[b"announce"], b"https://new.example/announce")
+
+    def test_from_torrent_of_another_version_is_not_remade(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "Movie.2024.mkv"
+            path.write_bytes(b"movie" * 20000)
+            with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+                torrent_utils, "make_torrent_progress"
+            ):
+                base, = make_torrent(path, "https://old.example/announce", "Old", reuse_torrent=False, workers=1)
+                with mock.patch.object(
+                    torrent_utils, "remake_torrent", wraps=torrent_utils.remake_torrent
+                ) as remake:
+                    made, = make_torrent(
+                        path, "https://new.example/announce", "New", from_torrent=str(base), torrent_version="hybrid"
+                    )
+                    self.assertEqual(torrent_utils.read_torrent_version(made), "hybrid")
+
+                    same, = make_torrent(path, "", "Same", from_torrent=str(made), torrent_version="hybrid")
+
+            self.assertEqual(torrent_utils.read_torrent_version(base), "v1")
+
+        remake.assert_called_once()
+        self.assertEqual(remake.call_args.args[2], str(made))
+
+    def test_v1_run_does_not_reuse_hybrid_torrent(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "Movie.2024.mkv"
+            path.write_bytes(b"movie" * 20000)
+            with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+                torrent_utils, "make_torrent_progress"
+            ):
+                hybrid, = make_torrent(path, "https://a.example/announce", "A", workers=1, torrent_version="hybrid")
+                made, = make_torrent(path, "https://b.example/announce", "B", workers=1)
+                self.assertEqual(torrent_utils.read_torrent_version(hybrid), "hybrid")
+                self.assertEqual(torrent_utils.read_torrent_version(made), "v1")
+
+                # The hybrid base given explicitly is not indexed for later v1 runs either
+                make_torrent(path, "", "C", from_torrent=str(hybrid), workers=1, torrent_version="hybrid")
+                indexed = TorrentIndex().lookup(torrent_utils.layout_key(*torrent_utils.read_torrent_layout(made)))
+
+        self.assertEqual(indexed, [made.resolve()])
+
+
+class PieceCacheTest(CacheDirTestCase):
+    def test_renamed_payload_is_made_from_cached_pieces(self):
+        tracker = "https://tracker.example/announce"
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+                torrent_utils, "make_torrent_progress"
+            ):
+                make_torrent(folder, tracker, "Site", reuse_torrent=False, workers=1)
+            renamed = folder.rename(Path(tmp) / "Some.Show.S01.REPACK")
+            expected = torf_reference(renamed, tracker)
+
+            with mock.patch.object(Torrent, "calculate_piece_size", return_value=PIECE_SIZE), mock.patch.object(
+                torrent_utils, "hash_pieces"
+            ) as hasher:
+                made, = make_torrent(renamed, tracker, "Site", reuse_torrent=False)
+
+            self.assertEqual(made.read_bytes(), expected)
+
+        hasher.assert_not_called()
+
+    def test_blob_cache_evicts_least_recently_used(self):
+        cache = BlobCache("test", 10)
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        self.assertEqual(cache.get("a"), b"aaaa")
+        cache.put("c", b"cccc")
+
+        reopened = BlobCache("test", 10)
+
+        self.assertEqual(reopened.get("a"), b"aaaa")
+        self.assertIsNone(reopened.get("b"))
+        self.assertEqual(reopened.get("c"), b"cccc")
+        self.assertFalse((reopened.root / "b.bin").exists())
+
+    def test_blob_cache_instances_keep_each_others_entries(self):
+        a = BlobCache("test", 10)
+        b = BlobCache("test", 10)
+        a.put("x", b"xxxx")
+        b.put("y", b"yyyy")
+
+        self.assertEqual(set(BlobCache("test", 10).entries), {"x", "y"})
+        self.assertEqual(b.get("x"), b"xxxx")
+
+        # b read x last, so y is the least recently used once z goes over the limit
+        a.put("z", b"zzzz")
+
+        self.assertEqual(set(BlobCache("test", 10).entries), {"x", "z"})
+        self.assertFalse((a.root / "y.bin").exists())
+
+
+class RemakeTorrentTest(CacheDirTestCase):
+    def test_remake_preserves_infohash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = write_payload(Path(tmp))
+            with mock.patch.object(torrent_utils, "make_torrent_progress"):
+                original, = make_torrent(folder, "https://old.example/announce", "Old", reuse_torrent=False, workers=1)
+
+            remade = remake_torrent(folder, "https://new.example/announce", original)
+            before = Torrent.read(original)
+            after = Torrent.read_stream(remade)
+
+        self.assertEqual(after.infohash, before.infohash)
+        self.assertEqual(after.metainfo["announce"], "https://new.example/announce")
+
+    def test_remake_drops_foreign_info_keys_like_a_full_decode(self):
+        old = {
+            b"announce": b"https://old.example/announce",
+            b"info": {
+                b"name": b"Movie",
+                b"piece length": PIECE_SIZE,
+                b"pieces": b"\x01" * 40,
+                b"length": PIECE_SIZE + 1,
+                b"source": b"OLD",
+                b"x_cross_seed": b"abc",
+            },
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            old_torrent = Path(tmp) / "old.torrent"
+            old_torrent.write_bytes(bencodepy.encode(old))
+
+            remade = remake_torrent(Path(tmp) / "Movie", "https://new.example/announce", old_torrent, "NEW")
+
+        expected_info = {k: v for k, v in old[b"info"].items() if k not in (b"source", b"x_cross_seed")}
+        expected_info.update({b"private": 1, b"source": b"NEW"})
+        self.assertEqual(
+            remade,
+            bencodepy.encode(
+                {
+                    b"announce": b"https://new.example/announce",
+                    b"created by": f"Differential {version}".encode(),
+                    b"comment": f"Generate by Differential {version} made by XGCM".encode(),
+                    b"info": expected_info,
+                }
+            ),
+        )
+
+    def test_remake_rejects_broken_torrent(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            broken = Path(tmp) / "broken.torrent"
+            broken.write_bytes(b"d4:infod4:name")
+            empty = Path(tmp) / "empty.torrent"
+            empty.touch()
+
+            self.assertIsNone(remake_torrent(Path(tmp) / "Movie", "", broken))
+            self.assertIsNone(remake_torrent(Path(tmp) / "Movie", "", empty))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from torf import Torrent
+
+from differential.utils import torrent_index
+from differential.utils.torrent_index import TorrentIndex, layout_key, read_torrent_layout, torrent_layout
+
+
+def write_torrent(root: Path) -> Path:
+    folder = root / "Movie.2024"
+    folder.mkdir()
+    (folder / "Movie.2024.mkv").write_bytes(b"movie" * 5000)
+    (folder / "Movie.2024.nfo").write_bytes(b"nfo")
+    t = Torrent(path=folder, private=True)
+    t.generate(threads=1)
+    torrent_file = root / "Movie.2024.torrent"
+    t.write(torrent_file)
+    return torrent_file
+
+
+class TorrentIndexTest(unittest.TestCase):
+    def test_layout_from_file_matches_layout_from_torf(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            torrent_file = write_torrent(Path(tmp))
+
+            from_file = read_torrent_layout(torrent_file)
+            from_torf = torrent_layout(Torrent(path=Path(tmp) / "Movie.2024"))
+
+        self.assertEqual(from_file, from_torf)
+        self.assertEqual(from_file[0], "Movie.2024")
+
+    def test_layout_key_depends_on_sizes(self):
+        self.assertNotEqual(
+            layout_key("Movie", [("Movie/a.mkv", 10)]),
+            layout_key("Movie", [("Movie/a.mkv", 11)]),
+        )
+
+    def test_index_persists_and_drops_missing_torrents(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            torrent_file = write_torrent(Path(tmp))
+            index_path = Path(tmp) / "cache" / "torrents.json"
+
+            key = TorrentIndex(index_path).add_torrent_file(torrent_file)
+            self.assertEqual(TorrentIndex(index_path).lookup(key), [torrent_file.resolve()])
+
+            torrent_file.unlink()
+            self.assertEqual(TorrentIndex(index_path).lookup(key), [])
+            self.assertNotIn(key, TorrentIndex(index_path).entries)
+
+    def test_unreadable_torrent_is_not_indexed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            broken = Path(tmp) / "broken.torrent"
+            broken.write_bytes(b"not bencode")
+            index = TorrentIndex(Path(tmp) / "torrents.json")
+
+            self.assertIsNone(index.add_torrent_file(broken))
+            self.assertEqual(index.entries, {})
+
+    def test_instances_keep_each_others_entries_and_snapshots(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index_path = Path(tmp) / "torrents.json"
+            a, b = TorrentIndex(index_path), TorrentIndex(index_path)
+            (Path(tmp) / "a.torrent").write_bytes(b"")
+            (Path(tmp) / "b.torrent").write_bytes(b"")
+
+            a.add("key", Path(tmp) / "a.torrent")
+            b.add("key", Path(tmp) / "b.torrent")
+            a.set_snapshot(Path(tmp) / "A", Path(tmp) / "a.torrent", b"a", {"a.mkv": (1, "x")})
+            b.set_snapshot(Path(tmp) / "B", Path(tmp) / "b.torrent", b"b", {"b.mkv": (1, "y")})
+            merged = TorrentIndex(index_path)
+
+            self.assertEqual(
+                merged.lookup("key"), [(Path(tmp) / "b.torrent").resolve(), (Path(tmp) / "a.torrent").resolve()]
+            )
+            self.assertIsNotNone(merged.snapshot(Path(tmp) / "A"))
+            self.assertIsNotNone(merged.snapshot(Path(tmp) / "B"))
+
+    def test_snapshots_are_capped_oldest_first(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index = TorrentIndex(Path(tmp) / "torrents.json")
+            with mock.patch.object(torrent_index, "MAX_SNAPSHOTS", 2):
+                for name in "ABC":
+                    index.set_snapshot(Path(tmp) / name, Path(tmp) / "t.torrent", b"", {})
+
+            roots = {Path(root).name for root in TorrentIndex(Path(tmp) / "torrents.json").snapshots}
+
+        self.assertEqual(roots, {"B", "C"})
+
+
+if __name__ == "__main__":
+    unittest.main()
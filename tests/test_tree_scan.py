@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from differential.utils.media_identity import bdmv_identity
+from differential.utils.tree_scan import scan_tree
+
+
+def write(path: Path, data: bytes) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+class TreeScanTest(unittest.TestCase):
+    def test_snapshot_records_sizes_markers_and_media_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp) / "Show.S01"
+            write(root / "Show.S01E02.mkv", b"b" * 30)
+            big = write(root / "Show.S01E01.MKV", b"a" * 50)
+            write(root / "Subs" / "Show.S01E01.ass", b"sub")
+            write(root / "Extras" / "VIDEO_TS" / "VTS_01_1.VOB", b"v" * 10)
+            write(root / "Show.S01.nfo", b"nfo")
+
+            snapshot = scan_tree(root)
+
+        self.assertEqual(snapshot.biggest_file, big)
+        self.assertTrue(snapshot.has_video_ts)
+        self.assertFalse(snapshot.has_bdmv)
+        self.assertEqual(
+            [path.name for path in snapshot.media_files],
+            ["Show.S01E01.MKV", "Show.S01E02.mkv"],
+        )
+        self.assertEqual({f.relative: f.size for f in snapshot.files}["Subs/Show.S01E01.ass"], 3)
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "symlinks are not available")
+    def test_symlinked_folders_are_followed_without_looping(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = Path(tmp) / "store" / "Season 1"
+            big = write(store / "Show.S01E01.mkv", b"a" * 50)
+            root = Path(tmp) / "Show.S01"
+            write(root / "Show.S01.nfo", b"nfo")
+            try:
+                (root / "Season 1").symlink_to(store, target_is_directory=True)
+                (root / "Season 1" / "back").symlink_to(root, target_is_directory=True)
+            except OSError as e:
+                self.skipTest(f"cannot create symlinks: {e}")
+
+            snapshot = scan_tree(root)
+
+        self.assertEqual(snapshot.biggest_file, root / "Season 1" / big.name)
+        self.assertEqual([path.name for path in snapshot.media_files], ["Show.S01E01.mkv"])
+        self.assertEqual(sorted(f.relative for f in snapshot.files), ["Season 1/Show.S01E01.mkv", "Show.S01.nfo"])
+
+    def test_bdmv_identity_reuses_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            disc = Path(tmp) / "Disc"
+            write(disc / "BDMV" / "index.bdmv", b"index")
+            write(disc / "BDMV" / "STREAM" / "00001.m2ts", b"stream data")
+            write(disc / "CERTIFICATE" / "id.bdmv", b"cert")
+            write(disc / "Disc.nfo", b"not part of the disc")
+
+            snapshot = scan_tree(disc)
+            expected = bdmv_identity(disc)
+            with mock.patch("os.scandir", side_effect=AssertionError("walked again")):
+                identity = bdmv_identity(disc, snapshot)
+
+        self.assertTrue(snapshot.has_bdmv)
+        self.assertEqual(identity, expected)
+        self.assertEqual(
+            [f.relative for f in snapshot.files_under("BDMV", "CERTIFICATE")],
+            ["BDMV/index.bdmv", "BDMV/STREAM/00001.m2ts", "CERTIFICATE/id.bdmv"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()